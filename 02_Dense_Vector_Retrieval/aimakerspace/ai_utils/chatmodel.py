@@ -1,24 +1,28 @@
 import anthropic
+import asyncio
 import os
+from typing import AsyncIterator, Optional
 
 
 class ChatAnthropic:
-    def __init__(self, model_name: str = "claude-sonnet-4-5-20250929"):
+    def __init__(self, model_name: str = "claude-sonnet-4-5-20250929", base_url: Optional[str] = None):
+        """
+        :param model_name: Anthropic model to call
+        :param base_url: API endpoint; defaults to ANTHROPIC_BASE_URL. Point it at a
+            local server (e.g. ``FakeAnthropicServer``) to test without the real API
+        """
         self.model_name = model_name
-        self.base_url = os.getenv("ANTHROPIC_BASE_URL")
+        self.base_url = base_url or os.getenv("ANTHROPIC_BASE_URL")
         self.auth_token = os.getenv("ANTHROPIC_AUTH_TOKEN")
         if self.auth_token is None:
             raise ValueError("ANTHROPIC_AUTH_TOKEN is not set")
+        self._async_client: Optional[anthropic.AsyncAnthropic] = None
+        self._async_client_loop = None
 
-    def run(self, messages, text_only: bool = True, **kwargs):
+    def _request_kwargs(self, messages, **kwargs) -> dict:
         if not isinstance(messages, list):
             raise ValueError("messages must be a list")
 
-        client = anthropic.Anthropic(
-            base_url=self.base_url,
-            api_key=self.auth_token,
-        )
-
         # Extract system message if present
         system_content = None
         chat_messages = []
@@ -36,10 +40,55 @@ class ChatAnthropic:
         }
         if system_content:
             request_kwargs["system"] = system_content
+        return request_kwargs
+
+    def run(self, messages, text_only: bool = True, **kwargs):
+        request_kwargs = self._request_kwargs(messages, **kwargs)
 
+        client = anthropic.Anthropic(
+            base_url=self.base_url,
+            api_key=self.auth_token,
+        )
         response = client.messages.create(**request_kwargs)
 
         if text_only:
             return response.content[0].text
 
         return response
+
+    def _loop_client(self) -> anthropic.AsyncAnthropic:
+        # The async client's connection pool belongs to one event loop; notebooks call asyncio.run
+        # repeatedly. Within a loop it is re-used, so later calls skip the connection setup.
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._async_client = anthropic.AsyncAnthropic(base_url=self.base_url, api_key=self.auth_token)
+            self._async_client_loop = loop
+        return self._async_client
+
+    async def astream(self, messages, **kwargs) -> AsyncIterator[str]:
+        """Yield the response text in pieces as the model generates it."""
+        request_kwargs = self._request_kwargs(messages, **kwargs)
+        async with self._loop_client().messages.stream(**request_kwargs) as stream:
+            async for text in stream.text_stream:
+                yield text
+
+    async def arun(self, messages, **kwargs) -> str:
+        return "".join([text async for text in self.astream(messages, **kwargs)])
+
+
+if __name__ == "__main__":
+    import time
+    from aimakerspace.ai_utils.fake_llm_server import FakeAnthropicServer
+
+    async def main(chat: ChatAnthropic) -> None:
+        start = time.perf_counter()
+        first_token = None
+        async for text in chat.astream([{"role": "user", "content": "Hello"}]):
+            first_token = first_token or time.perf_counter()
+            print(text, end="", flush=True)
+        end = time.perf_counter()
+        print(f"\nTTFT {(first_token - start) * 1000:.0f} ms, total {(end - start) * 1000:.0f} ms")
+
+    with FakeAnthropicServer("Streaming works token by token.", first_token_delay=0.2, token_delay=0.05) as server:
+        os.environ.setdefault("ANTHROPIC_AUTH_TOKEN", "fake")
+        asyncio.run(main(ChatAnthropic(base_url=server.base_url)))
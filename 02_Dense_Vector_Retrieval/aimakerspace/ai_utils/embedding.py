@@ -1,36 +1,277 @@
-from typing import List
+from typing import Dict, List, Optional
 import asyncio
+import math
+import os
+import platform
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
 from sentence_transformers import SentenceTransformer
+from aimakerspace.ai_utils.embedding_cache import EmbeddingCache
+
+BACKENDS = ("torch", "onnx-int8")
+DEFAULT_ONNX_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "aimakerspace", "onnx")
+
+
+def default_quantization() -> str:
+    """The ``export_dynamic_quantized_onnx_model`` config that matches this CPU's instruction set."""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            flags = cpuinfo.read()
+    except OSError:
+        return "avx2"
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags:
+        return "avx512"
+    return "avx2"
+
+
+def export_onnx_int8(model_name: str, cache_dir: Optional[str] = None, quantization: Optional[str] = None):
+    """Export ``model_name`` to ONNX with dynamic int8 weights, once, and return (model dir, ONNX file name).
+
+    Later calls with the same model and quantization config reuse the exported
+    directory. The export is written to a temporary directory and renamed into
+    place, so an interrupted run never leaves a partial model behind.
+    Needs ``sentence-transformers[onnx]``.
+
+    :param model_name: SentenceTransformer model to export
+    :param cache_dir: Where exported models are kept; defaults to ``~/.cache/aimakerspace/onnx``
+    :param quantization: "arm64", "avx2", "avx512" or "avx512_vnni"; defaults to the host CPU's best
+    """
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    quantization = quantization or default_quantization()
+    cache_dir = cache_dir or DEFAULT_ONNX_CACHE_DIR
+    model_dir = os.path.join(cache_dir, f"{model_name.replace('/', '__')}-qint8-{quantization}")
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    if os.path.exists(os.path.join(model_dir, file_name)):
+        return model_dir, file_name
+
+    os.makedirs(cache_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(dir=cache_dir, prefix=".export-")
+    try:
+        # Loading with the ONNX backend exports the float32 graph; quantizing writes the int8 file beside it.
+        model = SentenceTransformer(model_name, backend="onnx", device="cpu")
+        model.save_pretrained(staging_dir)
+        export_dynamic_quantized_onnx_model(model, quantization, staging_dir)
+        try:
+            os.replace(staging_dir, model_dir)
+        except OSError:
+            if not os.path.exists(os.path.join(model_dir, file_name)):  # lost a race only if the winner finished
+                raise
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return model_dir, file_name
 
 
 class EmbeddingModel:
-    def __init__(self, embeddings_model_name: str = "all-MiniLM-L6-v2", batch_size: int = 1024):
-        self.model = SentenceTransformer(embeddings_model_name)
+    def __init__(
+        self,
+        embeddings_model_name: str = "all-MiniLM-L6-v2",
+        batch_size: int = 1024,
+        bucket_size: int = 64,
+        cache: Optional[EmbeddingCache] = None,
+        n_processes: int = 0,
+        min_pool_texts: int = 256,
+        backend: str = "torch",
+        onnx_cache_dir: Optional[str] = None,
+        quantization: Optional[str] = None,
+    ):
+        """
+        :param embeddings_model_name: SentenceTransformer model to load
+        :param batch_size: Texts per ``encode`` call
+        :param bucket_size: Texts per forward pass within a batch. Inputs are sorted by
+            length first, so each forward pass is padded only to texts of similar length
+        :param cache: Optional ``EmbeddingCache``; only misses are encoded
+        :param n_processes: Encode with this many worker processes when the model runs
+            on CPU (0 or 1 encodes in-process). The pool is started on first use;
+            call ``close`` to stop it
+        :param min_pool_texts: Smaller inputs are encoded in-process, where the pool's
+            start-up and pickling overhead would outweigh the extra cores
+        :param backend: "torch" runs the model in full precision; "onnx-int8" runs a
+            dynamically quantized ONNX export on onnxruntime (CPU only, exported once
+            by ``export_onnx_int8``)
+        :param onnx_cache_dir: Where "onnx-int8" keeps exported models
+        :param quantization: Instruction set "onnx-int8" quantizes for; defaults to the host CPU's
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        if bucket_size < 1:
+            raise ValueError("bucket_size must be positive")
+        if n_processes < 0:
+            raise ValueError("n_processes must be non-negative")
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}")
+        self.backend = backend
         self.embeddings_model_name = embeddings_model_name
+        # int8 vectors drift slightly from float32 ones, so they must not share cache entries.
+        self._cache_namespace = embeddings_model_name
+        if backend == "onnx-int8":
+            quantization = quantization or default_quantization()
+            model_dir, file_name = export_onnx_int8(embeddings_model_name, onnx_cache_dir, quantization)
+            self.model = SentenceTransformer(
+                model_dir, backend="onnx", device="cpu", model_kwargs={"file_name": file_name}
+            )
+            self._cache_namespace = f"{embeddings_model_name}:qint8-{quantization}"
+        else:
+            self.model = SentenceTransformer(embeddings_model_name)
         self.batch_size = batch_size
+        self.bucket_size = bucket_size
+        self.cache = cache
+        self.n_processes = n_processes
+        self.min_pool_texts = min_pool_texts
+        self._pool = None
+        # encode_multi_process shares one input and one output queue, so only one call may use the pool at a time.
+        self._pool_lock = threading.Lock()
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
 
-    async def async_get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
+    async def async_get_embeddings(self, list_of_text: List[str]) -> np.ndarray:
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(None, self.get_embeddings, list_of_text)
 
-    async def async_get_embedding(self, text: str) -> List[float]:
+    async def async_get_embedding(self, text: str) -> np.ndarray:
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(None, self.get_embedding, text)
 
-    def get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
-        embeddings = self.model.encode(list_of_text, batch_size=self.batch_size)
-        return embeddings.tolist()
+    def _use_pool(self, n_texts: int) -> bool:
+        # onnxruntime already spreads a single call over all cores.
+        return (
+            self.backend == "torch"
+            and self.n_processes > 1
+            and n_texts >= self.min_pool_texts
+            and getattr(self.model.device, "type", "cpu") == "cpu"
+        )
+
+    def _encode_with_pool(self, sorted_texts: List[str]) -> np.ndarray:
+        # Contiguous chunks of the length-sorted input keep similar lengths together in each worker;
+        # a few chunks per worker balance the long head against the short tail.
+        chunk_size = max(self.bucket_size, math.ceil(len(sorted_texts) / (self.n_processes * 4)))
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.n_processes)
+            return self.model.encode_multi_process(
+                sorted_texts, self._pool, batch_size=self.bucket_size, chunk_size=chunk_size
+            )
+
+    def _encode(self, list_of_text: List[str]) -> np.ndarray:
+        """Encode in length-sorted batches and return float32 rows in input order."""
+        embeddings = np.empty((len(list_of_text), self.dimension), dtype=np.float32)
+        if not list_of_text:
+            return embeddings
+        order = np.argsort([-len(text) for text in list_of_text], kind="stable")
+        sorted_texts = [list_of_text[i] for i in order]
+        if self._use_pool(len(sorted_texts)):
+            embeddings[order] = self._encode_with_pool(sorted_texts)
+            return embeddings
+        for start in range(0, len(sorted_texts), self.batch_size):
+            batch = sorted_texts[start : start + self.batch_size]
+            embeddings[order[start : start + len(batch)]] = self.model.encode(
+                batch, batch_size=self.bucket_size, convert_to_numpy=True
+            )
+        return embeddings
 
-    def get_embedding(self, text: str) -> List[float]:
-        embedding = self.model.encode(text)
-        return embedding.tolist()
+    def get_embeddings(self, list_of_text: List[str]) -> np.ndarray:
+        """(N, dim) float32 embeddings, one row per input text."""
+        if self.cache is None:
+            return self._encode(list_of_text)
+        embeddings = self.cache.get_or_compute(self._cache_namespace, list_of_text, self._encode)
+        if not embeddings:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return np.stack(embeddings).astype(np.float32, copy=False)
+
+    def get_embedding(self, text: str) -> np.ndarray:
+        return self.get_embeddings([text])[0]
+
+    def close(self) -> None:
+        """Stop the encode pool, if one was started."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self.model.stop_multi_process_pool(self._pool)
+                self._pool = None
+
+
+def compare_backends(
+    texts: List[str],
+    model_name: str = "all-MiniLM-L6-v2",
+    reference: Optional[EmbeddingModel] = None,
+    candidate: Optional[EmbeddingModel] = None,
+) -> Dict[str, float]:
+    """Cosine drift of the "onnx-int8" backend against "torch", and CPU throughput of each.
+
+    :param texts: Texts to embed with both backends
+    :param model_name: Model to compare when ``reference``/``candidate`` are not given
+    :param reference: Full-precision model; defaults to a "torch" ``EmbeddingModel``
+    :param candidate: Model checked against it; defaults to an "onnx-int8" ``EmbeddingModel``
+    """
+    reference = reference or EmbeddingModel(model_name)
+    candidate = candidate or EmbeddingModel(model_name, backend="onnx-int8")
+    # Warm both up so one-off costs (lazy kernels, thread pools) stay out of the timings.
+    reference.get_embeddings(texts[:8])
+    candidate.get_embeddings(texts[:8])
+
+    start = time.perf_counter()
+    expected = reference.get_embeddings(texts)
+    reference_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = candidate.get_embeddings(texts)
+    candidate_seconds = time.perf_counter() - start
+
+    expected = expected / np.linalg.norm(expected, axis=1, keepdims=True)
+    actual = actual / np.linalg.norm(actual, axis=1, keepdims=True)
+    cosines = np.einsum("ij,ij->i", expected, actual)
+    return {
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "reference_texts_per_second": len(texts) / reference_seconds,
+        "candidate_texts_per_second": len(texts) / candidate_seconds,
+        "speedup": reference_seconds / candidate_seconds,
+    }
 
 
 if __name__ == "__main__":
     embedding_model = EmbeddingModel()
-    print(asyncio.run(embedding_model.async_get_embedding("Hello, world!")))
+    print(asyncio.run(embedding_model.async_get_embedding("Hello, world!"))[:8])
+    print(asyncio.run(embedding_model.async_get_embeddings(["Hello, world!", "Goodbye, world!"])).shape)
+
+    # Mixed-length input, as produced by chunking real documents.
+    rng = np.random.default_rng(0)
+    words = "the quick brown fox jumps over a lazy dog while rain falls on distant hills".split()
+    texts = [" ".join(rng.choice(words, size=int(rng.integers(3, 200)))) for _ in range(2000)]
+
+    start = time.perf_counter()
+    unsorted = embedding_model.model.encode(texts, batch_size=1024, convert_to_numpy=True)
+    print(f"single encode, batch 1024: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    bucketed = embedding_model.get_embeddings(texts)
+    print(f"length-bucketed, batch {embedding_model.batch_size} in buckets of {embedding_model.bucket_size}: {time.perf_counter() - start:.2f}s")
+    print(f"max abs difference: {np.abs(bucketed - unsorted).max():.2e}")
+
+    pooled_model = EmbeddingModel(n_processes=4)
+    try:
+        pooled_model.get_embeddings(texts[:pooled_model.min_pool_texts])  # start the pool outside the timing
+        start = time.perf_counter()
+        pooled = pooled_model.get_embeddings(texts)
+        print(f"{pooled_model.n_processes} processes: {time.perf_counter() - start:.2f}s")
+        print(f"max abs difference: {np.abs(pooled - unsorted).max():.2e}")
+    finally:
+        pooled_model.close()
+
+    # Parity and throughput of the int8 ONNX backend; exports the model on the first run.
+    min_cosine = 0.98
+    report = compare_backends(texts, reference=embedding_model)
     print(
-        asyncio.run(
-            embedding_model.async_get_embeddings(["Hello, world!", "Goodbye, world!"])
-        )
+        f"onnx-int8 vs torch: min cosine {report['min_cosine']:.4f}, mean {report['mean_cosine']:.4f}, "
+        f"{report['candidate_texts_per_second']:.0f} vs {report['reference_texts_per_second']:.0f} texts/s "
+        f"({report['speedup']:.2f}x)"
     )
+    if report["min_cosine"] < min_cosine:
+        raise SystemExit(f"onnx-int8 drifted below cosine {min_cosine} of the torch embeddings")
@@ -0,0 +1,134 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+
+class FakeAnthropicServer:
+    """Local stand-in for the Anthropic Messages API, for testing without network access.
+
+    ``POST /v1/messages`` answers with ``response_text``: as one JSON message,
+    or, when the request sets ``stream``, as server-sent events in the API's
+    streaming format with one text delta per word. ``first_token_delay`` and
+    ``token_delay`` simulate model latency, so streaming and time-to-first-token
+    measurements can be checked. Received request bodies are kept in ``requests``.
+
+    Use as a context manager and pass ``base_url`` to ``ChatAnthropic``.
+    """
+
+    def __init__(
+        self,
+        response_text: str = "This is a fake response.",
+        first_token_delay: float = 0.0,
+        token_delay: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        :param response_text: Text every request is answered with
+        :param first_token_delay: Seconds before the first text delta (or the whole reply)
+        :param token_delay: Seconds between text deltas
+        :param host: Interface to listen on
+        :param port: Port to listen on; 0 picks a free one
+        """
+        self.response_text = response_text
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.requests: List[dict] = []
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def tokens(self) -> List[str]:
+        return re.findall(r"\S+\s*", self.response_text) or [""]
+
+    def _message(self, model: str, text: str, output_tokens: int) -> dict:
+        return {
+            "id": "msg_fake",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "text", "text": text}] if text is not None else [],
+            "stop_reason": "end_turn" if text is not None else None,
+            "stop_sequence": None,
+            "usage": {"input_tokens": 0, "output_tokens": output_tokens},
+        }
+
+    def _events(self, model: str):
+        tokens = self.tokens()
+        yield "message_start", {"type": "message_start", "message": self._message(model, None, 0)}
+        yield "content_block_start", {
+            "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}
+        }
+        time.sleep(self.first_token_delay)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.token_delay)
+            yield "content_block_delta", {
+                "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}
+            }
+        yield "content_block_stop", {"type": "content_block_stop", "index": 0}
+        yield "message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": len(tokens)},
+        }
+        yield "message_stop", {"type": "message_stop"}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                server.requests.append(body)
+                if not self.path.rstrip("/").endswith("/v1/messages"):
+                    self.send_error(404)
+                    return
+                model = body.get("model", "fake")
+                if not body.get("stream"):
+                    time.sleep(server.first_token_delay)
+                    payload = json.dumps(server._message(model, server.response_text, len(server.tokens()))).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for event, data in server._events(model):
+                    self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+                    self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+    def start(self) -> "FakeAnthropicServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeAnthropicServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
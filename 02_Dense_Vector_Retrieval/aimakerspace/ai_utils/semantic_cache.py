@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Sequence
+
+import numpy as np
+
+
+class SemanticCache:
+    """Cache of pipeline results keyed by query meaning rather than exact wording.
+
+    A lookup first tries the exact query text, which needs no embedding, and
+    then compares the query embedding with every cached query in one
+    matrix-vector product; the most similar entry at or above ``threshold``
+    is a hit. Entries are only matched under the same ``params`` (e.g. k and
+    response style) and are all dropped when the ``version`` of the data they
+    were computed from changes. The least recently used entry is evicted when
+    the cache is full, and entries older than ``ttl_seconds`` expire.
+
+    Lookups and insertions are serialised by a lock, so the cache may be
+    shared by threads (e.g. pipeline steps run in an executor).
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 256, ttl_seconds: Optional[float] = 3600.0):
+        """
+        :param threshold: Cosine similarity at or above which two queries share a result
+        :param max_entries: Entries kept before the least recently used is evicted
+        :param ttl_seconds: Age after which an entry expires, or None to keep entries until evicted
+        """
+        if not -1 <= threshold <= 1:
+            raise ValueError("threshold must be in [-1, 1]")
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._version: Hashable = None
+        self._vectors: Optional[np.ndarray] = None  # unit query vectors, one row per slot
+        self._expires = np.full(max_entries, np.inf)
+        self._used = np.zeros(max_entries, dtype=bool)
+        self._param_codes: Dict[Hashable, int] = {}
+        self._param_ids = np.full(max_entries, -1, dtype=np.int64)
+        self._params: list = [None] * max_entries
+        self._values: list = [None] * max_entries
+        self._queries: list = [None] * max_entries
+        self._slot_by_query: Dict[tuple, int] = {}
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    @property
+    def hits(self) -> int:
+        return self.exact_hits + self.semantic_hits
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss and eviction counters and the current entry count."""
+        with self._lock:
+            return self._stats()
+
+    def _stats(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "entries": len(self._lru),
+        }
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        for slot in list(self._lru):
+            self._free(slot)
+
+    def _free(self, slot: int) -> None:
+        self._slot_by_query.pop((self._queries[slot], self._params[slot]), None)
+        self._used[slot] = False
+        self._param_ids[slot] = -1
+        self._values[slot] = self._queries[slot] = self._params[slot] = None
+        self._lru.pop(slot, None)
+
+    def _check_version(self, version: Hashable) -> None:
+        if version != self._version:
+            if self._lru:
+                self.invalidations += 1
+                self._clear()
+            self._param_codes.clear()
+            self._version = version
+
+    def _expire(self, now: float) -> None:
+        expired = np.flatnonzero(self._used & (self._expires <= now))
+        for slot in expired.tolist():
+            self._free(slot)
+        self.expirations += len(expired)
+
+    def get(
+        self,
+        query: str,
+        query_vector: Optional[Sequence[float]] = None,
+        version: Hashable = None,
+        params: Hashable = None,
+    ) -> Optional[Any]:
+        """Cached value for ``query``, or None.
+
+        Without ``query_vector`` only the exact query text is looked up and a
+        miss is not counted, so callers can try the free exact match before
+        paying for an embedding and then call again with the vector.
+        """
+        with self._lock:
+            return self._get(query, query_vector, version, params)
+
+    def _get(self, query: str, query_vector, version: Hashable, params: Hashable) -> Optional[Any]:
+        self._check_version(version)
+        if self.ttl_seconds is not None:
+            self._expire(time.monotonic())
+        slot = self._slot_by_query.get((query, params))
+        if slot is not None:
+            self.exact_hits += 1
+        elif query_vector is None:
+            return None
+        elif params in self._param_codes:
+            similarities = self._vectors @ self._unit(query_vector)
+            similarities[self._param_ids != self._param_codes[params]] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                slot = best
+                self.semantic_hits += 1
+        if slot is None:
+            self.misses += 1
+            return None
+        self._lru.move_to_end(slot)
+        return self._values[slot]
+
+    def put(
+        self,
+        query: str,
+        query_vector: Sequence[float],
+        value: Any,
+        version: Hashable = None,
+        params: Hashable = None,
+    ) -> None:
+        """Cache ``value`` for ``query`` computed from data at ``version``."""
+        with self._lock:
+            self._put(query, query_vector, value, version, params)
+
+    def _put(self, query: str, query_vector, value: Any, version: Hashable, params: Hashable) -> None:
+        self._check_version(version)
+        vector = self._unit(query_vector)
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            self._clear()
+            self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        slot = self._slot_by_query.get((query, params))
+        if slot is None:
+            if len(self._lru) >= self.max_entries:
+                self._free(next(iter(self._lru)))
+                self.evictions += 1
+            slot = int(np.argmin(self._used))
+        self._vectors[slot] = vector
+        self._expires[slot] = np.inf if self.ttl_seconds is None else time.monotonic() + self.ttl_seconds
+        self._used[slot] = True
+        self._param_ids[slot] = self._param_codes.setdefault(params, len(self._param_codes))
+        self._values[slot], self._queries[slot], self._params[slot] = value, query, params
+        self._slot_by_query[(query, params)] = slot
+        self._lru[slot] = None
+        self._lru.move_to_end(slot)
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
@@ -0,0 +1,258 @@
+import copy
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def spherical_kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    n_iter: int = 20,
+    seed: int = 0,
+    block_size: int = 8192,
+) -> np.ndarray:
+    """Cluster unit-length rows by cosine similarity.
+
+    :param vectors: (N, dim) float32 matrix of L2-normalised rows
+    :param n_clusters: Number of centroids to learn
+    :param n_iter: Lloyd iterations
+    :param seed: Seed for the initial centroid sample
+    :param block_size: Rows assigned per matmul, bounding peak memory
+    :return: (n_clusters, dim) matrix of unit-length centroids
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        labels = assign_to_centroids(vectors, centroids, block_size)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=n_clusters)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        non_empty = counts > 0
+        sums = np.add.reduceat(vectors[order], starts[non_empty], axis=0)
+        # Empty clusters are re-seeded from random rows so no centroid is wasted.
+        empty = np.flatnonzero(~non_empty)
+        new_centroids = np.empty_like(centroids)
+        new_centroids[non_empty] = sums
+        new_centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)] if len(empty) else 0
+        norms = np.linalg.norm(new_centroids, axis=1, keepdims=True)
+        new_centroids /= np.where(norms > 0, norms, 1.0)
+        if np.allclose(new_centroids, centroids, atol=1e-6):
+            centroids = new_centroids
+            break
+        centroids = new_centroids
+    return centroids.astype(np.float32)
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 8192) -> np.ndarray:
+    """Index of the most similar centroid for each row, computed in blocks."""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start : start + block_size], dtype=np.float32)
+        labels[start : start + block_size] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+class IVFIndex:
+    """Inverted-file index with a spherical k-means coarse quantizer.
+
+    Rows are bucketed by their nearest centroid; a query scans only the
+    ``nprobe`` closest buckets. The index is trained once enough rows exist
+    and re-trained when the store grows by ``retrain_growth``; until then
+    ``candidates`` returns None and callers fall back to exact search.
+    Inserted rows are assigned incrementally without retraining.
+
+    Rows are only appended, in increasing order, so copies share the bucket
+    lists and assignments: a copy keeps its row count and ignores rows
+    added past it.
+    """
+
+    def __init__(
+        self,
+        n_lists: Optional[int] = None,
+        nprobe: int = 8,
+        min_train_size: int = 1024,
+        retrain_growth: float = 4.0,
+        n_iter: int = 20,
+        seed: int = 0,
+    ):
+        """
+        :param n_lists: Number of buckets; defaults to sqrt(N) at training time
+        :param nprobe: Buckets scanned per query, the recall/speed knob
+        :param min_train_size: Rows required before the index is trained
+        :param retrain_growth: Retrain once the store is this many times larger than at the last training
+        :param n_iter: k-means iterations per training run
+        :param seed: Seed for k-means initialisation
+        """
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_growth = retrain_growth
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._assignments = np.empty(0, dtype=np.int64)  # row -> bucket, -1 when unassigned
+        self._lists: List[List[int]] = []
+        self._list_arrays: Dict[int, np.ndarray] = {}
+        self._trained_size = 0
+        self._size = 0  # rows assigned so far
+
+    def copy(self) -> "IVFIndex":
+        """Copy that shares bucket lists and assignments with this index; O(n_lists), not O(rows)."""
+        clone = copy.copy(self)
+        clone._list_arrays = dict(self._list_arrays)
+        return clone
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, matrix: np.ndarray) -> None:
+        """Learn centroids from ``matrix`` and assign every row to a bucket."""
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(matrix))))
+        # Training on a sample keeps k-means cost bounded for large stores.
+        sample_size = min(len(matrix), 256 * n_lists)
+        rng = np.random.default_rng(self.seed)
+        sample = matrix if sample_size == len(matrix) else matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))]
+        self.centroids = spherical_kmeans(np.asarray(sample, dtype=np.float32), n_lists, self.n_iter, self.seed)
+        self.set_assignments(assign_to_centroids(matrix, self.centroids))
+        self._trained_size = len(matrix)
+
+    def restore(self, centroids: np.ndarray, assignments: np.ndarray) -> None:
+        """Restore a previously trained index, e.g. when loading a saved store."""
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.set_assignments(assignments)
+        self._trained_size = len(assignments)
+
+    def set_assignments(self, assignments: np.ndarray) -> None:
+        """Rebuild the inverted lists from a row -> bucket array."""
+        self._assignments = np.asarray(assignments, dtype=np.int64).copy()
+        order = np.argsort(self._assignments, kind="stable")
+        counts = np.bincount(self._assignments, minlength=len(self.centroids))
+        self._lists = [chunk.tolist() for chunk in np.split(order, np.cumsum(counts)[:-1])]
+        self._list_arrays = {}
+        self._size = len(self._assignments)
+
+    @property
+    def assignments(self) -> np.ndarray:
+        return self._assignments[: self._size]
+
+    def needs_training(self, size: int) -> bool:
+        """Whether a store of ``size`` rows should (re-)train the index before adding."""
+        if not self.is_trained:
+            return size >= self.min_train_size
+        return size >= self.retrain_growth * self._trained_size
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray, size: int) -> None:
+        """Assign new ``rows``, which must continue the existing row numbering, with unit ``vectors``."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) and rows.min() < self._size:
+            raise ValueError(f"Row {int(rows.min())} is already assigned")
+        if len(self._assignments) < size:
+            # Grown geometrically; rows past _size are unassigned (-1).
+            grown = np.full(max(size, 2 * len(self._assignments)), -1, dtype=np.int64)
+            grown[: self._size] = self._assignments[: self._size]
+            self._assignments = grown
+        labels = assign_to_centroids(vectors, self.centroids)
+        self._assignments[rows] = labels
+        for row, label in zip(rows.tolist(), labels.tolist()):
+            self._lists[label].append(row)
+            self._list_arrays.pop(label, None)
+        self._size = max(self._size, size)
+
+    def _bucket(self, label: int) -> np.ndarray:
+        array = self._list_arrays.get(label)
+        if array is None:
+            rows = self._lists[label]
+            array = np.asarray(rows[: bisect_left(rows, self._size)], dtype=np.int64)
+            self._list_arrays[label] = array
+        return array
+
+    def expected_candidates(self, nprobe: Optional[int] = None) -> float:
+        """Rows a single query scans at ``nprobe``, assuming buckets of average size."""
+        if not self.is_trained:
+            return float(self._size)
+        return min(nprobe or self.nprobe, len(self.centroids)) * self._size / len(self.centroids)
+
+    def candidates(self, queries: np.ndarray, nprobe: Optional[int] = None) -> Optional[np.ndarray]:
+        """Sorted row ids in the buckets closest to any of ``queries``.
+
+        :param queries: (Q, dim) query matrix; rows need not be normalised
+        :param nprobe: Override the index's ``nprobe`` for this call
+        :return: Candidate rows, or None when the index is not trained yet
+        """
+        if not self.is_trained:
+            return None
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        centroid_scores = queries @ self.centroids.T
+        if nprobe < len(self.centroids):
+            probed = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probed = np.broadcast_to(np.arange(len(self.centroids)), centroid_scores.shape)
+        labels = np.unique(probed)
+        buckets = [self._bucket(label) for label in labels.tolist()]
+        if not buckets:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(buckets))
+
+
+def benchmark_recall(
+    vector_db,
+    query_vectors: np.ndarray,
+    k: int = 10,
+    nprobes: Sequence[int] = (1, 2, 4, 8, 16, 32),
+    distance_metric=None,
+) -> List[dict]:
+    """Measure recall@k and latency of an IVF-backed store against exact search.
+
+    :param vector_db: A ``VectorDatabase`` built with ``index="ivf"``
+    :param query_vectors: (Q, dim) query matrix
+    :param k: Results per query
+    :param nprobes: ``nprobe`` settings to sweep
+    :param distance_metric: Metric passed to ``search``; defaults to the store's default
+    :return: One dict per setting with ``nprobe``, ``recall_at_k``, ``ms_per_query``
+        and ``candidates_scanned``; the exact baseline has ``nprobe=None``
+    """
+    kwargs = {} if distance_metric is None else {"distance_metric": distance_metric}
+    queries = [np.asarray(query) for query in query_vectors]
+
+    start = time.perf_counter()
+    exact = [{hit[0] for hit in vector_db.search(query, k, exact=True, **kwargs)} for query in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+    report = [{"nprobe": None, "recall_at_k": 1.0, "ms_per_query": exact_ms, "candidates_scanned": len(vector_db)}]
+
+    index = vector_db.ann_index
+    original_nprobe = index.nprobe
+    try:
+        for nprobe in nprobes:
+            index.nprobe = nprobe
+            start = time.perf_counter()
+            approximate = [{hit[0] for hit in vector_db.search(query, k, **kwargs)} for query in queries]
+            elapsed_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+            scanned = np.mean([len(index.candidates(query[None, :])) for query in queries]) if index.is_trained else len(vector_db)
+            recall = np.mean([len(a & e) / max(len(e), 1) for a, e in zip(approximate, exact)])
+            report.append(
+                {"nprobe": nprobe, "recall_at_k": float(recall), "ms_per_query": elapsed_ms, "candidates_scanned": float(scanned)}
+            )
+    finally:
+        index.nprobe = original_nprobe
+    return report
+
+
+if __name__ == "__main__":
+    from aimakerspace.vectordatabase import VectorDatabase, cosine_similarity
+
+    rng = np.random.default_rng(0)
+    dim, n_vectors, n_topics = 384, 50_000, 200
+    topics = rng.normal(size=(n_topics, dim))
+    data = topics[rng.integers(n_topics, size=n_vectors)] + 0.6 * rng.normal(size=(n_vectors, dim))
+    queries = topics[rng.integers(n_topics, size=200)] + 0.6 * rng.normal(size=(200, dim))
+
+    vector_db = VectorDatabase(index="ivf")
+    vector_db.insert_many([f"doc-{i}" for i in range(n_vectors)], data)
+    for row in benchmark_recall(vector_db, queries, k=10, distance_metric=cosine_similarity):
+        print(row)
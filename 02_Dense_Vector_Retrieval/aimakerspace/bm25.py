@@ -0,0 +1,182 @@
+import copy
+import re
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[&.][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or s t that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens without common stopwords.
+
+    Internal ``&`` and ``.`` are kept, so "S&P" and "U.S." survive as single
+    terms; apostrophes split, so "LENDX's" also matches a query for "LENDX".
+    """
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over row ids.
+
+    Each term keeps a posting list of (row, term frequency) pairs, appended
+    in row order. A query scores only the rows in the posting lists of its
+    terms: each list is turned into arrays once and scattered into a dense
+    score vector with numpy, so there is no Python loop over documents.
+
+    The vocabulary and posting lists are only appended to, so copies share
+    them: a copy keeps its row count and ignores postings past it.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        :param k1: Term-frequency saturation; higher lets repeated terms count for more
+        :param b: Document-length normalisation, from 0 (none) to 1 (full)
+        """
+        self.k1 = k1
+        self.b = b
+        self._vocabulary: Dict[str, int] = {}
+        self._rows: List[List[int]] = []
+        self._frequencies: List[List[int]] = []
+        self._arrays: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self._lengths = np.empty(0, dtype=np.float32)
+        self._total_length = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._vocabulary)
+
+    def copy(self) -> "BM25Index":
+        """Copy that shares the vocabulary and posting lists with this index; O(1) in the index size."""
+        clone = copy.copy(self)
+        clone._arrays = {}
+        return clone
+
+    def add_many(self, rows: Sequence[int], texts: Sequence[str]) -> None:
+        """Index ``texts`` under new rows, which must continue the existing row numbering."""
+        if not len(rows):
+            return
+        self._arrays.clear()
+        needed = max(rows) + 1
+        if needed > self._lengths.shape[0]:
+            lengths = np.zeros(max(needed, 2 * self._lengths.shape[0], 16), dtype=np.float32)
+            lengths[: self._size] = self._lengths[: self._size]
+            self._lengths = lengths
+        for row, text in zip(rows, texts):
+            if row < self._size:
+                raise ValueError(f"Row {row} is already indexed")
+            tokens = tokenize(text)
+            self._lengths[row] = len(tokens)
+            self._total_length += len(tokens)
+            for term, frequency in Counter(tokens).items():
+                term_id = self._vocabulary.get(term)
+                if term_id is None:
+                    # The lists exist before the term does, for copies reading concurrently.
+                    self._rows.append([])
+                    self._frequencies.append([])
+                    term_id = self._vocabulary[term] = len(self._rows) - 1
+                self._rows[term_id].append(row)
+                self._frequencies[term_id].append(frequency)
+            self._size = row + 1
+
+    def compact(self, kept: np.ndarray) -> None:
+        """Keep only the sorted rows ``kept``, renumbering them 0..len(kept)-1."""
+        new_row = np.full(self._size, -1, dtype=np.int64)
+        new_row[kept] = np.arange(len(kept))
+        vocabulary, rows, frequencies = {}, [], []
+        for term, term_id in list(self._vocabulary.items()):
+            term_rows, term_frequencies = self._postings(term_id)
+            renumbered = new_row[term_rows]
+            mask = renumbered >= 0
+            if not mask.any():
+                continue
+            vocabulary[term] = len(rows)
+            rows.append(renumbered[mask].tolist())
+            frequencies.append(term_frequencies[mask].astype(np.int64).tolist())
+        self._vocabulary, self._rows, self._frequencies = vocabulary, rows, frequencies
+        self._arrays = {}
+        self._lengths = self._lengths[: self._size][kept].copy()
+        self._total_length = int(self._lengths.sum())
+        self._size = len(kept)
+
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._arrays.get(term_id)
+        if arrays is None:
+            term_rows = self._rows[term_id]
+            end = bisect_left(term_rows, self._size)  # postings a later copy appended are not ours
+            arrays = (
+                np.asarray(term_rows[:end], dtype=np.int64),
+                np.asarray(self._frequencies[term_id][:end], dtype=np.float32),
+            )
+            self._arrays[term_id] = arrays
+        return arrays
+
+    def scores(
+        self, query: str, rows: Optional[np.ndarray] = None, deleted: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """BM25 score of ``query`` for ``rows`` (or every row when None); 0 where no term matches.
+
+        :param deleted: Boolean mask of rows the caller has deleted. They score 0
+            and are left out of the document count, document frequencies and
+            average length, so tombstones awaiting compaction do not skew IDF
+        """
+        scores = np.zeros(self._size, dtype=np.float32)
+        n_documents, total_length = self._size, self._total_length
+        if deleted is not None:
+            deleted = deleted[: self._size]
+            n_documents -= int(np.count_nonzero(deleted))
+            total_length -= float(self._lengths[: self._size][deleted].sum())
+        if n_documents:
+            average_length = max(total_length / n_documents, 1.0)
+            for term in dict.fromkeys(tokenize(query)):
+                term_id = self._vocabulary.get(term)
+                if term_id is None:
+                    continue
+                term_rows, frequencies = self._postings(term_id)
+                if deleted is not None:
+                    live = ~deleted[term_rows]
+                    term_rows, frequencies = term_rows[live], frequencies[live]
+                document_frequency = len(term_rows)
+                idf = np.log1p((n_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[term_rows] / average_length)
+                # Rows are unique within a posting list, so plain fancy-index addition is safe.
+                scores[term_rows] += idf * frequencies * (self.k1 + 1) / (frequencies + norm)
+        return scores if rows is None else scores[rows]
+
+    def to_arrays(self) -> Tuple[List[str], Dict[str, np.ndarray]]:
+        """Terms plus CSR-style arrays (``indptr``, ``rows``, ``frequencies``, ``lengths``) for saving."""
+        vocabulary = sorted(list(self._vocabulary.items()), key=lambda item: item[1])
+        postings = [self._postings(term_id) for _, term_id in vocabulary]
+        terms = [term for (term, _), (term_rows, _) in zip(vocabulary, postings) if len(term_rows)]
+        postings = [(term_rows, frequencies) for term_rows, frequencies in postings if len(term_rows)]
+        arrays = {
+            "indptr": np.concatenate(([0], np.cumsum([len(term_rows) for term_rows, _ in postings]))).astype(np.int64),
+            "rows": np.concatenate([term_rows for term_rows, _ in postings] or [np.empty(0, np.int64)]),
+            "frequencies": np.concatenate(
+                [frequencies for _, frequencies in postings] or [np.empty(0, np.float32)]
+            ).astype(np.int32),
+            "lengths": self._lengths[: self._size].copy(),
+        }
+        return terms, arrays
+
+    @classmethod
+    def from_arrays(cls, terms: List[str], arrays: Dict[str, np.ndarray], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """Rebuild an index saved with ``to_arrays``."""
+        index = cls(k1=k1, b=b)
+        indptr, rows, frequencies = arrays["indptr"], arrays["rows"], arrays["frequencies"]
+        index._vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+        index._rows = [rows[indptr[i] : indptr[i + 1]].tolist() for i in range(len(terms))]
+        index._frequencies = [frequencies[indptr[i] : indptr[i + 1]].tolist() for i in range(len(terms))]
+        index._lengths = np.asarray(arrays["lengths"], dtype=np.float32).copy()
+        index._total_length = int(index._lengths.sum())
+        index._size = len(index._lengths)
+        return index
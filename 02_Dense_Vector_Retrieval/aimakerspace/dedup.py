@@ -0,0 +1,171 @@
+import re
+import zlib
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+_PRIME = np.uint64(4294967311)  # smallest prime above 2^32
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WHITESPACE = re.compile(r"\s+")
+
+
+class MinHashDeduplicator:
+    """Near-duplicate detection over chunk text with MinHash and LSH banding.
+
+    Each text is reduced to ``num_perm`` MinHash values over its character
+    shingles; the fraction of equal values estimates the Jaccard similarity
+    of the shingle sets. Signatures are split into bands and bucketed, so a
+    new text is only compared with texts sharing at least one band, and is
+    a duplicate when the estimated similarity reaches ``threshold``.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, shingle_size: int = 5, seed: int = 0):
+        """
+        :param threshold: Estimated Jaccard similarity at or above which texts are duplicates
+        :param num_perm: Hash functions per signature; more is more accurate and slower
+        :param shingle_size: Characters per shingle, after lower-casing and collapsing whitespace
+        :param seed: Seed for the hash permutations
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MAX_HASH, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MAX_HASH, size=num_perm, dtype=np.uint64)
+        self.n_bands, self.rows_per_band = self._choose_bands(threshold, num_perm)
+        self._signatures: Dict[Hashable, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, List[Hashable]]] = [{} for _ in range(self.n_bands)]
+
+    @staticmethod
+    def _choose_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+        """Band layout whose LSH S-curve, (1/b)^(1/r), sits just below ``threshold``."""
+        best = (num_perm, 1)
+        for rows in range(1, num_perm + 1):
+            bands = num_perm // rows
+            if (1.0 / bands) ** (1.0 / rows) > threshold * 0.9:
+                break
+            best = (bands, rows)
+        return best
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        text = _WHITESPACE.sub(" ", text.lower()).strip()
+        if len(text) <= self.shingle_size:
+            shingles = {text}
+        else:
+            shingles = {text[i : i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+        return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of ``text`` as ``num_perm`` uint64 values."""
+        hashes = self._shingle_hashes(text)
+        # Universal hashing (a * h + b) mod p. With a, b and h below 2^32 the sum fits in
+        # uint64, and p just above 2^32 makes every permutation wrap rather than preserve order.
+        permuted = (np.outer(hashes, self._a) + self._b) % _PRIME
+        return permuted.min(axis=0)
+
+    def similarity(self, signature_a: np.ndarray, signature_b: np.ndarray) -> float:
+        return float(np.mean(signature_a == signature_b))
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        rows = self.rows_per_band
+        return [signature[band * rows : (band + 1) * rows].tobytes() for band in range(self.n_bands)]
+
+    def find_duplicate(self, text: str, signature: Optional[np.ndarray] = None) -> Optional[Hashable]:
+        """Key of the most similar indexed text at or above ``threshold``, or None."""
+        signature = self.signature(text) if signature is None else signature
+        candidates = set()
+        for band, band_key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(band_key, ()))
+        best_key, best_similarity = None, self.threshold
+        for key in candidates:
+            similarity = self.similarity(signature, self._signatures[key])
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        return best_key
+
+    def add(self, key: Hashable, text: str) -> Optional[Hashable]:
+        """Index ``text`` under ``key`` unless it duplicates an indexed text.
+
+        :return: The key of the existing near-duplicate (``text`` is then not
+            indexed), or None when ``text`` was added
+        """
+        if key in self._signatures:
+            return None
+        signature = self.signature(text)
+        duplicate = self.find_duplicate(text, signature)
+        if duplicate is not None:
+            return duplicate
+        self._signatures[key] = signature
+        for band, band_key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(band_key, []).append(key)
+        return None
+
+    def remove(self, key: Hashable) -> None:
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band, band_key in enumerate(self._band_keys(signature)):
+            bucket = self._buckets[band].get(band_key)
+            if bucket is not None and key in bucket:
+                bucket.remove(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._signatures
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def deduplicate(
+        self, chunks: List[str], metadata_list: List[dict] = None
+    ) -> Tuple[List[str], List[dict], Dict[int, Hashable]]:
+        """Drop chunks that near-duplicate an earlier chunk or anything already indexed.
+
+        The source of a chunk dropped in favour of an earlier chunk of the same
+        call is appended to the survivor's ``duplicate_sources`` metadata, so
+        no provenance is lost. Survivors indexed by earlier calls are only
+        reported; their metadata lives with the caller.
+
+        :return: (kept chunks, their metadata, {position of each dropped chunk: survivor key})
+        """
+        if metadata_list is None:
+            metadata_list = [{} for _ in chunks]
+        kept_chunks, kept_metadata = [], []
+        position_of: Dict[Hashable, int] = {}
+        dropped: Dict[int, Hashable] = {}
+        for i, (chunk, metadata) in enumerate(zip(chunks, metadata_list)):
+            duplicate = chunk if chunk in position_of else self.add(chunk, chunk)
+            if duplicate is None:
+                position_of[chunk] = len(kept_chunks)
+                kept_chunks.append(chunk)
+                kept_metadata.append(dict(metadata))
+                continue
+            dropped[i] = duplicate
+            if duplicate in position_of:
+                add_duplicate_source(kept_metadata[position_of[duplicate]], metadata.get("source"))
+        return kept_chunks, kept_metadata, dropped
+
+
+def add_duplicate_source(metadata: dict, source: Optional[str]) -> bool:
+    """Record ``source`` as another origin of the chunk described by ``metadata``; True if it was new."""
+    if source is None or source == metadata.get("source"):
+        return False
+    duplicate_sources = metadata.setdefault("duplicate_sources", [])
+    if source in duplicate_sources:
+        return False
+    duplicate_sources.append(source)
+    return True
+
+
+def remove_duplicate_source(metadata: dict, source: str) -> bool:
+    """Undo ``add_duplicate_source``; True if ``source`` was recorded."""
+    duplicate_sources = metadata.get("duplicate_sources", [])
+    if source not in duplicate_sources:
+        return False
+    duplicate_sources.remove(source)
+    if not duplicate_sources:
+        del metadata["duplicate_sources"]
+    return True
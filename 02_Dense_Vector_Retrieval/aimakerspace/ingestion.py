@@ -0,0 +1,319 @@
+import hashlib
+import json
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aimakerspace.dedup import MinHashDeduplicator, add_duplicate_source, remove_duplicate_source
+from aimakerspace.text_utils import BoilerplateFilter, CharacterTextSplitter, PDFFileLoader
+from aimakerspace.vectordatabase import VectorDatabase
+
+
+def _sha256_file(file_path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(text: str) -> str:
+    """Content hash identifying a chunk independently of the document it came from."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DocumentManifest:
+    """Record of the documents a vector store was built from.
+
+    Each entry maps a source name to the file's content hash, mtime, size
+    and the ids of the chunks it produced. ``settings`` holds the splitter
+    configuration; if it changes every document is treated as changed.
+    The manifest is saved as ``manifest.json`` next to the store files.
+    """
+
+    FILENAME = "manifest.json"
+
+    def __init__(self, documents: Optional[Dict[str, dict]] = None, settings: Optional[dict] = None):
+        self.documents: Dict[str, dict] = documents or {}
+        self.settings: dict = settings or {}
+
+    @classmethod
+    def load(cls, path: str) -> "DocumentManifest":
+        """Load the manifest saved in store directory ``path``, or an empty one if there is none."""
+        manifest_path = os.path.join(path, cls.FILENAME)
+        if not os.path.exists(manifest_path):
+            return cls()
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("documents"), data.get("settings"))
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, self.FILENAME), "w", encoding="utf-8") as f:
+            json.dump({"settings": self.settings, "documents": self.documents}, f, ensure_ascii=False, indent=1)
+
+    def referenced_chunks(self) -> set:
+        return {chunk for record in self.documents.values() for chunk in record["chunks"]}
+
+
+class IncrementalIngestor:
+    """Keep a ``VectorDatabase`` in sync with a directory of PDFs.
+
+    Each run compares the directory against the manifest: unchanged files
+    (same size and mtime, or same content hash) are skipped, new and changed
+    files are parsed, split and embedded, and the chunks of removed files are
+    deleted. Chunks are keyed by content, so unchanged chunks inside an
+    edited file are reused instead of re-embedded, and a chunk is only
+    deleted once no remaining document references it.
+
+    A chunk shared by several documents keeps the first document as its
+    ``source`` and lists the others in ``duplicate_sources``. With a
+    ``deduplicator`` the same applies to near-duplicates: a new chunk that
+    near-duplicates a stored or earlier chunk is not embedded and the
+    document references the surviving chunk instead.
+    """
+
+    def __init__(
+        self,
+        vector_db: VectorDatabase,
+        splitter: CharacterTextSplitter,
+        manifest: Optional[DocumentManifest] = None,
+        preprocess: Optional[Callable[[str], str]] = None,
+        max_workers: int = 1,
+        deduplicator: Optional[MinHashDeduplicator] = None,
+        page_filter: Optional[BoilerplateFilter] = None,
+    ):
+        """
+        :param vector_db: Store to update in place
+        :param splitter: Splitter applied to each document's text
+        :param manifest: State from a previous run; defaults to an empty manifest
+        :param preprocess: Optional text clean-up applied before splitting. It is not
+            part of the change fingerprint, so clear the manifest after changing it.
+            Page numbers in chunk metadata assume it only trims the end of the text
+        :param max_workers: Processes used by ``PDFFileLoader`` for text extraction
+        :param deduplicator: Optional near-duplicate filter applied to new chunks
+        :param page_filter: Optional boilerplate filter applied to each document's pages
+            before ``preprocess`` and splitting
+        """
+        self.vector_db = vector_db
+        self.splitter = splitter
+        self.manifest = manifest or DocumentManifest()
+        self.preprocess = preprocess
+        self.max_workers = max_workers
+        self.deduplicator = deduplicator
+        self.page_filter = page_filter
+        self._deduplicator_primed = False
+
+    @classmethod
+    def from_store(
+        cls, path: str, splitter: CharacterTextSplitter, store_options: Optional[dict] = None, **kwargs
+    ) -> "IncrementalIngestor":
+        """Open the store and manifest saved at ``path``, or start empty ones if it does not exist.
+
+        :param store_options: ``VectorDatabase`` arguments for a new store. A saved
+            store keeps its own settings, except that ``bm25=True`` adds a missing BM25 index
+        """
+        store_options = store_options or {}
+        if os.path.isdir(path) and os.path.exists(os.path.join(path, "store.json")):
+            vector_db = VectorDatabase.load(path)
+            if store_options.get("bm25"):
+                vector_db.enable_bm25()
+            return cls(vector_db, splitter, DocumentManifest.load(path), **kwargs)
+        return cls(VectorDatabase(**store_options), splitter, DocumentManifest(), **kwargs)
+
+    def save(self, path: str) -> None:
+        """Persist the store and its manifest together in directory ``path``."""
+        self.vector_db.save(path)
+        self.manifest.save(path)
+
+    def _splitter_settings(self) -> dict:
+        settings = {
+            "chunk_size": self.splitter.chunk_size,
+            "chunk_overlap": self.splitter.chunk_overlap,
+            "split_mode": self.splitter.split_mode,
+        }
+        if self.splitter.split_mode == "recursive":
+            tokenizer = self.splitter.tokenizer
+            settings["tokenizer"] = tokenizer if isinstance(tokenizer, str) else getattr(tokenizer, "name_or_path", "")
+        if self.deduplicator is not None:
+            settings["dedup_threshold"] = self.deduplicator.threshold
+        if self.page_filter is not None:
+            settings["page_filter"] = self.page_filter.config()
+        return settings
+
+    def _chunk_document(self, file_path: str, source: str) -> Tuple[List[str], List[dict]]:
+        loader = PDFFileLoader(file_path, max_workers=self.max_workers)
+        documents, page_starts = loader.load_documents(), loader.page_starts
+        if self.page_filter is not None:
+            documents, page_starts = self.page_filter.filter_documents(documents, page_starts)
+        text = documents[0][0]
+        if self.preprocess is not None:
+            text = self.preprocess(text)
+        return self.splitter.split_texts_with_metadata([(text, source)], page_starts)
+
+    def _keys_by_chunk_id(self) -> Dict[str, str]:
+        return {chunk_id(key): key for key in self.vector_db.keys()}
+
+    def _forget_duplicate_source(self, source: str, chunk_ids: List[str], keys_by_id: Dict[str, str]) -> None:
+        """Remove ``source`` from the ``duplicate_sources`` of chunks it previously mapped onto."""
+        for chunk in chunk_ids:
+            key = keys_by_id.get(chunk)
+            if key is None:
+                continue
+            metadata = dict(self.vector_db.retrieve_from_key(key)[1])
+            if "duplicate_sources" in metadata:
+                metadata["duplicate_sources"] = list(metadata["duplicate_sources"])
+                if remove_duplicate_source(metadata, source):
+                    self.vector_db.update_metadata(key, metadata)
+
+    def _record_duplicate_source(self, key: str, source: str, new_chunks: Dict[str, dict]) -> None:
+        if key in new_chunks:
+            add_duplicate_source(new_chunks[key], source)
+            return
+        metadata = dict(self.vector_db.retrieve_from_key(key)[1])
+        metadata["duplicate_sources"] = list(metadata.get("duplicate_sources", []))
+        if add_duplicate_source(metadata, source):
+            self.vector_db.update_metadata(key, metadata)
+
+    def _refresh_location(self, key: str, metadata: dict) -> None:
+        """Update the offsets and pages of a reused chunk owned by ``metadata``'s document, which may have moved."""
+        stored = self.vector_db.retrieve_from_key(key)[1]
+        if stored.get("source") != metadata["source"]:
+            return
+        refreshed = dict(metadata)
+        if "duplicate_sources" in stored:
+            refreshed["duplicate_sources"] = list(stored["duplicate_sources"])
+        if refreshed != stored:
+            self.vector_db.update_metadata(key, refreshed)
+
+    def _promote_orphaned_survivors(self, chunk_ids: set, keys_by_id: Dict[str, str]) -> None:
+        """Re-attribute kept chunks whose source document no longer contains them to one of their duplicate sources.
+
+        That covers both a removed source and a changed one that dropped the chunk.
+        """
+        chunks_of: Dict[str, set] = {}
+
+        def contains(source: Optional[str], chunk: str) -> bool:
+            record = self.manifest.documents.get(source)
+            if record is None:
+                return False
+            if source not in chunks_of:
+                chunks_of[source] = set(record["chunks"])
+            return chunk in chunks_of[source]
+
+        for chunk in chunk_ids:
+            key = keys_by_id.get(chunk)
+            if key is None:
+                continue
+            metadata = self.vector_db.retrieve_from_key(key)[1]
+            duplicate_sources = metadata.get("duplicate_sources", [])
+            if contains(metadata.get("source"), chunk) or not duplicate_sources:
+                continue
+            # Prefer a duplicate source that still lists the chunk.
+            successor = next((source for source in duplicate_sources if contains(source, chunk)), duplicate_sources[0])
+            metadata = dict(metadata, source=successor)
+            metadata["duplicate_sources"] = [source for source in duplicate_sources if source != successor]
+            if not metadata["duplicate_sources"]:
+                del metadata["duplicate_sources"]
+            self.vector_db.update_metadata(key, metadata)
+
+    async def aingest_directory(self, path: str) -> dict:
+        """Bring the store up to date with the PDFs under ``path``.
+
+        :return: Report with the ``added``, ``changed``, ``removed`` and
+            ``unchanged`` source names, the counts of chunks embedded,
+            reused, deduplicated and deleted, and the bytes of boilerplate removed
+        """
+        settings = self._splitter_settings()
+        settings_changed = self.manifest.settings != settings
+        files = dict((source, file_path) for file_path, source in PDFFileLoader(path).pdf_paths())
+        report = {
+            "added": [], "changed": [], "removed": [], "unchanged": [],
+            "chunks_embedded": 0, "chunks_reused": 0, "chunks_deduplicated": 0, "chunks_deleted": 0,
+            "bytes_removed": 0,
+        }
+        if self.page_filter is not None:
+            self.page_filter.reset_stats()
+        if self.deduplicator is not None and not self._deduplicator_primed:
+            for key in self.vector_db.keys():
+                self.deduplicator.add(key, key)
+            self._deduplicator_primed = True
+
+        keys_by_id = None
+        stale_chunks = set()
+        new_chunks: Dict[str, dict] = {}  # chunk key -> metadata from the first document that needs it
+        for source in sorted(files):
+            file_path = files[source]
+            stat = os.stat(file_path)
+            record = self.manifest.documents.get(source)
+            if not settings_changed and record is not None:
+                if record["mtime"] == stat.st_mtime and record["size"] == stat.st_size:
+                    report["unchanged"].append(source)
+                    continue
+                digest = _sha256_file(file_path)
+                if record["sha256"] == digest:
+                    # Touched but identical: refresh the stat fields so the next run skips hashing.
+                    record["mtime"], record["size"] = stat.st_mtime, stat.st_size
+                    report["unchanged"].append(source)
+                    continue
+            else:
+                digest = _sha256_file(file_path)
+
+            report["changed" if record is not None else "added"].append(source)
+            if record is not None:
+                stale_chunks.update(record["chunks"])
+                keys_by_id = keys_by_id or self._keys_by_chunk_id()
+                self._forget_duplicate_source(source, record["chunks"], keys_by_id)
+
+            chunks, metadata_list = self._chunk_document(file_path, source)
+            chunk_ids = []
+            located = set()  # a chunk repeated within the document keeps its first location
+            for chunk, metadata in zip(chunks, metadata_list):
+                if chunk in self.vector_db or chunk in new_chunks:
+                    report["chunks_reused"] += 1
+                    if chunk in self.vector_db and chunk not in located:
+                        located.add(chunk)
+                        self._refresh_location(chunk, metadata)
+                    chunk_ids.append(chunk_id(chunk))
+                    self._record_duplicate_source(chunk, source, new_chunks)
+                    continue
+                survivor = self.deduplicator.add(chunk, chunk) if self.deduplicator is not None else None
+                if survivor is None:
+                    new_chunks[chunk] = metadata
+                    chunk_ids.append(chunk_id(chunk))
+                else:
+                    report["chunks_deduplicated"] += 1
+                    chunk_ids.append(chunk_id(survivor))
+                    self._record_duplicate_source(survivor, source, new_chunks)
+            self.manifest.documents[source] = {
+                "sha256": digest,
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "chunks": chunk_ids,
+            }
+
+        for source in sorted(set(self.manifest.documents) - set(files)):
+            report["removed"].append(source)
+            record = self.manifest.documents.pop(source)
+            stale_chunks.update(record["chunks"])
+            keys_by_id = keys_by_id or self._keys_by_chunk_id()
+            self._forget_duplicate_source(source, record["chunks"], keys_by_id)
+        self.manifest.settings = settings
+        if self.page_filter is not None:
+            report["bytes_removed"] = self.page_filter.stats["bytes_removed"]
+
+        if new_chunks:
+            await self.vector_db.abuild_from_list(list(new_chunks), list(new_chunks.values()))
+            report["chunks_embedded"] = len(new_chunks)
+
+        # A chunk may also appear in a document that is still present.
+        referenced = self.manifest.referenced_chunks()
+        if keys_by_id:
+            self._promote_orphaned_survivors(stale_chunks & referenced, keys_by_id)
+        stale_chunks -= referenced
+        if stale_chunks:
+            stale_keys = [key for key in self.vector_db.keys() if chunk_id(key) in stale_chunks]
+            report["chunks_deleted"] = self.vector_db.delete_many(stale_keys)
+            if self.deduplicator is not None:
+                for key in stale_keys:
+                    self.deduplicator.remove(key)
+        return report
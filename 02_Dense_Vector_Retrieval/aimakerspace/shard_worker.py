@@ -0,0 +1,92 @@
+"""Search worker for ``ShardedVectorDatabase`` process mode.
+
+Kept free of the embedding and vector-store imports so that spawning a worker
+only loads numpy. Each worker serves one shard whose unit rows and per-row
+statistics live in a ``multiprocessing.shared_memory`` block written by the
+parent, so the shard is never copied into the worker.
+"""
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def shard_layout(n_rows: int, dim: int) -> Tuple[int, int]:
+    """Byte offsets of the centred-norm column and the end of a shard block."""
+    matrix_bytes = n_rows * dim * 4
+    return matrix_bytes, matrix_bytes + n_rows * 4
+
+
+def attach_shard(name: str, n_rows: int, dim: int) -> Tuple[shared_memory.SharedMemory, np.ndarray, np.ndarray]:
+    """Map a shard block as (segment, unit rows, centred norms) without copying."""
+    segment = shared_memory.SharedMemory(name=name)
+    norms_offset, _ = shard_layout(n_rows, dim)
+    matrix = np.ndarray((n_rows, dim), dtype=np.float32, buffer=segment.buf)
+    centered_norms = np.ndarray((n_rows,), dtype=np.float32, buffer=segment.buf, offset=norms_offset)
+    return segment, matrix, centered_norms
+
+
+def score_shard(
+    queries: np.ndarray,
+    matrix: np.ndarray,
+    centered_norms: np.ndarray,
+    metric: str,
+    rows: Optional[np.ndarray],
+) -> np.ndarray:
+    """(Q, n_rows) cosine or Pearson scores, computed as ``VectorDatabase`` does for its built-in metrics."""
+    matrix = matrix if rows is None else matrix[rows]
+    if metric == "cosine_similarity":
+        return (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ matrix.T
+    centered = queries - queries.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(centered, axis=1, keepdims=True)
+    row_norms = centered_norms if rows is None else centered_norms[rows]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (centered @ matrix.T) / (norms * row_norms[None, :])
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k] if k < scores.shape[0] else np.arange(scores.shape[0])
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+
+def serve(connection) -> None:
+    """Worker loop for ("attach", name, n_rows, dim) and ("search", batches, k, metric) messages.
+
+    A search message carries every (queries, rows) batch for this shard, so the
+    parent can send to all workers before reading any reply without the pipes
+    filling up. The reply holds, per batch and query, the top-k row ids and scores.
+    """
+    segment, matrix, centered_norms = None, None, None
+    try:
+        while True:
+            message = connection.recv()
+            if message[0] == "stop":
+                break
+            if message[0] == "attach":
+                if segment is not None:
+                    del matrix, centered_norms
+                    segment.close()
+                _, name, n_rows, dim = message
+                segment, matrix, centered_norms = attach_shard(name, n_rows, dim)
+                connection.send(("ok",))
+                continue
+            _, batches, k, metric = message
+            try:
+                results = []
+                for queries, rows in batches:
+                    scores = score_shard(queries, matrix, centered_norms, metric, rows)
+                    batch_results = []
+                    for query_scores in scores:
+                        best = top_k(query_scores, k)
+                        batch_results.append((best if rows is None else rows[best], query_scores[best]))
+                    results.append(batch_results)
+                connection.send(("ok", results))
+            except Exception as error:  # report to the parent rather than dying silently
+                connection.send(("error", repr(error)))
+    finally:
+        if segment is not None:
+            del matrix, centered_norms
+            segment.close()
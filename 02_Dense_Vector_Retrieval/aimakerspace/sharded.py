@@ -0,0 +1,450 @@
+import heapq
+import json
+import multiprocessing
+import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from aimakerspace.ai_utils.embedding import EmbeddingModel
+from aimakerspace.shard_worker import serve, shard_layout
+from aimakerspace.vectordatabase import VectorDatabase, cosine_similarity, pearson_correlation
+
+
+class ShardedVectorDatabase:
+    """Vector store split across ``n_shards`` ``VectorDatabase`` shards, searched by scatter-gather.
+
+    Rows are assigned to a shard by a hash of their key (``partition="hash"``),
+    which balances shard sizes, or of their ``source`` metadata
+    (``partition="source"``), which keeps each document on one shard so that a
+    ``source`` filter only searches that shard. A query runs on every shard in
+    parallel and the per-shard top-k lists, already sorted, are merged with a heap.
+
+    With ``executor="thread"`` shards are searched on a thread pool; numpy
+    releases the GIL inside the matrix products, so shards score concurrently.
+    With ``executor="process"`` each shard's unit rows are published to shared
+    memory and searched by a worker process of its own (see
+    ``aimakerspace.shard_worker``), so the Python parts of a search run in
+    parallel too. Process workers score the float32 rows exactly: they support
+    the built-in metrics only and do not use shard ANN indexes. Call ``close``
+    (or use the store as a context manager) to stop them.
+
+    Only dense search is sharded; BM25 statistics and rank fusion are per
+    shard and would not be comparable across shards.
+    """
+
+    PARTITIONS = ("hash", "source")
+    EXECUTORS = ("thread", "process")
+    METRICS = {cosine_similarity: "cosine_similarity", pearson_correlation: "pearson_correlation"}
+
+    def __init__(
+        self,
+        n_shards: int = 4,
+        partition: str = "hash",
+        embedding_model: EmbeddingModel = None,
+        executor: str = "thread",
+        max_workers: Optional[int] = None,
+        **shard_options,
+    ):
+        """
+        :param n_shards: Number of shards
+        :param partition: "hash" to spread rows by key or "source" to keep each source on one shard
+        :param embedding_model: Embedder for documents and queries, shared by all shards
+        :param executor: "thread" or "process" scatter-gather
+        :param max_workers: Threads for thread mode; defaults to one per shard
+        :param shard_options: ``VectorDatabase`` arguments applied to every shard (index, quantization, ...)
+        """
+        if n_shards < 1:
+            raise ValueError("n_shards must be at least 1")
+        if partition not in self.PARTITIONS:
+            raise ValueError(f"Unknown partition: {partition}. Must be one of {self.PARTITIONS}")
+        if executor not in self.EXECUTORS:
+            raise ValueError(f"Unknown executor: {executor}. Must be one of {self.EXECUTORS}")
+        self.partition = partition
+        self.executor = executor
+        self._embedding_model = embedding_model
+        self.shards = [VectorDatabase(embedding_model, **shard_options) for _ in range(n_shards)]
+        self._threads = ThreadPoolExecutor(max_workers=max_workers or n_shards)
+        self._workers: List[Tuple[multiprocessing.Process, object]] = []
+        self._segments: List[Optional[shared_memory.SharedMemory]] = [None] * n_shards
+        # The shard snapshot each worker's shared-memory block was copied from.
+        self._published_views: List[Optional[VectorDatabase]] = [None] * n_shards
+
+    @property
+    def n_shards(self) -> int:
+        return len(self.shards)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+    def __contains__(self, key: str) -> bool:
+        return any(key in shard for shard in self.shards)
+
+    def keys(self) -> List[str]:
+        """Stored keys, shard by shard."""
+        return [key for shard in self.shards for key in shard.keys()]
+
+    @property
+    def version(self) -> int:
+        """Increases with every change to any shard, like ``VectorDatabase.version``."""
+        return sum(shard.version for shard in self.shards)
+
+    @property
+    def embedding_model(self) -> EmbeddingModel:
+        if self._embedding_model is None:
+            self._embedding_model = EmbeddingModel()
+            for shard in self.shards:
+                shard.embedding_model = self._embedding_model
+        return self._embedding_model
+
+    def shard_for(self, key: str, metadata: Optional[dict] = None) -> int:
+        """Shard a row belongs to; crc32 keeps the assignment stable across processes and runs."""
+        if self.partition == "source":
+            key = str((metadata or {}).get("source"))
+        return zlib.crc32(key.encode("utf-8")) % self.n_shards
+
+    def _shard_holding(self, key: str) -> Optional[int]:
+        for shard_id, shard in enumerate(self.shards):
+            if key in shard:
+                return shard_id
+        return None
+
+    def insert_many(self, keys: List[str], vectors: np.ndarray, metadata_list: List[dict] = None) -> None:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if metadata_list is None:
+            metadata_list = [{} for _ in keys]
+        if not (len(keys) == len(vectors) == len(metadata_list)):
+            raise ValueError("keys, vectors and metadata_list must have the same length")
+        positions: Dict[int, List[int]] = {}
+        for i, (key, metadata) in enumerate(zip(keys, metadata_list)):
+            shard_id = self.shard_for(key, metadata)
+            holder = self._shard_holding(key) if self.partition == "source" else shard_id
+            if holder is not None and holder != shard_id:
+                # The source changed, so the row moves shard.
+                self.shards[holder].delete(key)
+            positions.setdefault(shard_id, []).append(i)
+        for shard_id, shard_positions in positions.items():
+            self.shards[shard_id].insert_many(
+                [keys[i] for i in shard_positions], vectors[shard_positions], [metadata_list[i] for i in shard_positions]
+            )
+
+    def insert(self, key: str, vector: np.array, metadata: dict = None) -> None:
+        self.insert_many([key], np.asarray(vector)[None, :], [metadata or {}])
+
+    def update_metadata(self, key: str, metadata: dict) -> None:
+        holder = self._shard_holding(key)
+        if holder is None:
+            raise KeyError(key)
+        if self.shard_for(key, metadata) == holder:
+            self.shards[holder].update_metadata(key, metadata)
+        else:
+            self.insert(key, self.shards[holder].retrieve_from_key(key)[0], metadata)
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        keys = list(keys)
+        return sum(shard.delete_many(keys) for shard in self.shards)
+
+    def delete(self, key: str) -> bool:
+        return self.delete_many([key]) == 1
+
+    def retrieve_from_key(self, key: str) -> Tuple[np.array, dict]:
+        holder = self._shard_holding(key)
+        return None if holder is None else self.shards[holder].retrieve_from_key(key)
+
+    def get_unique_metadata_values(self, key: str) -> List:
+        return list(dict.fromkeys(value for shard in self.shards for value in shard.get_unique_metadata_values(key)))
+
+    def _embed_queries(self, queries: List) -> np.ndarray:
+        if not any(isinstance(query, str) for query in queries):
+            return np.asarray(queries, dtype=np.float32)
+        texts = list(dict.fromkeys(query for query in queries if isinstance(query, str)))
+        embedded = dict(zip(texts, np.asarray(self.embedding_model.get_embeddings(texts), dtype=np.float32)))
+        return np.stack(
+            [embedded[query] if isinstance(query, str) else np.asarray(query, dtype=np.float32) for query in queries]
+        )
+
+    def _route(self, filters: List[Optional[dict]]) -> Dict[int, List[int]]:
+        """Query positions each shard must search; ``source`` filters skip other shards when partitioned by source."""
+        routes: Dict[int, List[int]] = {}
+        for i, query_filter in enumerate(filters):
+            if self.partition == "source" and query_filter and "source" in query_filter:
+                targets = [self.shard_for("", query_filter)]
+            else:
+                targets = range(self.n_shards)
+            for shard_id in targets:
+                routes.setdefault(shard_id, []).append(i)
+        return routes
+
+    @staticmethod
+    def _merge(hit_lists: List[List[Tuple[str, float, dict]]], k: int) -> List[Tuple[str, float, dict]]:
+        return list(islice(heapq.merge(*hit_lists, key=lambda hit: -hit[1]), k))
+
+    def search_many(
+        self,
+        queries: List,
+        k: int,
+        distance_metric: Callable = pearson_correlation,
+        metadata_filter=None,
+        return_as_text: bool = False,
+        exact: bool = False,
+    ) -> List[List[Tuple[str, float, dict]]]:
+        """Search every shard concurrently and merge the per-shard top-k lists.
+
+        Arguments are as for ``VectorDatabase.search_many``; text queries are
+        embedded once here rather than once per shard.
+        """
+        if isinstance(metadata_filter, dict) or metadata_filter is None:
+            filters = [metadata_filter] * len(queries)
+        else:
+            filters = list(metadata_filter)
+            if len(filters) != len(queries):
+                raise ValueError("metadata_filter list must be aligned with queries")
+        if not queries:
+            return []
+        query_vectors = self._embed_queries(queries)
+        routes = self._route(filters)
+
+        if self.executor == "process":
+            per_shard = self._process_search(routes, query_vectors, filters, k, distance_metric)
+        else:
+            futures = {
+                shard_id: self._threads.submit(
+                    self.shards[shard_id].search_many,
+                    list(query_vectors[query_ids]), k, distance_metric, [filters[i] for i in query_ids], exact=exact,
+                )
+                for shard_id, query_ids in routes.items()
+            }
+            per_shard = {shard_id: future.result() for shard_id, future in futures.items()}
+
+        gathered: List[List[List[Tuple[str, float, dict]]]] = [[] for _ in queries]
+        for shard_id, query_ids in routes.items():
+            for i, hits in zip(query_ids, per_shard[shard_id]):
+                gathered[i].append(hits)
+        results = [self._merge(hit_lists, k) for hit_lists in gathered]
+        return [[hit[0] for hit in hits] for hits in results] if return_as_text else results
+
+    def search(
+        self,
+        query_vector: np.array,
+        k: int,
+        distance_metric: Callable = pearson_correlation,
+        metadata_filter: dict = None,
+        exact: bool = False,
+    ) -> List[Tuple[str, float, dict]]:
+        return self.search_many([query_vector], k, distance_metric, metadata_filter, exact=exact)[0]
+
+    def search_by_text(
+        self,
+        query_text: str,
+        k: int,
+        distance_metric: Callable = pearson_correlation,
+        return_as_text: bool = False,
+        metadata_filter: dict = None,
+    ) -> List[Tuple[str, float, dict]]:
+        return self.search_many([query_text], k, distance_metric, metadata_filter, return_as_text)[0]
+
+    def start_processes(self) -> None:
+        """Start one worker process per shard (done on the first process-mode search)."""
+        if self._workers:
+            return
+        # Spawned workers only import numpy and the small worker module.
+        context = multiprocessing.get_context("spawn")
+        for _ in self.shards:
+            parent_end, child_end = context.Pipe()
+            process = context.Process(target=serve, args=(child_end,), daemon=True)
+            process.start()
+            child_end.close()
+            self._workers.append((process, parent_end))
+
+    def _publish(self, shard_id: int) -> None:
+        """Copy a shard's unit rows and centred norms into a new shared-memory block for its worker."""
+        shard = self.shards[shard_id]
+        if shard.tombstone_ratio:
+            # Workers scan every published row, so drop tombstones first.
+            shard.compact()
+        view = shard.snapshot()
+        n_rows, dim = view.matrix.shape[0], view.dim
+        norms_offset, size = shard_layout(n_rows, dim)
+        segment = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        if n_rows:
+            np.ndarray((n_rows, dim), dtype=np.float32, buffer=segment.buf)[:] = view.matrix
+            centered_norms = np.ndarray((n_rows,), dtype=np.float32, buffer=segment.buf, offset=norms_offset)
+            centered_norms[:] = view._centered_norms[:n_rows]
+        connection = self._workers[shard_id][1]
+        connection.send(("attach", segment.name, n_rows, dim))
+        connection.recv()
+        self._release_segment(shard_id)
+        self._segments[shard_id] = segment
+        self._published_views[shard_id] = view
+
+    def _release_segment(self, shard_id: int) -> None:
+        segment = self._segments[shard_id]
+        if segment is not None:
+            segment.close()
+            segment.unlink()
+            self._segments[shard_id] = None
+
+    def _process_search(
+        self,
+        routes: Dict[int, List[int]],
+        query_vectors: np.ndarray,
+        filters: List[Optional[dict]],
+        k: int,
+        distance_metric: Callable,
+    ) -> Dict[int, List[List[Tuple[str, float, dict]]]]:
+        metric = self.METRICS.get(distance_metric)
+        if metric is None:
+            raise ValueError("Process mode supports only cosine_similarity and pearson_correlation")
+        self.start_processes()
+        plans = {}
+        for shard_id, query_ids in routes.items():
+            view = self._published_views[shard_id]
+            if view is None or view.version != self.shards[shard_id].version:
+                self._publish(shard_id)
+                view = self._published_views[shard_id]
+            # Queries sharing a filter share one batch, as in VectorDatabase.search_many.
+            groups: Dict[object, List[int]] = {}
+            for i in query_ids:
+                groups.setdefault(VectorDatabase._filter_group_key(filters[i], i), []).append(i)
+            batches, batch_ids = [], []
+            for group in groups.values():
+                query_filter = filters[group[0]]
+                rows = view._filter_rows(query_filter) if query_filter else None
+                if rows is not None and rows.size == 0:
+                    continue
+                batches.append((query_vectors[group], rows))
+                batch_ids.append(group)
+            plans[shard_id] = batch_ids
+            # Send every shard its work before reading any reply, so all workers score at once.
+            self._workers[shard_id][1].send(("search", batches, k, metric))
+
+        per_shard = {}
+        for shard_id, batch_ids in plans.items():
+            status, *payload = self._workers[shard_id][1].recv()
+            if status != "ok":
+                raise RuntimeError(f"Shard {shard_id} worker failed: {payload[0]}")
+            view = self._published_views[shard_id]
+            hits_by_query = {}
+            for group, batch_results in zip(batch_ids, payload[0]):
+                for i, (rows, scores) in zip(group, batch_results):
+                    # A delete racing the publish can leave tombstones in the block; they are skipped.
+                    live = ~view._dead_rows(rows)
+                    hits_by_query[i] = [
+                        (view._keys[row], float(score), view._metadata[row])
+                        for row, score in zip(rows[live].tolist(), scores[live])
+                    ]
+            per_shard[shard_id] = [hits_by_query.get(i, []) for i in routes[shard_id]]
+        return per_shard
+
+    def close(self) -> None:
+        """Stop worker processes, free shared memory and the thread pool."""
+        for process, connection in self._workers:
+            try:
+                connection.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+            process.join(timeout=5)
+            connection.close()
+        self._workers = []
+        for shard_id in range(self.n_shards):
+            self._release_segment(shard_id)
+        self._published_views = [None] * self.n_shards
+        self._threads.shutdown(wait=False)
+        self._threads = ThreadPoolExecutor(max_workers=self.n_shards)
+
+    def __enter__(self) -> "ShardedVectorDatabase":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def save(self, path: str) -> None:
+        """Save each shard to ``shard_NN`` under ``path`` plus a ``sharded.json`` describing the layout."""
+        os.makedirs(path, exist_ok=True)
+        for shard_id, shard in enumerate(self.shards):
+            shard.save(os.path.join(path, f"shard_{shard_id:02d}"))
+        with open(os.path.join(path, "sharded.json"), "w", encoding="utf-8") as f:
+            json.dump({"n_shards": self.n_shards, "partition": self.partition}, f)
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        embedding_model: EmbeddingModel = None,
+        mmap: bool = True,
+        executor: str = "thread",
+        max_workers: Optional[int] = None,
+    ) -> "ShardedVectorDatabase":
+        with open(os.path.join(path, "sharded.json"), "r", encoding="utf-8") as f:
+            layout = json.load(f)
+        db = cls(layout["n_shards"], layout["partition"], embedding_model, executor, max_workers)
+        db.shards = [
+            VectorDatabase.load(os.path.join(path, f"shard_{shard_id:02d}"), embedding_model, mmap=mmap)
+            for shard_id in range(layout["n_shards"])
+        ]
+        return db
+
+    async def abuild_from_list(self, list_of_text: List[str], metadata_list: List[dict] = None) -> "ShardedVectorDatabase":
+        list_of_text = [str(text) for text in list_of_text]
+        embeddings = await self.embedding_model.async_get_embeddings(list_of_text)
+        self.insert_many(list_of_text, np.asarray(embeddings, dtype=np.float32), metadata_list)
+        return self
+
+
+def benchmark(
+    n_rows: int = 200_000,
+    dim: int = 384,
+    n_queries: int = 256,
+    k: int = 10,
+    shard_counts: Tuple[int, ...] = (1, 2, 4, 8),
+    repeats: int = 3,
+    seed: int = 0,
+) -> List[dict]:
+    """Queries per second of a single store and of thread- and process-sharded stores on random vectors.
+
+    Scaling with shard count is bounded by the cores available; set BLAS
+    libraries to one thread (e.g. ``OPENBLAS_NUM_THREADS=1``) so each shard
+    uses one core and the comparison measures sharding rather than BLAS threading.
+    """
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n_rows, dim), dtype=np.float32)
+    queries = list(rng.standard_normal((n_queries, dim), dtype=np.float32))
+    keys = [f"row-{i}" for i in range(n_rows)]
+
+    def queries_per_second(store) -> float:
+        store.search_many(queries[:1], k)  # warm up (starts workers, publishes shards)
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            store.search_many(queries, k)
+            best = min(best, time.perf_counter() - start)
+        return n_queries / best
+
+    single = VectorDatabase()
+    single.insert_many(keys, vectors)
+    reference = single.search_many(queries, k)
+    rows = [{"mode": "single", "shards": 1, "qps": queries_per_second(single)}]
+    for n_shards in shard_counts:
+        for executor in ShardedVectorDatabase.EXECUTORS:
+            with ShardedVectorDatabase(n_shards, executor=executor) as store:
+                store.insert_many(keys, vectors)
+                qps = queries_per_second(store)
+                matches = all(
+                    [hit[0] for hit in a] == [hit[0] for hit in b] for a, b in zip(store.search_many(queries, k), reference)
+                )
+            rows.append({"mode": executor, "shards": n_shards, "qps": qps, "matches_single": matches})
+    return rows
+
+
+if __name__ == "__main__":
+    print(f"{os.cpu_count()} CPU cores")
+    for row in benchmark():
+        print(
+            f"{row['mode']:>8} x{row['shards']}: {row['qps']:10.0f} queries/s"
+            + (f"  same results as single: {row['matches_single']}" if "matches_single" in row else "")
+        )
@@ -1,13 +1,90 @@
+import bisect
 import os
-from typing import List, Tuple
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import pymupdf
 
+try:
+    from transformers import AutoTokenizer
+except ImportError:  # recursive mode falls back to counting words and punctuation as tokens
+    AutoTokenizer = None
+
+DEFAULT_TOKENIZER = "sentence-transformers/all-MiniLM-L6-v2"
+_FALLBACK_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+# Boundary strength of the gap before a token, strongest first.
+PARAGRAPH_BOUNDARY, SENTENCE_BOUNDARY, WORD_BOUNDARY = 3, 2, 1
+
+
+def _extract_pdf_pages(file_path: str, start: int = 0, stop: Optional[int] = None) -> List[str]:
+    """Text of each page in ``[start, stop)`` of a PDF. Module-level so worker processes can pickle it."""
+    with pymupdf.open(file_path) as doc:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        return [doc[page].get_text() for page in range(start, stop)]
+
+
+def page_range(page_starts: List[int], start: int, end: int, first_page: int = 1) -> Tuple[int, int]:
+    """First and last page numbers covered by characters ``[start, end)``.
+
+    :param page_starts: Offset at which each page begins in the document text
+    :param first_page: Page number of ``page_starts[0]``
+    """
+    first = bisect.bisect_right(page_starts, start) - 1
+    last = bisect.bisect_right(page_starts, max(end - 1, start)) - 1
+    return first_page + max(first, 0), first_page + max(last, 0)
+
+
+def split_pages(text: str, page_starts: List[int]) -> List[str]:
+    """Cut a loaded document back into its pages using ``PDFFileLoader.page_starts``."""
+    ends = page_starts[1:] + [len(text)]
+    return [text[start:end] for start, end in zip(page_starts, ends)]
+
+
+class TextSpan:
+    """A chunk referenced by offsets into its document's text instead of copied out of it.
+
+    Every span of a document shares the one document string; the chunk text
+    is only materialised by ``str()`` or ``text``.
+    """
+
+    __slots__ = ("document", "start", "end")
+
+    def __init__(self, document: str, start: int, end: int):
+        self.document = document
+        self.start = start
+        self.end = end
+
+    @property
+    def text(self) -> str:
+        return self.document[self.start : self.end]
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return f"TextSpan({self.start}, {self.end})"
+
 
 class PDFFileLoader:
-    def __init__(self, path: str):
+    def __init__(self, path: str, max_workers: int = 1, pages_per_task: int = 64):
+        """
+        :param path: A .pdf file or a directory searched recursively for them
+        :param max_workers: Processes used for text extraction; 1 extracts in-process
+        :param pages_per_task: Large files are split into page ranges of this size
+            so one long document does not occupy a single worker
+        """
         self.documents = []  # List of (text, filename) tuples
+        self.page_starts = []  # Per document, the offset at which each page begins in its text
         self.path = path
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
 
     def load(self):
         if os.path.isdir(self.path):
@@ -20,27 +97,72 @@ class PDFFileLoader:
             )
 
     def load_file(self):
-        doc = pymupdf.open(self.path)
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        filename = os.path.basename(self.path)
-        self.documents.append((text, filename))
+        self._load_paths([(self.path, os.path.basename(self.path))])
 
     def load_directory(self):
-        for root, _, files in os.walk(self.path):
-            for file in files:
-                if file.endswith(".pdf"):
-                    doc = pymupdf.open(os.path.join(root, file))
-                    text = ""
-                    for page in doc:
-                        text += page.get_text()
-                    self.documents.append((text, file))
+        self._load_paths(list(self.pdf_paths()))
+
+    def _load_paths(self, paths: List[Tuple[str, str]]):
+        if self.max_workers <= 1 or not paths:
+            for file_path, filename in paths:
+                self._add_document(_extract_pdf_pages(file_path), filename)
+            return
+
+        # One task per page range; results come back in submission order, so
+        # documents keep the same order as a sequential load.
+        tasks = []
+        for index, (file_path, _) in enumerate(paths):
+            with pymupdf.open(file_path) as doc:
+                page_count = doc.page_count
+            for start in range(0, max(page_count, 1), self.pages_per_task):
+                tasks.append((index, file_path, start, start + self.pages_per_task))
+
+        parts: List[List[str]] = [[] for _ in paths]
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(tasks))) as executor:
+            results = executor.map(
+                _extract_pdf_pages,
+                [file_path for _, file_path, _, _ in tasks],
+                [start for _, _, start, _ in tasks],
+                [stop for _, _, _, stop in tasks],
+            )
+            for (index, _, _, _), pages in zip(tasks, results):
+                parts[index].extend(pages)
+        for (_, filename), pages in zip(paths, parts):
+            self._add_document(pages, filename)
+
+    def _add_document(self, pages: List[str], filename: str):
+        self.documents.append(("".join(pages), filename))
+        self.page_starts.append([0] + list(accumulate(len(page) for page in pages))[:-1])
 
     def load_documents(self) -> List[Tuple[str, str]]:
         self.load()
         return self.documents
 
+    def pdf_paths(self) -> Iterator[Tuple[str, str]]:
+        """Yield (file_path, filename) for each PDF under ``path``."""
+        if os.path.isdir(self.path):
+            for root, _, files in os.walk(self.path):
+                for file in files:
+                    if file.endswith(".pdf"):
+                        yield os.path.join(root, file), file
+        elif os.path.isfile(self.path) and self.path.endswith(".pdf"):
+            yield self.path, os.path.basename(self.path)
+        else:
+            raise ValueError(
+                "Provided path is neither a valid directory nor a .pdf file."
+            )
+
+    def iter_pages(self) -> Iterator[Tuple[str, str, int]]:
+        """Lazily yield (page_text, filename, page_number) one page at a time.
+
+        Only the current page is held in memory, unlike ``load_documents``
+        which materialises every document.
+        """
+        for file_path, filename in self.pdf_paths():
+            with pymupdf.open(file_path) as doc:
+                for page_number, page in enumerate(doc, 1):
+                    yield page.get_text(), filename, page_number
+
 
 class TextFileLoader:
     def __init__(self, path: str, encoding: str = "utf-8"):
@@ -76,13 +198,210 @@ class TextFileLoader:
         return self.documents
 
 
+class BoilerplateFilter:
+    """Rule-based removal of boilerplate from a stream of pages.
+
+    Rules, applied per page as pages stream through ``filter_pages``:
+
+    - ``drop_pages``: page numbers removed outright, e.g. cover pages.
+    - ``sections``: heading regexes. Text from a match to the end of the
+      document is dropped (like ``text.split("Risk Disclosures")[0]``), or,
+      for a ``(start, end)`` pair, up to the next line matching ``end``.
+    - Repeated headers and footers: a line among the first or last
+      ``edge_lines`` non-empty lines of a page that recurs on at least
+      ``min_repeats`` pages of the same document (digits ignored, so page
+      numbers match) is dropped. The first ``learn_pages`` pages of each
+      document are buffered to learn them; later pages stream through.
+
+    A dropped page is emitted with empty text rather than skipped, so page
+    numbers and ``page_starts`` offsets still line up. Removed bytes are
+    tallied per rule in ``stats``.
+    """
+
+    def __init__(
+        self,
+        sections: Iterable[Union[str, Tuple[str, Optional[str]]]] = (),
+        drop_pages: Union[Iterable[int], Dict[str, Iterable[int]], None] = None,
+        repeated_edge_lines: bool = True,
+        edge_lines: int = 2,
+        min_repeats: int = 3,
+        learn_pages: int = 8,
+    ):
+        """
+        :param sections: Heading regexes, or (start, end) regex pairs, marking sections to drop
+        :param drop_pages: 1-based page numbers to drop from every document, or a mapping
+            of source name to page numbers
+        :param repeated_edge_lines: Detect and drop repeated headers and footers
+        :param edge_lines: Non-empty lines at the top and bottom of a page considered header/footer
+        :param min_repeats: Pages a line must appear on to count as a header/footer
+        :param learn_pages: Pages buffered per document before headers/footers are applied
+        """
+        self._section_patterns = [(section, None) if isinstance(section, str) else tuple(section) for section in sections]
+        self._sections = [
+            (re.compile(start), re.compile(end) if end is not None else None) for start, end in self._section_patterns
+        ]
+        self.drop_pages = drop_pages
+        self.repeated_edge_lines = repeated_edge_lines
+        self.edge_lines = edge_lines
+        self.min_repeats = min_repeats
+        self.learn_pages = learn_pages
+        self.reset_stats()
+
+    def config(self) -> dict:
+        """The rules as plain data, e.g. to detect when a re-ingestion is needed."""
+        drop_pages = self.drop_pages
+        if isinstance(drop_pages, dict):
+            drop_pages = {source: sorted(pages) for source, pages in drop_pages.items()}
+        elif drop_pages is not None:
+            drop_pages = sorted(drop_pages)
+        return {
+            "sections": [list(section) for section in self._section_patterns],
+            "drop_pages": drop_pages,
+            "repeated_edge_lines": self.repeated_edge_lines,
+            "edge_lines": self.edge_lines,
+            "min_repeats": self.min_repeats,
+            "learn_pages": self.learn_pages,
+        }
+
+    def reset_stats(self) -> None:
+        self.stats = {"pages": 0, "bytes_in": 0, "bytes_removed": 0, "pages_dropped": 0,
+                      "bytes_removed_by_rule": {"pages": 0, "sections": 0, "repeated_lines": 0}}
+
+    def _removed(self, rule: str, text: str) -> None:
+        size = len(text.encode("utf-8"))
+        self.stats["bytes_removed"] += size
+        self.stats["bytes_removed_by_rule"][rule] += size
+
+    def _is_dropped_page(self, source: str, page_number: int) -> bool:
+        if self.drop_pages is None:
+            return False
+        pages = self.drop_pages.get(source, ()) if isinstance(self.drop_pages, dict) else self.drop_pages
+        return page_number in pages
+
+    def _strip_sections(self, text: str, state: dict) -> str:
+        """Drop section text from one page; ``state`` carries an open section across pages."""
+        if not self._sections:
+            return text
+        kept = []
+        for line in text.splitlines(keepends=True):
+            if state["section_end"] is not None:
+                if state["section_end"] is True or not state["section_end"].search(line):
+                    self._removed("sections", line)
+                    continue
+                state["section_end"] = None
+            for start, end in self._sections:
+                match = start.search(line)
+                if match:
+                    kept.append(line[: match.start()])
+                    self._removed("sections", line[match.start() :])
+                    state["section_end"] = end if end is not None else True
+                    break
+            else:
+                kept.append(line)
+        return "".join(kept)
+
+    @staticmethod
+    def _normalise_line(line: str) -> str:
+        return re.sub(r"\d+", "#", line.strip())
+
+    def _edge_positions(self, lines: List[str]) -> List[int]:
+        non_empty = [i for i, line in enumerate(lines) if line.strip()]
+        # On a page this short, the top and bottom lines are the body.
+        if len(non_empty) <= 2 * self.edge_lines:
+            return []
+        return non_empty[: self.edge_lines] + non_empty[-self.edge_lines :]
+
+    def _strip_repeated_lines(self, text: str, counts: Counter) -> str:
+        lines = text.splitlines(keepends=True)
+        drop = {i for i in self._edge_positions(lines) if counts[self._normalise_line(lines[i])] >= self.min_repeats}
+        if not drop:
+            return text
+        for i in drop:
+            self._removed("repeated_lines", lines[i])
+        return "".join(line for i, line in enumerate(lines) if i not in drop)
+
+    def filter_pages(self, pages: Iterable[Tuple]) -> Iterator[Tuple]:
+        """Filter (text, source, page_number, ...) tuples, e.g. from ``PDFFileLoader.iter_pages``.
+
+        Yields the same tuples with filtered text, in order.
+        """
+        source = None
+        state: dict = {}
+        counts: Counter = Counter()
+        pending: List[Tuple] = []
+        for page in pages:
+            text, page_source, page_number = page[0], page[1], page[2]
+            if page_source != source or not state:
+                yield from self._release(pending, counts)
+                pending = []
+                source, state, counts = page_source, {"section_end": None}, Counter()
+            self.stats["pages"] += 1
+            self.stats["bytes_in"] += len(text.encode("utf-8"))
+
+            if self._is_dropped_page(page_source, page_number):
+                self._removed("pages", text)
+                self.stats["pages_dropped"] += 1
+                text = ""
+            else:
+                text = self._strip_sections(text, state)
+            page = (text,) + tuple(page[1:])
+            if not self.repeated_edge_lines:
+                yield page
+                continue
+
+            lines = text.splitlines()
+            counts.update({self._normalise_line(lines[i]) for i in self._edge_positions(lines)})
+            if pending is not None:
+                pending.append(page)
+                if len(pending) >= self.learn_pages:
+                    yield from self._release(pending, counts)
+                    pending = None
+            else:
+                yield self._filter_page(page, counts)
+        yield from self._release(pending, counts)
+
+    def _filter_page(self, page: Tuple, counts: Counter) -> Tuple:
+        return (self._strip_repeated_lines(page[0], counts),) + tuple(page[1:])
+
+    def _release(self, pending: Optional[List[Tuple]], counts: Counter) -> Iterator[Tuple]:
+        for page in pending or ():
+            yield self._filter_page(page, counts)
+
+    def filter_documents(
+        self, documents: List[Tuple[str, str]], page_starts: List[List[int]]
+    ) -> Tuple[List[Tuple[str, str]], List[List[int]]]:
+        """Filter documents loaded by ``PDFFileLoader`` and return them with updated ``page_starts``."""
+        pages = (
+            (page, source, number)
+            for (text, source), starts in zip(documents, page_starts)
+            for number, page in enumerate(split_pages(text, starts), 1)
+        )
+        filtered: Dict[str, List[str]] = {}
+        for text, source, _ in self.filter_pages(pages):
+            filtered.setdefault(source, []).append(text)
+        documents_out, page_starts_out = [], []
+        for _, source in documents:
+            document_pages = filtered.get(source, [])
+            documents_out.append(("".join(document_pages), source))
+            page_starts_out.append([0] + list(accumulate(len(page) for page in document_pages))[:-1])
+        return documents_out, page_starts_out
+
+
 class CharacterTextSplitter:
     def __init__(
         self,
         chunk_size: int = 1000,
         chunk_overlap: int = 200,
         split_mode: str = "character",
+        tokenizer: Union[str, object] = DEFAULT_TOKENIZER,
     ):
+        """
+        :param chunk_size: Maximum chunk length, in characters or, for "recursive", tokens
+        :param chunk_overlap: Overlap between consecutive chunks, in the same unit
+        :param split_mode: "character", "paragraph" or "recursive"
+        :param tokenizer: For "recursive", a Hugging Face fast tokenizer or the name of one
+            to load; defaults to the tokenizer of the default embedding model
+        """
         assert (
             chunk_size > chunk_overlap
         ), "Chunk size must be greater than chunk overlap"
@@ -90,12 +409,15 @@ class CharacterTextSplitter:
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.split_mode = split_mode
+        self.tokenizer = tokenizer
 
     def split(self, text: str) -> List[str]:
         if self.split_mode == "character":
             return self._split_by_character(text)
         elif self.split_mode == "paragraph":
             return self._split_by_paragraph(text)
+        elif self.split_mode == "recursive":
+            return [text[start:end] for start, end in self._recursive_spans(text)]
         else:
             raise ValueError(f"Unknown split_mode: {self.split_mode}")
 
@@ -106,54 +428,241 @@ class CharacterTextSplitter:
         return chunks
 
     def _split_by_paragraph(self, text: str) -> List[str]:
+        return [chunk for chunk, _, _ in self._paragraph_chunks(text)]
+
+    def _paragraph_chunks(self, text: str) -> List[Tuple[str, int, int]]:
+        """Paragraph-mode chunks with the (start, end) offsets of the paragraphs each was built from."""
         # Split on " \n" (space followed by newline) as a paragraph delimiter
         # This works better than "\n" alone but still can't reliably find paragraphs
-        paragraphs = text.split(" \n")
-
-        # Clean up: replace remaining single newlines within paragraphs with literal \n
-        paragraphs = [para.replace("\n", "\\n").strip() for para in paragraphs]
+        paragraphs = []
+        offset = 0
+        for raw in text.split(" \n"):
+            # Clean up: replace remaining single newlines within paragraphs with literal \n
+            paragraphs.append((raw.replace("\n", "\\n").strip(), offset, offset + len(raw)))
+            offset += len(raw) + 2
 
         chunks = []
         current_chunk = ""
+        chunk_start = chunk_end = None
 
-        for para in paragraphs:
+        for para, para_start, para_end in paragraphs:
             if not para:
                 continue
             # If adding this paragraph exceeds chunk_size, save current and start new
             if len(current_chunk) + len(para) + 2 > self.chunk_size and current_chunk:
-                chunks.append(current_chunk.strip())
+                chunks.append((current_chunk.strip(), chunk_start, chunk_end))
                 # Keep overlap by starting with end of previous chunk
                 current_chunk = current_chunk[-self.chunk_overlap:] if self.chunk_overlap else ""
+                chunk_start = None
 
             current_chunk += para + "\n\n"
+            chunk_start = para_start if chunk_start is None else chunk_start
+            chunk_end = para_end
 
         # Don't forget the last chunk
         if current_chunk.strip():
-            chunks.append(current_chunk.strip())
+            chunks.append((current_chunk.strip(), chunk_start, chunk_end))
 
         return chunks
 
+    def _token_offsets(self, text: str) -> List[Tuple[int, int]]:
+        """(start, end) character offsets of each token in ``text``."""
+        if isinstance(self.tokenizer, str):
+            if AutoTokenizer is None:
+                return [match.span() for match in _FALLBACK_TOKEN.finditer(text)]
+            self.tokenizer = AutoTokenizer.from_pretrained(self.tokenizer)
+        encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        return [(start, end) for start, end in encoding["offset_mapping"] if end > start]
+
+    @staticmethod
+    def _boundary_strength(text: str, previous_end: int, start: int) -> int:
+        """Strength of the boundary between a token ending at ``previous_end`` and one starting at ``start``."""
+        gap = text[previous_end:start]
+        if not gap:
+            return 0
+        # Look past closing quotes and brackets for sentence-ending punctuation.
+        position = previous_end - 1
+        while position > 0 and text[position] in "\"'”’)":
+            position -= 1
+        ends_sentence = text[position] in ".!?…"
+        # PDF text breaks every line, so a newline only ends a paragraph after a sentence.
+        if "\n\n" in gap or ("\n" in gap and ends_sentence):
+            return PARAGRAPH_BOUNDARY
+        if ends_sentence:
+            return SENTENCE_BOUNDARY
+        return WORD_BOUNDARY
+
+    def _recursive_spans(self, text: str) -> List[Tuple[int, int]]:
+        """Token-sized chunk offsets ending at the strongest boundary available.
+
+        Text is tokenized once. One pass then records, for every token
+        position, the nearest preceding paragraph, sentence and word boundary,
+        so each chunk end is found in O(1): the last paragraph break within
+        ``chunk_size`` tokens, else the last sentence end, else the last word
+        gap, as long as it keeps the chunk at least half full.
+        """
+        offsets = self._token_offsets(text)
+        n_tokens = len(offsets)
+        if n_tokens == 0:
+            return []
+        # last[strength][i]: largest j <= i where a boundary at least that strong precedes token j.
+        last = {strength: [0] * (n_tokens + 1) for strength in (PARAGRAPH_BOUNDARY, SENTENCE_BOUNDARY, WORD_BOUNDARY)}
+        for i in range(1, n_tokens + 1):
+            strength = 4 if i == n_tokens else self._boundary_strength(text, offsets[i - 1][1], offsets[i][0])
+            for level, positions in last.items():
+                positions[i] = i if strength >= level else positions[i - 1]
+
+        spans = []
+        start = 0
+        while start < n_tokens:
+            end = min(start + self.chunk_size, n_tokens)
+            if end < n_tokens:
+                for level in (PARAGRAPH_BOUNDARY, SENTENCE_BOUNDARY, WORD_BOUNDARY):
+                    if last[level][end] > start + self.chunk_size // 2:
+                        end = last[level][end]
+                        break
+            spans.append((offsets[start][0], offsets[end - 1][1]))
+            if end == n_tokens:
+                break
+            # Start the next chunk at a word boundary about chunk_overlap tokens back, always
+            # moving forward: a short chunk can end within chunk_overlap tokens of its start.
+            back = max(end - self.chunk_overlap, start + 1)
+            next_start = last[WORD_BOUNDARY][back] if self.chunk_overlap else end
+            start = next_start if next_start > start else back
+        return spans
+
+    def split_spans(self, text: str) -> List[Tuple[int, int]]:
+        """(start, end) offsets in ``text`` of each chunk ``split`` returns.
+
+        Paragraph mode rewrites newlines and strips whitespace, so its spans
+        cover the source paragraphs of a chunk (excluding the overlap carried
+        over from the previous chunk) rather than matching the chunk text.
+        """
+        if self.split_mode == "character":
+            step = self.chunk_size - self.chunk_overlap
+            return [(i, min(i + self.chunk_size, len(text))) for i in range(0, len(text), step)]
+        elif self.split_mode == "paragraph":
+            return [(start, end) for _, start, end in self._paragraph_chunks(text)]
+        elif self.split_mode == "recursive":
+            return self._recursive_spans(text)
+        else:
+            raise ValueError(f"Unknown split_mode: {self.split_mode}")
+
+    def _split_with_spans(self, text: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        if self.split_mode == "paragraph":
+            chunks = self._paragraph_chunks(text)
+            return [chunk for chunk, _, _ in chunks], [(start, end) for _, start, end in chunks]
+        spans = self.split_spans(text)
+        return [text[start:end] for start, end in spans], spans
+
     def split_texts(self, texts: List[str]) -> List[str]:
         chunks = []
         for text in texts:
             chunks.extend(self.split(text))
         return chunks
 
-    def split_texts_with_metadata(self, texts_with_metadata: List[Tuple[str, str]]) -> Tuple[List[str], List[dict]]:
+    @staticmethod
+    def _chunk_metadata(
+        source: str,
+        start: int,
+        end: int,
+        page_starts: Optional[List[int]] = None,
+        first_page: int = 1,
+    ) -> dict:
+        metadata = {"source": source, "start": start, "end": end}
+        if page_starts:
+            metadata["page_start"], metadata["page_end"] = page_range(page_starts, start, end, first_page)
+        return metadata
+
+    def split_stream(self, segments: Iterable[Tuple]) -> Iterator[Tuple[str, dict]]:
+        """Lazily split a stream of text segments into (chunk, metadata) pairs.
+
+        Consecutive segments with the same source (e.g. the pages yielded by
+        ``PDFFileLoader.iter_pages``) are treated as one document, so chunks
+        match ``split_texts_with_metadata`` on the joined text. Character mode
+        keeps only about one chunk of text buffered; the other modes buffer one
+        document at a time.
+
+        Args:
+            segments: Iterable of (text, source_name) or (text, source_name, page_number) tuples
+
+        Yields:
+            (chunk, metadata) pairs; metadata holds the source, the chunk's
+            character offsets in the joined document and, when segments carry
+            page numbers, ``page_start``/``page_end``
+        """
+        source = None
+        buffer: List[str] = []
+        buffer_offset = 0  # document offset of the first buffered character
+        page_starts: List[int] = []
+        first_page = 1
+        for segment in segments:
+            text, segment_source = segment[0], segment[1]
+            if buffer and segment_source != source:
+                yield from self._flush_document("".join(buffer), source, buffer_offset, page_starts, first_page)
+                buffer, buffer_offset = [], 0
+            if not buffer:
+                page_starts = []
+                first_page = segment[2] if len(segment) > 2 else 1
+            source = segment_source
+            if len(segment) > 2:
+                page_starts.append(buffer_offset + sum(len(part) for part in buffer))
+            if self.split_mode != "character":
+                buffer.append(text)
+                continue
+
+            pending = "".join(buffer) + text
+            step = self.chunk_size - self.chunk_overlap
+            # Emit every chunk whose full window is available; later text cannot change it.
+            start = 0
+            while len(pending) - start >= self.chunk_size:
+                chunk_start = buffer_offset + start
+                yield pending[start : start + self.chunk_size], self._chunk_metadata(
+                    source, chunk_start, chunk_start + self.chunk_size, page_starts, first_page
+                )
+                start += step
+            buffer = [pending[start:]]
+            buffer_offset += start
+        if buffer:
+            yield from self._flush_document("".join(buffer), source, buffer_offset, page_starts, first_page)
+
+    def _flush_document(
+        self, text: str, source: str, offset: int, page_starts: List[int], first_page: int
+    ) -> Iterator[Tuple[str, dict]]:
+        for chunk, (start, end) in zip(*self._split_with_spans(text)):
+            yield chunk, self._chunk_metadata(source, offset + start, offset + end, page_starts, first_page)
+
+    def split_texts_with_metadata(
+        self,
+        texts_with_metadata: List[Tuple[str, str]],
+        page_starts: Optional[List[List[int]]] = None,
+        as_spans: bool = False,
+    ) -> Tuple[List, List[dict]]:
         """Split texts while preserving source metadata.
 
         Args:
             texts_with_metadata: List of (text, source_name) tuples
+            page_starts: Optional per-document page offsets, e.g. ``PDFFileLoader.page_starts``,
+                used to add ``page_start``/``page_end`` to each chunk's metadata
+            as_spans: Return ``TextSpan`` views into the document texts instead of
+                copied strings (not supported in paragraph mode)
 
         Returns:
-            Tuple of (chunks, metadata_list) where each chunk has corresponding metadata
+            Tuple of (chunks, metadata_list) where each chunk has corresponding metadata,
+            including its ``start``/``end`` character offsets in the source text
         """
+        if as_spans and self.split_mode == "paragraph":
+            raise ValueError("as_spans is not supported with split_mode='paragraph'; its chunks are rewritten text")
         chunks = []
         metadata_list = []
-        for text, source in texts_with_metadata:
-            text_chunks = self.split(text)
-            chunks.extend(text_chunks)
-            metadata_list.extend([{"source": source} for _ in text_chunks])
+        for i, (text, source) in enumerate(texts_with_metadata):
+            text_chunks, spans = self._split_with_spans(text)
+            if as_spans:
+                chunks.extend(TextSpan(text, start, end) for start, end in spans)
+            else:
+                chunks.extend(text_chunks)
+            document_pages = page_starts[i] if page_starts is not None else None
+            metadata_list.extend(self._chunk_metadata(source, start, end, document_pages) for start, end in spans)
         return chunks, metadata_list
 
 
@@ -1,8 +1,17 @@
+import bisect
+import functools
+import hashlib
+import json
+import os
+import threading
 import numpy as np
-from collections import defaultdict
-from typing import List, Tuple, Callable
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Callable
 from aimakerspace.ai_utils.embedding import EmbeddingModel
+from aimakerspace.ann import IVFIndex
+from aimakerspace.bm25 import BM25Index
 import asyncio
+import copy
 
 
 def cosine_similarity(vector_a: np.array, vector_b: np.array) -> float:
@@ -18,30 +27,1111 @@ def pearson_correlation(vector_a: np.array, vector_b: np.array) -> float:
     return np.corrcoef(vector_a, vector_b)[0, 1]
 
 
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first.
+
+    Uses ``np.argpartition`` so only the selected k are fully sorted. Ties keep
+    insertion order, matching the stable sort the store used previously.
+    """
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Tuple[str, float, dict]]], k: int, rrf_k: int = 60
+) -> List[Tuple[str, float, dict]]:
+    """Fuse ranked hit lists by summing 1 / (rrf_k + rank) over the lists each key appears in.
+
+    Only ranks are used, so scores on different scales (cosine, BM25) need no
+    calibration. Ties keep the order in which keys were first seen.
+    """
+    fused: Dict[str, float] = {}
+    metadata: Dict[str, dict] = {}
+    for hits in rankings:
+        for rank, (key, _, hit_metadata) in enumerate(hits, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            metadata.setdefault(key, hit_metadata)
+    best = sorted(fused, key=fused.get, reverse=True)[:k]
+    return [(key, fused[key], metadata[key]) for key in best]
+
+
+def weighted_fusion(
+    dense_hits: List[Tuple[str, float, dict]],
+    lexical_hits: List[Tuple[str, float, dict]],
+    k: int,
+    alpha: float = 0.5,
+) -> List[Tuple[str, float, dict]]:
+    """Fuse by ``alpha`` * dense score + (1 - ``alpha``) * lexical score, each min-max scaled to [0, 1]."""
+    fused: Dict[str, float] = {}
+    metadata: Dict[str, dict] = {}
+    for hits, weight in ((dense_hits, alpha), (lexical_hits, 1.0 - alpha)):
+        if not hits:
+            continue
+        scores = np.array([hit[1] for hit in hits], dtype=np.float64)
+        spread = scores.max() - scores.min()
+        scaled = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+        for (key, _, hit_metadata), score in zip(hits, scaled):
+            fused[key] = fused.get(key, 0.0) + weight * float(score)
+            metadata.setdefault(key, hit_metadata)
+    best = sorted(fused, key=fused.get, reverse=True)[:k]
+    return [(key, fused[key], metadata[key]) for key in best]
+
+
+def merge_adjacent_hits(hits: List[Tuple[str, float, dict]], max_gap: int = 0) -> List[Tuple[str, float, dict]]:
+    """Merge hits that are overlapping or adjacent chunks of the same source into one block.
+
+    Chunks are matched by the ``source``, ``start`` and ``end`` character
+    offsets in their metadata; hits without offsets are passed through. A
+    merged block keeps the best score of its chunks, spans their offsets and
+    pages, and takes the position of its best chunk in the result order.
+
+    :param max_gap: Characters allowed between two chunks for them to still merge
+    """
+    blocks: List[List] = []  # [text, score, metadata, position of best chunk]
+    by_source: Dict[str, List[int]] = {}
+    for position, (text, score, metadata) in sorted(
+        enumerate(hits), key=lambda item: (str(item[1][2].get("source")), item[1][2].get("start", -1))
+    ):
+        if "start" not in metadata or "end" not in metadata:
+            blocks.append([text, score, metadata, position])
+            continue
+        source_blocks = by_source.setdefault(metadata.get("source"), [])
+        block = blocks[source_blocks[-1]] if source_blocks else None
+        if block is None or metadata["start"] > block[2]["end"] + max_gap:
+            source_blocks.append(len(blocks))
+            blocks.append([text, score, dict(metadata), position])
+            continue
+        merged = block[2]
+        if metadata["end"] > merged["end"]:
+            overlap = merged["end"] - metadata["start"]
+            if overlap >= 0 and len(text) == metadata["end"] - metadata["start"]:
+                block[0] += text[overlap:]
+            else:
+                block[0] += "\n" + text
+            merged["end"] = metadata["end"]
+            if "page_end" in metadata:
+                merged["page_end"] = max(merged.get("page_end", metadata["page_end"]), metadata["page_end"])
+        if score > block[1]:
+            block[1], block[3] = score, position
+    blocks.sort(key=lambda block: block[3])
+    return [(text, score, metadata) for text, score, metadata, _ in blocks]
+
+
+def _key_digest(key: str) -> int:
+    """64-bit digest of a chunk's text, used in place of the text as a lookup key."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _reads_snapshot(method: Callable) -> Callable:
+    """Run a read-only ``VectorDatabase`` method on the latest published snapshot, without locking."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return method(self._snapshot, *args, **kwargs)
+
+    return wrapper
+
+
+def _writes(method: Callable) -> Callable:
+    """Run a mutating ``VectorDatabase`` method under the writer lock and publish the result."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._snapshot is self:
+            raise TypeError("VectorDatabase snapshots are read-only")
+        with self._write_lock:
+            result = method(self, *args, **kwargs)
+            self._publish()
+        return result
+
+    return wrapper
+
+
+def _is_hashable(value) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+class MetadataIndex:
+    """Inverted index of metadata field -> value -> sorted row ids.
+
+    Rows are only ever appended, in increasing order, so each posting list
+    stays sorted and can be intersected without re-sorting. Copies share
+    the posting lists: a copy keeps its row count and ignores rows added
+    past it. Rows the store tombstones stay listed until compaction
+    rebuilds the index, and the store filters them out. Unhashable values
+    are not indexed; filters on them fall back to a scan.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[object, List[int]]] = {}
+        self._arrays: Dict[Tuple[str, object], np.ndarray] = {}
+        self._n_rows = 0
+
+    def copy(self) -> "MetadataIndex":
+        """Copy that shares posting lists with this index; rows it adds stay invisible to this index."""
+        clone = copy.copy(self)
+        clone._arrays = {}
+        return clone
+
+    def add(self, row: int, metadata: dict) -> None:
+        if row < self._n_rows:
+            raise ValueError(f"Row {row} is already indexed")
+        self._n_rows = row + 1
+        for field, value in metadata.items():
+            if not _is_hashable(value):
+                continue
+            self._postings.setdefault(field, {}).setdefault(value, []).append(row)
+            self._arrays.pop((field, value), None)
+
+    def supports(self, metadata_filter: dict) -> bool:
+        """Whether ``metadata_filter`` can be answered from the index alone."""
+        return all(value is not None and _is_hashable(value) for value in metadata_filter.values())
+
+    def _visible(self, rows: List[int]) -> int:
+        """How many leading entries of a posting list are rows of this index rather than a later copy's."""
+        return bisect.bisect_left(rows, self._n_rows)
+
+    def rows_for(self, field: str, value) -> np.ndarray:
+        cache_key = (field, value)
+        array = self._arrays.get(cache_key)
+        if array is None:
+            rows = self._postings.get(field, {}).get(value, [])
+            array = np.asarray(rows[: self._visible(rows)], dtype=np.int64)
+            self._arrays[cache_key] = array
+        return array
+
+    def lookup(self, metadata_filter: dict) -> np.ndarray:
+        """Sorted row ids matching every ``field == value`` pair in the filter."""
+        rows = None
+        # Start from the most selective field to keep intersections small.
+        ordered = sorted(
+            metadata_filter.items(),
+            key=lambda item: len(self._postings.get(item[0], {}).get(item[1], ())),
+        )
+        for field, value in ordered:
+            matches = self.rows_for(field, value)
+            rows = matches if rows is None else np.intersect1d(rows, matches, assume_unique=True)
+            if rows.size == 0:
+                break
+        return rows if rows is not None else np.empty(0, dtype=np.int64)
+
+    def values(self, field: str, is_live: Callable[[int], bool] = lambda row: True) -> List:
+        """Values of ``field`` held by at least one row for which ``is_live`` holds."""
+        found = []
+        # list() takes the items in one step, so a writer adding values meanwhile cannot break the loop.
+        for value, rows in list(self._postings.get(field, {}).items()):
+            # Newest rows are the likeliest to be live, so scan from the end.
+            if any(is_live(rows[i]) for i in range(self._visible(rows) - 1, -1, -1)):
+                found.append(value)
+        return found
+
+
 class VectorDatabase:
-    def __init__(self, embedding_model: EmbeddingModel = None):
-        self.vectors = defaultdict(tuple)  # key: text -> value: (vector, metadata)
-        self.embedding_model = embedding_model or EmbeddingModel()
+    """In-memory vector store backed by a contiguous float32 matrix.
+
+    Rows are stored L2-normalised so cosine similarity is a single matmul per
+    query. Pearson correlation is derived from the same product using the
+    per-row mean of each normalised vector, so both built-in metrics avoid a
+    Python-level loop over the store.
+
+    With ``index="ivf"`` searches first narrow the rows to the ``nprobe``
+    nearest k-means buckets (see ``aimakerspace.ann.IVFIndex``) and score
+    only those; ``exact=True`` on a search bypasses the index.
+
+    With ``quantization="int8"`` rows are kept as int8 codes with a per-row
+    scale and scored asymmetrically against the float32 query. The float32
+    rows are dropped unless ``keep_full_precision`` is set (or the store is
+    memory-mapped from disk), in which case the top ``rerank_candidates``
+    are re-scored exactly.
+
+    With ``bm25=True`` a BM25 inverted index over the chunk text is kept
+    alongside the vectors (see ``aimakerspace.bm25.BM25Index``), enabling
+    ``mode="lexical"`` and ``mode="hybrid"`` searches. Hybrid search takes
+    the top ``FUSION_CANDIDATES`` hits of each retriever and fuses them with
+    reciprocal rank fusion or a weighted sum of normalised scores.
+
+    Searches can select results by maximal marginal relevance
+    (``mmr_lambda``) instead of plain top-k, so overlapping chunks of the same
+    passage do not crowd out other passages, and can merge overlapping or
+    adjacent chunks of the same source into one block (``merge_adjacent``).
+
+    Every row has a stable integer id, returned by ``insert_many`` and
+    ``upsert``. Chunk text stays the unique key, but lookups go through a
+    64-bit digest of it rather than a dict keyed by the text. ``delete``
+    only marks rows as tombstones, which searches mask out. Once
+    tombstones pass ``compact_threshold`` of the rows, ``compact`` rebuilds
+    the arrays without them; inside a running event loop this happens on a
+    background task (``acompact``).
+
+    Reads are lock-free and see one consistent version. Every read runs on
+    the latest published snapshot, an immutable view of the store. Writers
+    take a lock, build the next version and publish it with a single
+    reference assignment. Storage is append-only, so a snapshot is little
+    more than a row count and a version number: rows, keys, metadata, the
+    key and id lookups and every index posting list only grow, and a
+    snapshot ignores rows past its ``_size``. Replacing a row (``upsert``
+    of a stored key, ``update_metadata``) appends the new version and
+    tombstones the old one. Tombstones record the version that deleted the
+    row, so older snapshots still see it as live. Publishing therefore
+    costs time proportional to the rows written, not to the store size.
+    ``snapshot()`` returns the current view, so several reads can be made
+    against the same version.
+    """
+
+    STORE_FORMAT_VERSION = 1
+    LIVE = np.iinfo(np.int64).max  # _deleted_in value of a row no version has deleted
+    INDEX_TYPES = ("flat", "ivf")
+    QUANTIZATION_TYPES = (None, "int8")
+    QUANTIZED_BLOCK_ROWS = 4096  # rows dequantised per matmul when scanning int8 codes
+    SEARCH_MODES = ("dense", "lexical", "hybrid")
+    FUSION_METHODS = ("rrf", "weighted")
+    FUSION_CANDIDATES = 50  # hits taken from each retriever before fusing
+    RRF_K = 60
+    MMR_FETCH_FACTOR = 4  # MMR chooses k results from this many times k candidates
+
+    def __init__(
+        self,
+        embedding_model: EmbeddingModel = None,
+        index: str = "flat",
+        nprobe: int = 8,
+        n_lists: Optional[int] = None,
+        quantization: Optional[str] = None,
+        rerank_candidates: int = 0,
+        keep_full_precision: bool = False,
+        bm25: bool = False,
+        compact_threshold: Optional[float] = 0.25,
+    ):
+        """
+        :param embedding_model: Embedder for documents and queries
+        :param index: "flat" for exact brute-force search or "ivf" for approximate search
+        :param nprobe: IVF buckets scanned per query; higher is slower with better recall
+        :param n_lists: IVF bucket count; defaults to sqrt(N) when the index is trained
+        :param quantization: None for float32 rows or "int8" for scalar-quantised rows
+        :param rerank_candidates: With quantization, re-score this many top candidates
+            with the float32 rows (requires full-precision rows)
+        :param keep_full_precision: With quantization, also keep float32 rows in RAM
+        :param bm25: Also keep a BM25 index of the chunk text for lexical and hybrid search
+        :param compact_threshold: Fraction of tombstoned rows at which a delete triggers
+            compaction; None compacts only when ``compact`` is called
+        """
+        if index not in self.INDEX_TYPES:
+            raise ValueError(f"Unknown index: {index}. Must be one of {self.INDEX_TYPES}")
+        if quantization not in self.QUANTIZATION_TYPES:
+            raise ValueError(f"Unknown quantization: {quantization}. Must be one of {self.QUANTIZATION_TYPES}")
+        if compact_threshold is not None and not 0 < compact_threshold <= 1:
+            raise ValueError("compact_threshold must be in (0, 1] or None")
+        self.index_type = index
+        self.quantization = quantization
+        self.rerank_candidates = rerank_candidates
+        self.compact_threshold = compact_threshold
+        self._ann = IVFIndex(n_lists=n_lists, nprobe=nprobe) if index == "ivf" else None
+        self._embedding_model = embedding_model
+        self._embeddings_model_name: Optional[str] = None  # model to build lazily, set by load()
+        self._keys: List[str] = []
+        self._metadata: List[dict] = []
+        # _key_digest(text) -> row, or a list of rows once several rows had that digest since compaction.
+        self._digest_to_row: Dict[int, object] = {}
+        self._id_to_row: Dict[int, object] = {}  # id -> row(s), likewise
+        self._next_id = 0
+        self._metadata_index = MetadataIndex()
+        self._bm25 = BM25Index() if bm25 else None
+        self._dim = 0
+        # Unit rows, grown geometrically; None when quantised without full precision.
+        self._matrix = np.empty((0, 0), dtype=np.float32) if quantization is None or keep_full_precision else None
+        self._codes = np.empty((0, 0), dtype=np.int8) if quantization == "int8" else None
+        self._scales = np.empty(0, dtype=np.float32) if quantization == "int8" else None  # code -> unit value
+        self._norms = np.empty(0, dtype=np.float32)  # original L2 norm of each row
+        self._row_means = np.empty(0, dtype=np.float32)  # mean of each unit row
+        self._centered_norms = np.empty(0, dtype=np.float32)  # ||unit_row - mean||
+        self._ids = np.empty(0, dtype=np.int64)
+        self._deleted_in = np.empty(0, dtype=np.int64)  # version that tombstoned each row, or LIVE
+        self._size = 0  # rows in the arrays, tombstones included
+        self._n_deleted = 0
+        self._version = 0
+        self._compaction: Optional[asyncio.Task] = None
+        self._owner = self  # the writable store; snapshots point back to it
+        self._write_lock = threading.RLock()
+        self._publish()
+
+    def _publish(self) -> None:
+        """Make the current state visible to readers as a new immutable snapshot."""
+        snapshot = copy.copy(self)
+        snapshot._snapshot = snapshot
+        self._snapshot = snapshot
+
+    def snapshot(self) -> "VectorDatabase":
+        """Read-only view of the store as of the last completed write."""
+        return self._snapshot
+
+    def _own(self, *names: str) -> None:
+        """Replace indexes still shared with the published snapshot by copies, before changing their counters."""
+        for name in names:
+            value = getattr(self, name)
+            if value is not None and value is getattr(self._snapshot, name):
+                setattr(self, name, value.copy())
+
+    @_reads_snapshot
+    def __len__(self) -> int:
+        return self._size - self._n_deleted
+
+    @_reads_snapshot
+    def __contains__(self, key) -> bool:
+        return self._row_of(key) is not None
+
+    @_reads_snapshot
+    def keys(self) -> List[str]:
+        """Stored keys in row order."""
+        keys = self._keys[: self._size]
+        if not self._n_deleted:
+            return keys
+        return [key for key, dead in zip(keys, self._dead_rows().tolist()) if not dead]
+
+    @_reads_snapshot
+    def ids(self) -> np.ndarray:
+        """Ids of the stored rows in row order."""
+        return self._ids[: self._size][~self._dead_rows()]
+
+    @_reads_snapshot
+    def id_of(self, key: str) -> Optional[int]:
+        row = self._row_of(key)
+        return None if row is None else int(self._ids[row])
+
+    @property
+    @_reads_snapshot
+    def tombstone_ratio(self) -> float:
+        """Fraction of rows deleted but not yet compacted away."""
+        return self._n_deleted / self._size if self._size else 0.0
+
+    def _dead_rows(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Tombstone mask of ``rows`` (or every row when None) as of this version."""
+        deleted_in = self._deleted_in[: self._size] if rows is None else self._deleted_in[rows]
+        return deleted_in <= self._version
+
+    def _is_live(self, row: int) -> bool:
+        return row < self._size and self._deleted_in[row] > self._version
+
+    def _row_of(self, key_or_id) -> Optional[int]:
+        """Row of a live chunk, given its text or its id."""
+        if not isinstance(key_or_id, str):
+            return self._latest_live(self._id_to_row.get(int(key_or_id)))
+        return self._latest_live(self._digest_to_row.get(_key_digest(key_or_id)), key_or_id)
+
+    def _latest_live(self, rows, key: Optional[str] = None) -> Optional[int]:
+        """Newest of ``rows`` (one row, a list or None) that is live in this version and, if given, holds ``key``."""
+        if rows is None:
+            return None
+        for row in reversed(rows) if isinstance(rows, list) else (rows,):
+            if self._is_live(row) and (key is None or self._keys[row] == key):
+                return row
+        return None
+
+    @staticmethod
+    def _add_lookup(lookup: Dict[int, object], name: int, row: int) -> None:
+        """Record ``row`` under ``name``, growing the entry in place so published snapshots can keep reading it."""
+        rows = lookup.get(name)
+        if rows is None:
+            lookup[name] = row
+        elif isinstance(rows, list):
+            rows.append(row)
+        else:
+            lookup[name] = [rows, row]
+
+    @property
+    @_reads_snapshot
+    def version(self) -> int:
+        """Counter bumped by every insert, metadata update and delete, for invalidating caches of results."""
+        return self._version
+
+    @property
+    def embedding_model(self) -> EmbeddingModel:
+        """The query/document embedder, created on first use so ``load`` stays cheap."""
+        # Settings live on the writable store, so snapshots pick up a model set after they were taken.
+        owner = self._owner
+        if owner._embedding_model is None:
+            if owner._embeddings_model_name:
+                owner._embedding_model = EmbeddingModel(owner._embeddings_model_name)
+            else:
+                owner._embedding_model = EmbeddingModel()
+        return owner._embedding_model
+
+    @embedding_model.setter
+    def embedding_model(self, embedding_model: EmbeddingModel) -> None:
+        self._owner._embedding_model = embedding_model
+
+    @property
+    def ann_index(self) -> Optional[IVFIndex]:
+        """The approximate index, or None for exact-only stores."""
+        return self._ann
+
+    @property
+    def bm25_index(self) -> Optional[BM25Index]:
+        """The lexical index, or None when the store was built without ``bm25``."""
+        return self._bm25
+
+    @_writes
+    def enable_bm25(self) -> None:
+        """Build the BM25 index from the stored chunks, e.g. for a store saved without one."""
+        if self._bm25 is None:
+            self._bm25 = BM25Index()
+            self._bm25.add_many(range(self._size), self._keys[: self._size])
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    @property
+    def has_full_precision(self) -> bool:
+        return self._matrix is not None
+
+    @property
+    @_reads_snapshot
+    def matrix(self) -> np.ndarray:
+        """Read-only L2-normalised embedding matrix (dequantised when only codes are kept)."""
+        view = self._unit_rows(None)
+        view.flags.writeable = False
+        return view
+
+    def _unit_rows(self, rows: Optional[np.ndarray]) -> np.ndarray:
+        """Float32 unit vectors for ``rows`` (or every row when None)."""
+        if self._matrix is not None:
+            return self._matrix[: self._size] if rows is None else self._matrix[rows]
+        codes = self._codes[: self._size] if rows is None else self._codes[rows]
+        scales = self._scales[: self._size] if rows is None else self._scales[rows]
+        return codes.astype(np.float32) * scales[:, None]
+
+    @property
+    @_reads_snapshot
+    def vectors(self) -> Dict[str, Tuple[np.array, dict]]:
+        """Mapping of text -> (vector, metadata), kept for backwards compatibility."""
+        return {key: self.retrieve_from_key(key) for key in self.keys()}
+
+    _VECTOR_ARRAYS = ("_matrix", "_codes", "_scales", "_norms", "_row_means", "_centered_norms")
+    _ROW_ARRAYS = _VECTOR_ARRAYS + ("_ids", "_deleted_in")
+
+    def _ensure_capacity(self, dim: int, extra: int) -> None:
+        if self._size == 0:
+            self._dim = dim
+        if dim != self._dim:
+            raise ValueError(f"Vector dimension {dim} does not match database dimension {self._dim}")
+        needed = self._size + extra
+        capacity = self._norms.shape[0]
+        arrays = [(name, getattr(self, name)) for name in self._ROW_ARRAYS if getattr(self, name) is not None]
+        if needed <= capacity and all(array.flags.writeable for _, array in arrays):
+            return
+        # A read-only memory-mapped store is copied into RAM on first write.
+        new_capacity = max(needed, 2 * capacity, 16) if needed > capacity else capacity
+        for name, array in arrays:
+            shape = (new_capacity, dim) if array.ndim == 2 else (new_capacity,)
+            setattr(self, name, self._grow(array, shape))
+
+    def _grow(self, array: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+        grown = np.zeros(shape, dtype=array.dtype)
+        if self._size:
+            grown[: self._size] = array[: self._size]
+        return grown
+
+    def _write_rows(self, rows: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        """Normalise ``vectors`` into ``rows`` and return the unit vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        safe_norms = np.where(norms > 0, norms, 1.0).astype(np.float32)
+        unit = vectors / safe_norms[:, None]
+        means = unit.mean(axis=1)
+        if self._matrix is not None:
+            self._matrix[rows] = unit
+        if self._codes is not None:
+            max_abs = np.abs(unit).max(axis=1)
+            scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+            self._codes[rows] = np.clip(np.rint(unit / scales[:, None]), -127, 127).astype(np.int8)
+            self._scales[rows] = scales
+        self._norms[rows] = norms
+        self._row_means[rows] = means
+        self._centered_norms[rows] = np.sqrt(
+            np.maximum((unit * unit).sum(axis=1) - unit.shape[1] * means * means, 0.0)
+        )
+        return unit
+
+    def insert_many(self, keys: List[str], vectors: np.ndarray, metadata_list: List[dict] = None) -> np.ndarray:
+        """Insert a batch of vectors, normalising them in a single vectorised pass.
+
+        Chunk text is the key: a key that is already stored is replaced and
+        keeps its id, as with ``upsert``.
+
+        :return: The id of each row
+        """
+        return self.upsert(keys, vectors, metadata_list)
+
+    @_writes
+    def upsert(
+        self,
+        keys: List[str],
+        vectors: np.ndarray,
+        metadata_list: List[dict] = None,
+        ids: Optional[Iterable[int]] = None,
+    ) -> np.ndarray:
+        """Insert rows, or replace the stored rows they match.
 
-    def insert(self, key: str, vector: np.array, metadata: dict = None) -> None:
-        self.vectors[key] = (vector, metadata or {})
+        Rows match by text, or by id when ``ids`` are given. A replacement is
+        appended as a new row that keeps the id; the old row becomes a tombstone.
 
+        :param keys: Chunk texts
+        :param vectors: (N, dim) embeddings
+        :param metadata_list: Metadata per row
+        :param ids: Optional ids to insert or replace; new rows otherwise get fresh ids
+        :return: The id of each row
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if metadata_list is None:
+            metadata_list = [{} for _ in keys]
+        if ids is not None:
+            ids = [int(row_id) for row_id in ids]
+        if not (len(keys) == len(vectors) == len(metadata_list)) or (ids is not None and len(ids) != len(keys)):
+            raise ValueError("keys, vectors, metadata_list and ids must have the same length")
+        if not keys:
+            return np.empty(0, dtype=np.int64)
+        if ids is not None:
+            # Check every row before changing any, so a conflicting batch leaves the store untouched.
+            claimed: Dict[str, int] = {}
+            for key, row_id in zip(keys, ids):
+                holder = self._row_of(key)
+                holder = None if holder is None else int(self._ids[holder])
+                if claimed.setdefault(key, row_id) != row_id or holder not in (None, row_id):
+                    raise ValueError(f"Key {key[:40]!r} is already stored under another id")
+        self._ensure_capacity(vectors.shape[1], len(keys))
+        self._own("_metadata_index")
+        self._version += 1  # tombstones are stamped with the version being written
+
+        row_ids = np.empty(len(keys), dtype=np.int64)
+        first_new_row = self._size
+        for i, (key, metadata) in enumerate(zip(keys, metadata_list)):
+            replaced = self._row_of(key if ids is None else ids[i])
+            row_id = ids[i] if ids is not None else None
+            if replaced is not None:
+                row_id = int(self._ids[replaced])
+                self._tombstone(replaced)
+            row_ids[i] = self._append_row(key, metadata, self._next_id if row_id is None else row_id)
+        unit = self._write_rows(np.arange(first_new_row, self._size), vectors)
+        self._index_new_rows(first_new_row, unit)
+        return row_ids
+
+    def _append_row(self, key: str, metadata: dict, row_id: int) -> int:
+        """Add the bookkeeping for a new last row (the caller writes its vector) and return its id."""
+        row = self._size
+        self._next_id = max(self._next_id, row_id + 1)
+        self._ids[row] = row_id
+        self._deleted_in[row] = self.LIVE
+        self._add_lookup(self._id_to_row, row_id, row)
+        self._add_lookup(self._digest_to_row, _key_digest(key), row)
+        self._keys.append(key)
+        self._metadata.append(metadata or {})
+        self._metadata_index.add(row, self._metadata[row])
+        self._size += 1
+        return row_id
+
+    def _index_new_rows(self, first_new_row: int, unit: np.ndarray) -> None:
+        """Add rows ``first_new_row`` onwards, with unit vectors ``unit``, to the BM25 and IVF indexes."""
+        self._own("_bm25", "_ann")
+        if self._bm25 is not None:
+            self._bm25.add_many(range(first_new_row, self._size), self._keys[first_new_row:])
+        if self._ann is not None:
+            if self._ann.needs_training(self._size):
+                self._ann.train(self._unit_rows(None))
+            elif self._ann.is_trained:
+                self._ann.add(np.arange(first_new_row, self._size), unit, self._size)
+
+    def insert(self, key: str, vector: np.array, metadata: dict = None) -> int:
+        return int(self.insert_many([key], np.asarray(vector)[None, :], [metadata or {}])[0])
+
+    @_writes
+    def update_metadata(self, key, metadata: dict) -> None:
+        """Replace the metadata of ``key`` (a text or an id) without touching its vector.
+
+        Like ``upsert``, this appends the row again and tombstones the old one.
+        """
+        row = self._row_of(key)
+        if row is None:
+            raise KeyError(key)
+        self._ensure_capacity(self._dim, 1)
+        self._own("_metadata_index")
+        self._version += 1
+        self._tombstone(row)
+        new_row = self._size
+        self._append_row(self._keys[row], metadata, int(self._ids[row]))
+        for name in self._VECTOR_ARRAYS:
+            array = getattr(self, name)
+            if array is not None:
+                array[new_row] = array[row]
+        self._index_new_rows(new_row, self._unit_rows(np.array([new_row])))
+
+    def _tombstone(self, row: int) -> None:
+        """Delete ``row`` from the version being written; callers bump ``_version`` first."""
+        self._deleted_in[row] = self._version
+        self._n_deleted += 1
+
+    @_writes
+    def delete_many(self, keys: Iterable) -> int:
+        """Remove rows by text or id (unknown ones are ignored) and return how many were deleted.
+
+        Rows are only marked deleted; see ``compact``.
+        """
+        rows = {self._row_of(key) for key in keys} - {None}
+        if rows:
+            self._version += 1
+            for row in rows:
+                self._tombstone(row)
+            self._maybe_compact()
+        return len(rows)
+
+    def delete(self, key) -> bool:
+        return self.delete_many([key]) == 1
+
+    def _maybe_compact(self) -> None:
+        if self.compact_threshold is None or self._n_deleted < self.compact_threshold * self._size:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.compact()
+            return
+        if self._compaction is None or self._compaction.done():
+            self._compaction = loop.create_task(self.acompact())
+
+    @_writes
+    def compact(self) -> int:
+        """Rebuild the arrays and indexes without tombstoned rows; return how many rows were dropped.
+
+        Remaining rows keep their ids and relative order.
+        """
+        removed = self._n_deleted
+        if removed:
+            self._apply_compaction(self._build_compaction())
+        return removed
+
+    async def acompact(self) -> int:
+        """``compact`` with the arrays rebuilt on a worker thread, so the event loop keeps serving searches.
+
+        The rebuild reads the published snapshot, which no writer changes. A
+        write that lands meanwhile makes the result stale, in which case the
+        compaction is redone synchronously.
+        """
+        view = self._snapshot
+        if not view._n_deleted:
+            return 0
+        state = await asyncio.to_thread(view._build_compaction)
+        with self._write_lock:
+            if self._version != view._version:
+                return self.compact()
+            self._apply_compaction(state)
+            self._publish()
+        return view._n_deleted
+
+    def _build_compaction(self) -> dict:
+        """The row arrays, row lists and lookups without tombstoned rows, leaving this store untouched."""
+        size = self._size
+        kept = np.flatnonzero(~self._dead_rows())
+        new_row = np.full(size, -1, dtype=np.int64)
+        new_row[kept] = np.arange(len(kept))
+        arrays = {
+            name: getattr(self, name)[:size][kept] for name in self._ROW_ARRAYS if getattr(self, name) is not None
+        }
+        arrays["_deleted_in"][:] = self.LIVE
+        metadata = [self._metadata[row] for row in kept.tolist()]
+        metadata_index = MetadataIndex()
+        for row, row_metadata in enumerate(metadata):
+            metadata_index.add(row, row_metadata)
+        # Re-use the digests rather than re-hashing every text. A writer may be adding
+        # entries meanwhile; list() copies the items in one step and later rows are skipped.
+        digest_to_row: Dict[int, object] = {}
+        for digest, rows in list(self._digest_to_row.items()):
+            for row in rows if isinstance(rows, list) else (rows,):
+                if row < size and new_row[row] >= 0:
+                    self._add_lookup(digest_to_row, digest, int(new_row[row]))
+        trained = self._ann is not None and self._ann.is_trained
+        return {
+            "kept": kept,
+            "arrays": arrays,
+            "keys": [self._keys[row] for row in kept.tolist()],
+            "metadata": metadata,
+            "metadata_index": metadata_index,
+            "digest_to_row": digest_to_row,
+            "id_to_row": dict(zip(arrays["_ids"].tolist(), range(len(kept)))),
+            "assignments": self._ann.assignments[:size][kept] if trained else None,
+        }
+
+    def _apply_compaction(self, state: dict) -> None:
+        for name, array in state["arrays"].items():
+            setattr(self, name, array)
+        self._keys, self._metadata = state["keys"], state["metadata"]
+        self._metadata_index = state["metadata_index"]
+        self._digest_to_row = state["digest_to_row"]
+        self._id_to_row = state["id_to_row"]
+        self._own("_bm25", "_ann")
+        if state["assignments"] is not None:
+            self._ann.set_assignments(state["assignments"])
+        if self._bm25 is not None:
+            self._bm25.compact(state["kept"])
+        self._size = len(state["kept"])
+        self._n_deleted = 0
+        # Row numbers changed, so anything holding rows (e.g. sharded workers) must refresh.
+        self._version += 1
+
+    def _dot(self, queries: np.ndarray, rows: Optional[np.ndarray], full_precision: bool) -> np.ndarray:
+        """(Q, dim) queries times the unit rows, using int8 codes unless ``full_precision``."""
+        if self._codes is None or (full_precision and self._matrix is not None):
+            matrix = self._matrix[: self._size] if rows is None else self._matrix[rows]
+            return queries @ matrix.T
+
+        # Asymmetric scoring: float32 queries against int8 codes, one block at a time
+        # so the dequantised copy never exceeds QUANTIZED_BLOCK_ROWS rows.
+        n_rows = self._size if rows is None else len(rows)
+        products = np.empty((len(queries), n_rows), dtype=np.float32)
+        for start in range(0, n_rows, self.QUANTIZED_BLOCK_ROWS):
+            block = slice(start, min(start + self.QUANTIZED_BLOCK_ROWS, n_rows))
+            block_rows = block if rows is None else rows[block]
+            codes = self._codes[block_rows].astype(np.float32)
+            products[:, block] = (queries @ codes.T) * self._scales[block_rows]
+        return products
+
+    def _score_rows(
+        self,
+        query_vectors: np.ndarray,
+        rows: Optional[np.ndarray],
+        distance_metric: Callable,
+        full_precision: bool = False,
+    ) -> np.ndarray:
+        """Score a (Q, dim) block of queries against ``rows`` (or every row when None).
+
+        Returns a (Q, n_rows) array computed with a single matrix product for
+        the built-in metrics. Quantised stores score against their int8 codes
+        unless ``full_precision`` is requested and float32 rows are available.
+        """
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+
+        if distance_metric is cosine_similarity:
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            return self._dot(queries / norms, rows, full_precision)
+
+        if distance_metric is pearson_correlation:
+            centered = queries - queries.mean(axis=1, keepdims=True)
+            norms = np.linalg.norm(centered, axis=1, keepdims=True)
+            centered_norms = self._centered_norms[: self._size] if rows is None else self._centered_norms[rows]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return self._dot(centered, rows, full_precision) / (norms * centered_norms[None, :])
+
+        # Arbitrary callables fall back to scoring each reconstructed vector.
+        matrix = self._unit_rows(rows)
+        norms = self._norms[: self._size] if rows is None else self._norms[rows]
+        return np.array(
+            [
+                [distance_metric(query, vector * norm) for vector, norm in zip(matrix, norms)]
+                for query in np.atleast_2d(np.asarray(query_vectors))
+            ],
+            dtype=np.float64,
+        ).reshape(len(queries), len(matrix))
+
+    def _rank(
+        self,
+        query_vectors: np.ndarray,
+        rows: Optional[np.ndarray],
+        k: int,
+        distance_metric: Callable,
+        exact: bool,
+        rerank: bool = True,
+    ) -> List[List[Tuple[str, float, dict]]]:
+        """Top-k hits for each query among ``rows``, re-ranking quantised scores when enabled."""
+        scores = self._score_rows(query_vectors, rows, distance_metric, full_precision=exact)
+        if rows is None and self._n_deleted:
+            # Masking tombstones is cheaper than gathering the live rows into a copy.
+            scores[:, self._dead_rows()] = -np.inf
+        rerank = (
+            rerank
+            and not exact
+            and self._codes is not None
+            and self._matrix is not None
+            and self._owner.rerank_candidates > 0
+        )
+        results = []
+        for position, query in enumerate(np.atleast_2d(query_vectors)):
+            if not rerank:
+                results.append(self._collect(scores[position], rows, k))
+                continue
+            shortlist = top_k_indices(scores[position], max(k, self._owner.rerank_candidates))
+            shortlist_rows = np.sort(shortlist if rows is None else rows[shortlist])
+            exact_scores = self._score_rows(query, shortlist_rows, distance_metric, full_precision=True)[0]
+            results.append(self._collect(exact_scores, shortlist_rows, k))
+        return results
+
+    def _collect(self, scores: np.ndarray, rows: Optional[np.ndarray], k: int) -> List[Tuple[str, float, dict]]:
+        best = top_k_indices(scores, k)
+        row_ids = best if rows is None else rows[best]
+        if self._n_deleted:
+            live = ~self._dead_rows(row_ids)
+            best, row_ids = best[live], row_ids[live]
+        return [
+            (self._keys[row], float(scores[i]), self._metadata[row])
+            for i, row in zip(best, row_ids)
+        ]
+
+    def _filter_rows(self, metadata_filter: dict) -> np.ndarray:
+        """Sorted row ids matching ``metadata_filter``."""
+        if self._metadata_index.supports(metadata_filter):
+            rows = self._metadata_index.lookup(metadata_filter)
+            return rows[~self._dead_rows(rows)] if self._n_deleted else rows
+        return np.fromiter(
+            (
+                row
+                for row, metadata in enumerate(self._metadata[: self._size])
+                if self._is_live(row) and all(metadata.get(fk) == fv for fk, fv in metadata_filter.items())
+            ),
+            dtype=np.int64,
+        )
+
+    @_reads_snapshot
     def search(
         self,
         query_vector: np.array,
         k: int,
         distance_metric: Callable = pearson_correlation,
         metadata_filter: dict = None,
+        exact: bool = False,
+        mmr_lambda: Optional[float] = None,
+        merge_adjacent: bool = False,
+    ) -> List[Tuple[str, float, dict]]:
+        """Top-k stored chunks for ``query_vector``.
+
+        :param mmr_lambda: Select by maximal marginal relevance with this weight
+            on relevance (1.0 is plain top-k, lower favours diversity); None disables
+        :param merge_adjacent: Merge overlapping or adjacent chunks of the same
+            source into one block (see ``merge_adjacent_hits``)
+        """
+        if self._size == 0:
+            return []
+        rows = self._filter_rows(metadata_filter) if metadata_filter else None
+        depth = k * self.MMR_FETCH_FACTOR if mmr_lambda is not None else k
+        if not exact:
+            rows = self._restrict_to_candidates(query_vector, rows, depth)
+        if rows is not None and rows.size == 0:
+            return []
+        hits = self._rank(query_vector, rows, depth, distance_metric, exact)[0]
+        return self._select(hits, k, mmr_lambda, merge_adjacent)
+
+    def _select(
+        self,
+        hits: List[Tuple[str, float, dict]],
+        k: int,
+        mmr_lambda: Optional[float],
+        merge_adjacent: bool,
+        scale_scores: bool = False,
+    ) -> List[Tuple[str, float, dict]]:
+        if mmr_lambda is not None:
+            hits = self._mmr(hits, k, mmr_lambda, scale_scores)
+        return merge_adjacent_hits(hits) if merge_adjacent else hits
+
+    def _mmr(
+        self, hits: List[Tuple[str, float, dict]], k: int, mmr_lambda: float, scale_scores: bool
     ) -> List[Tuple[str, float, dict]]:
-        scores = []
-        for key, (vector, metadata) in self.vectors.items():
-            # Skip if doesn't match filter
-            if metadata_filter:
-                if not all(metadata.get(fk) == fv for fk, fv in metadata_filter.items()):
-                    continue
-            scores.append((key, distance_metric(query_vector, vector), metadata))
-        return sorted(scores, key=lambda x: x[1], reverse=True)[:k]
+        """Greedy maximal-marginal-relevance selection of ``k`` of the ranked ``hits``.
 
+        Each step picks the candidate maximising ``mmr_lambda * relevance -
+        (1 - mmr_lambda) * (highest cosine similarity to an already selected
+        candidate)``. Candidate-candidate similarities come from one product
+        of the stored unit rows.
+        """
+        if not 0 <= mmr_lambda <= 1:
+            raise ValueError("mmr_lambda must be in [0, 1]")
+        if len(hits) <= 1:
+            return hits[:k]
+        relevance = np.array([hit[1] for hit in hits], dtype=np.float64)
+        if scale_scores:
+            # Fused and BM25 scores are not similarities, so bring them to the same [0, 1] range.
+            spread = relevance.max() - relevance.min()
+            relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones_like(relevance)
+        unit = self._unit_rows(np.array([self._row_of(hit[0]) for hit in hits]))
+        similarity = unit @ unit.T
+        selected = [int(np.argmax(relevance))]
+        max_similarity = similarity[selected[0]].astype(np.float64)
+        available = np.ones(len(hits), dtype=bool)
+        available[selected[0]] = False
+        for _ in range(min(k, len(hits)) - 1):
+            marginal = mmr_lambda * relevance - (1 - mmr_lambda) * max_similarity
+            marginal[~available] = -np.inf
+            chosen = int(np.argmax(marginal))
+            selected.append(chosen)
+            available[chosen] = False
+            np.maximum(max_similarity, similarity[chosen], out=max_similarity)
+        return [hits[i] for i in selected]
+
+    def _restrict_to_candidates(
+        self, query_vectors: np.ndarray, rows: Optional[np.ndarray], k: int
+    ) -> Optional[np.ndarray]:
+        """Intersect ``rows`` with the ANN candidates for the queries, if an index is active.
+
+        Filtered ``rows`` no larger than the probe would scan are returned
+        as they are, to be scored exactly. Otherwise the probe is widened
+        until at least ``k`` filtered rows are candidates, so a selective
+        filter still yields k hits when k rows match it.
+        """
+        if self._ann is None or not self._ann.is_trained:
+            return rows
+        if rows is not None and len(rows) <= self._ann.expected_candidates():
+            return rows
+        nprobe = self._ann.nprobe
+        while True:
+            candidates = self._ann.candidates(query_vectors, nprobe)
+            if self._n_deleted:
+                candidates = candidates[~self._dead_rows(candidates)]
+            if rows is None:
+                return candidates
+            restricted = np.intersect1d(rows, candidates, assume_unique=True)
+            if len(restricted) >= min(k, len(rows)) or nprobe >= len(self._ann.centroids):
+                return restricted
+            nprobe *= 2
+
+    @_reads_snapshot
+    def search_many(
+        self,
+        queries: List,
+        k: int,
+        distance_metric: Callable = pearson_correlation,
+        metadata_filter=None,
+        return_as_text: bool = False,
+        exact: bool = False,
+        mode: str = "dense",
+        fusion: str = "rrf",
+        alpha: float = 0.5,
+        mmr_lambda: Optional[float] = None,
+        merge_adjacent: bool = False,
+        query_vectors: Optional[np.ndarray] = None,
+    ) -> List[List[Tuple[str, float, dict]]]:
+        """Search several queries at once.
+
+        Text queries are de-duplicated and embedded in one
+        ``get_embeddings`` call. Queries that share a metadata filter are
+        scored with a single matrix-matrix product against only the rows that
+        filter selects.
+
+        :param queries: Query strings or query vectors
+        :param k: Number of results to return per query
+        :param distance_metric: Similarity function, as for ``search``
+        :param metadata_filter: None, one filter dict applied to every query,
+            or a list of filter dicts (or None) aligned with ``queries``
+        :param return_as_text: Return only the matched texts
+        :param exact: Bypass the ANN index and quantisation and score every
+            (filtered) row at full precision
+        :param mode: "dense" for embedding similarity, "lexical" for BM25 or
+            "hybrid" for both fused; the last two need text queries and ``bm25=True``
+        :param fusion: With ``mode="hybrid"``, "rrf" (reciprocal rank fusion) or "weighted"
+        :param alpha: Weight of the dense scores for ``fusion="weighted"``
+        :param mmr_lambda: Select by maximal marginal relevance, as for ``search``
+        :param merge_adjacent: Merge adjacent chunks of a source, as for ``search``
+        :param query_vectors: Embeddings of the queries, aligned with them, when the
+            caller already has them (e.g. from a cache lookup); skips embedding
+        :return: One result list per query, in query order; hybrid scores are fusion scores
+        """
+        if mode not in self.SEARCH_MODES:
+            raise ValueError(f"Unknown mode: {mode}. Must be one of {self.SEARCH_MODES}")
+        if fusion not in self.FUSION_METHODS:
+            raise ValueError(f"Unknown fusion: {fusion}. Must be one of {self.FUSION_METHODS}")
+        if mode != "dense":
+            if self._bm25 is None:
+                raise ValueError(f"mode={mode!r} needs a store built with bm25=True")
+            if not all(isinstance(query, str) for query in queries):
+                raise ValueError(f"mode={mode!r} needs text queries")
+        if isinstance(metadata_filter, dict) or metadata_filter is None:
+            filters = [metadata_filter] * len(queries)
+        else:
+            filters = list(metadata_filter)
+            if len(filters) != len(queries):
+                raise ValueError("metadata_filter list must be aligned with queries")
+        if query_vectors is not None and len(query_vectors) != len(queries):
+            raise ValueError("query_vectors must be aligned with queries")
+        if not queries:
+            return []
+
+        if mode == "lexical":
+            query_vectors = None
+        elif query_vectors is None:
+            query_vectors = self._embed_queries(queries)
+        else:
+            query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        if self._size == 0:
+            return [[] for _ in queries]
+
+        # Queries sharing a filter are scored together against only their rows.
+        groups: Dict[object, List[int]] = {}
+        group_filters: Dict[object, dict] = {}
+        for i, query_filter in enumerate(filters):
+            group_key = self._filter_group_key(query_filter, i)
+            groups.setdefault(group_key, []).append(i)
+            group_filters[group_key] = query_filter
+
+        results: List[List] = [[] for _ in queries]
+        for group_key, query_ids in groups.items():
+            query_filter = group_filters[group_key]
+            rows = self._filter_rows(query_filter) if query_filter else None
+            if rows is not None and rows.size == 0:
+                continue
+            # Candidates kept for MMR, which then chooses k of them.
+            select_k = k * self.MMR_FETCH_FACTOR if mmr_lambda is not None else k
+            depth = select_k if mode == "dense" else max(select_k, self.FUSION_CANDIDATES)
+            dense = [[] for _ in query_ids]
+            if mode != "lexical":
+                dense_rows = rows if exact else self._restrict_to_candidates(query_vectors[query_ids], rows, select_k)
+                if dense_rows is None or dense_rows.size:
+                    dense = self._rank(query_vectors[query_ids], dense_rows, depth, distance_metric, exact)
+            for position, i in enumerate(query_ids):
+                if mode == "dense":
+                    hits = dense[position]
+                else:
+                    lexical = self._lexical_rank(queries[i], rows, depth)
+                    if mode == "lexical":
+                        hits = lexical[:select_k]
+                    elif fusion == "rrf":
+                        hits = reciprocal_rank_fusion([dense[position], lexical], select_k, self.RRF_K)
+                    else:
+                        hits = weighted_fusion(dense[position], lexical, select_k, alpha)
+                hits = self._select(hits, k, mmr_lambda, merge_adjacent, scale_scores=mode != "dense")
+                results[i] = [hit[0] for hit in hits] if return_as_text else hits
+        return results
+
+    def _lexical_rank(self, query_text: str, rows: Optional[np.ndarray], k: int) -> List[Tuple[str, float, dict]]:
+        """Top-k BM25 hits among ``rows``, leaving out rows that share no term with the query."""
+        scores = self._bm25.scores(query_text, rows, self._dead_rows() if self._n_deleted else None)
+        best = top_k_indices(scores, min(k, int(np.count_nonzero(scores))))
+        row_ids = best if rows is None else rows[best]
+        return [(self._keys[row], float(scores[i]), self._metadata[row]) for i, row in zip(best, row_ids)]
+
+    @staticmethod
+    def _filter_group_key(metadata_filter: Optional[dict], position: int):
+        if not metadata_filter:
+            return None
+        items = tuple(sorted(metadata_filter.items(), key=lambda item: item[0]))
+        return items if _is_hashable(items) else ("unhashable", position)
+
+    def _embed_queries(self, queries: List) -> np.ndarray:
+        """Embed text queries in one batch; vectors are passed through."""
+        if not any(isinstance(query, str) for query in queries):
+            return np.asarray(queries, dtype=np.float32)
+        unique_texts = list(dict.fromkeys(query for query in queries if isinstance(query, str)))
+        embedded = np.asarray(self.embedding_model.get_embeddings(unique_texts), dtype=np.float32)
+        lookup = {text: embedded[i] for i, text in enumerate(unique_texts)}
+        return np.stack(
+            [lookup[query] if isinstance(query, str) else np.asarray(query, dtype=np.float32) for query in queries]
+        )
+
+    @_reads_snapshot
     def search_by_text(
         self,
         query_text: str,
@@ -49,30 +1139,288 @@ class VectorDatabase:
         distance_metric: Callable = pearson_correlation,
         return_as_text: bool = False,
         metadata_filter: dict = None,
+        mode: str = "dense",
+        fusion: str = "rrf",
+        alpha: float = 0.5,
+        mmr_lambda: Optional[float] = None,
+        merge_adjacent: bool = False,
+        query_vector: Optional[np.ndarray] = None,
     ) -> List[Tuple[str, float, dict]]:
-        query_vector = self.embedding_model.get_embedding(query_text)
-        results = self.search(query_vector, k, distance_metric, metadata_filter)
+        """Top-k chunks for ``query_text``; ``query_vector``, if given, is used instead of embedding it."""
+        if mode != "dense":
+            return self.search_many(
+                [query_text], k, distance_metric, metadata_filter, return_as_text,
+                mode=mode, fusion=fusion, alpha=alpha, mmr_lambda=mmr_lambda, merge_adjacent=merge_adjacent,
+                query_vectors=None if query_vector is None else [query_vector],
+            )[0]
+        if query_vector is None:
+            query_vector = self.embedding_model.get_embedding(query_text)
+        results = self.search(
+            query_vector, k, distance_metric, metadata_filter, mmr_lambda=mmr_lambda, merge_adjacent=merge_adjacent
+        )
         return [result[0] for result in results] if return_as_text else results
 
+    @_reads_snapshot
     def get_unique_metadata_values(self, key: str) -> List[str]:
         """Get all unique values for a metadata key across all vectors."""
-        values = set()
-        for _, (_, metadata) in self.vectors.items():
-            if key in metadata:
-                values.add(metadata[key])
-        return list(values)
+        return self._metadata_index.values(key, self._is_live)
+
+    @_reads_snapshot
+    def retrieve_from_key(self, key) -> Tuple[np.array, dict]:
+        """(vector, metadata) of ``key``, a text or an id, or None if it is not stored."""
+        row = self._row_of(key)
+        if row is None:
+            return None
+        return self._unit_rows(np.array([row]))[0] * self._norms[row], self._metadata[row]
+
+    @_reads_snapshot
+    def quantization_stats(self, query_vectors: np.ndarray = None, k: int = 10) -> dict:
+        """Report memory use of the stored vectors and, given sample queries, recall.
+
+        :param query_vectors: Optional (Q, dim) sample queries for measuring recall@k
+            of the quantised scan against full-precision search
+        :param k: Cutoff for the recall measurement
+        :return: Dict with byte counts, the compression ratio and, when
+            measurable, ``recall_at_k`` (codes only) and ``recall_at_k_reranked``
+        """
+        float32_bytes = self._size * self._dim * 4
+        if self._codes is not None:
+            scan_bytes = self._size * (self._dim * self._codes.itemsize + self._scales.itemsize)
+        else:
+            scan_bytes = float32_bytes
+        in_ram_full = self._matrix is not None and not isinstance(self._matrix, np.memmap)
+        stats = {
+            "quantization": self.quantization,
+            "rows": self._size,
+            "dim": self._dim,
+            "float32_bytes": float32_bytes,
+            "scan_bytes": scan_bytes,
+            "full_precision_bytes_in_ram": float32_bytes if in_ram_full and self._codes is not None else 0,
+            "compression_ratio": float32_bytes / scan_bytes if scan_bytes else 1.0,
+        }
+        if query_vectors is None or self._codes is None or self._matrix is None or self._size == 0:
+            return stats
+
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        exact = self._rank(queries, None, k, cosine_similarity, exact=True)
+        approximate = self._rank(queries, None, k, cosine_similarity, exact=False, rerank=False)
+        stats["recall_at_k"] = self._recall(approximate, exact)
+        if self._owner.rerank_candidates > 0:
+            reranked = self._rank(queries, None, k, cosine_similarity, exact=False)
+            stats["recall_at_k_reranked"] = self._recall(reranked, exact)
+        return stats
 
-    def retrieve_from_key(self, key: str) -> Tuple[np.array, dict]:
-        return self.vectors.get(key, None)
+    @staticmethod
+    def _recall(results: List[List[Tuple[str, float, dict]]], truth: List[List[Tuple[str, float, dict]]]) -> float:
+        recalls = []
+        for hits, expected in zip(results, truth):
+            expected_keys = {hit[0] for hit in expected}
+            recalls.append(len({hit[0] for hit in hits} & expected_keys) / max(len(expected_keys), 1))
+        return float(np.mean(recalls))
+
+    @staticmethod
+    def _save_array(path: str, name: str, array: np.ndarray) -> None:
+        # Write then rename: the store being saved may be memory-mapped from this same file.
+        temp_path = os.path.join(path, name + ".tmp")
+        with open(temp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(temp_path, os.path.join(path, name))
+
+    @_reads_snapshot
+    def save(self, path: str) -> None:
+        """Persist the store to directory ``path``.
+
+        Writes the normalised embeddings as a raw ``.npy`` matrix (plus int8
+        codes and scales for quantised stores), the per-row statistics used
+        for scoring alongside it, row ids and tombstones, the BM25 postings
+        when the store keeps them, and keys plus metadata to a JSON sidecar.
+        Files are replaced by rename, so saving a store over the directory it
+        was memory-mapped from is safe.
+        """
+        os.makedirs(path, exist_ok=True)
+        if self._matrix is not None:
+            self._save_array(path, "embeddings.npy", self._matrix[: self._size])
+        if self._codes is not None:
+            self._save_array(path, "codes.npy", self._codes[: self._size])
+            self._save_array(path, "scales.npy", self._scales[: self._size])
+        self._save_array(
+            path,
+            "row_stats.npy",
+            np.stack([self._norms[: self._size], self._row_means[: self._size], self._centered_norms[: self._size]]),
+        )
+        self._save_array(path, "ids.npy", self._ids[: self._size])
+        self._save_array(path, "tombstones.npy", self._dead_rows())
+        if self._ann is not None and self._ann.is_trained:
+            self._save_array(path, "ivf_centroids.npy", self._ann.centroids)
+            self._save_array(path, "ivf_assignments.npy", self._ann.assignments[: self._size])
+        bm25_terms = None
+        if self._bm25 is not None:
+            bm25_terms, bm25_arrays = self._bm25.to_arrays()
+            for name, array in bm25_arrays.items():
+                self._save_array(path, f"bm25_{name}.npy", array)
+        owner = self._owner
+        model_name = owner._embeddings_model_name
+        if owner._embedding_model is not None:
+            model_name = getattr(owner._embedding_model, "embeddings_model_name", model_name)
+        sidecar = {
+            "format_version": self.STORE_FORMAT_VERSION,
+            "embeddings_model_name": model_name,
+            "dim": self.dim,
+            "count": self._size,
+            "index": self.index_type,
+            "nprobe": self._ann.nprobe if self._ann is not None else None,
+            "n_lists": self._ann.n_lists if self._ann is not None else None,
+            "quantization": self.quantization,
+            "rerank_candidates": owner.rerank_candidates,
+            "compact_threshold": owner.compact_threshold,
+            "next_id": self._next_id,
+            "bm25": None if self._bm25 is None else {"k1": self._bm25.k1, "b": self._bm25.b, "terms": bm25_terms},
+            "keys": self._keys[: self._size],
+            "metadata": self._metadata[: self._size],
+        }
+        with open(os.path.join(path, "store.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(sidecar, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(os.path.join(path, "store.json.tmp"), os.path.join(path, "store.json"))
+
+    @classmethod
+    def load(cls, path: str, embedding_model: EmbeddingModel = None, mmap: bool = True) -> "VectorDatabase":
+        """Load a store written by ``save``.
+
+        With ``mmap=True`` the embedding matrix is memory-mapped read-only, so
+        startup does not read the vectors and processes loading the same path
+        share one page-cached copy. The matrix is copied into RAM on the
+        first write. A trained IVF index is restored as saved. For quantised
+        stores saved with full-precision rows, those rows stay on disk and
+        are only paged in for re-ranking.
+
+        :param path: Directory previously passed to ``save``
+        :param embedding_model: Embedder for queries; defaults to the model recorded at save time
+        :param mmap: Memory-map the embeddings instead of reading them into RAM
+        """
+        with open(os.path.join(path, "store.json"), "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+        if sidecar.get("format_version") != cls.STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector store format: {sidecar.get('format_version')}")
+
+        db = cls(
+            embedding_model,
+            index=sidecar.get("index", "flat"),
+            nprobe=sidecar.get("nprobe") or 8,
+            n_lists=sidecar.get("n_lists"),
+            quantization=sidecar.get("quantization"),
+            rerank_candidates=sidecar.get("rerank_candidates", 0),
+            compact_threshold=sidecar.get("compact_threshold", 0.25),
+        )
+        db._embeddings_model_name = sidecar.get("embeddings_model_name")
+        mmap_mode = "r" if mmap else None
+        shape = (sidecar["count"], sidecar["dim"])
+        matrix_path = os.path.join(path, "embeddings.npy")
+        db._matrix = np.load(matrix_path, mmap_mode=mmap_mode).reshape(shape) if os.path.exists(matrix_path) else None
+        if db.quantization is not None:
+            db._codes = np.load(os.path.join(path, "codes.npy"), mmap_mode=mmap_mode).reshape(shape)
+            db._scales = np.load(os.path.join(path, "scales.npy"))
+        stats = np.load(os.path.join(path, "row_stats.npy"))
+
+        db._dim = sidecar["dim"]
+        db._norms, db._row_means, db._centered_norms = (np.ascontiguousarray(row) for row in stats)
+        db._keys = sidecar["keys"]
+        db._metadata = sidecar["metadata"]
+        db._size = sidecar["count"]
+        # Stores saved before ids existed number their rows in order.
+        ids_path = os.path.join(path, "ids.npy")
+        db._ids = np.load(ids_path) if os.path.exists(ids_path) else np.arange(db._size, dtype=np.int64)
+        tombstones_path = os.path.join(path, "tombstones.npy")
+        deleted = np.load(tombstones_path) if os.path.exists(tombstones_path) else np.zeros(db._size, dtype=bool)
+        db._deleted_in = np.where(deleted, 0, cls.LIVE).astype(np.int64)  # deleted as of version 0
+        db._n_deleted = int(deleted.sum())
+        db._next_id = sidecar.get("next_id", db._size)
+        for row in np.flatnonzero(~deleted).tolist():
+            db._add_lookup(db._id_to_row, int(db._ids[row]), row)
+            db._add_lookup(db._digest_to_row, _key_digest(db._keys[row]), row)
+            db._metadata_index.add(row, db._metadata[row])
+        centroids_path = os.path.join(path, "ivf_centroids.npy")
+        if db._ann is not None and os.path.exists(centroids_path):
+            db._ann.restore(np.load(centroids_path), np.load(os.path.join(path, "ivf_assignments.npy")))
+        bm25 = sidecar.get("bm25")
+        if bm25 is not None:
+            arrays = {
+                name: np.load(os.path.join(path, f"bm25_{name}.npy"))
+                for name in ("indptr", "rows", "frequencies", "lengths")
+            }
+            db._bm25 = BM25Index.from_arrays(bm25["terms"], arrays, k1=bm25["k1"], b=bm25["b"])
+        db._publish()
+        return db
 
     async def abuild_from_list(self, list_of_text: List[str], metadata_list: List[dict] = None) -> "VectorDatabase":
+        # Chunks may be TextSpan views; keys and the embedder need plain strings.
+        list_of_text = [str(text) for text in list_of_text]
         if metadata_list is None:
             metadata_list = [{} for _ in list_of_text]
         embeddings = await self.embedding_model.async_get_embeddings(list_of_text)
-        for text, embedding, metadata in zip(list_of_text, embeddings, metadata_list):
-            self.insert(text, np.array(embedding), metadata)
+        self.insert_many(list_of_text, np.asarray(embeddings, dtype=np.float32), metadata_list)
         return self
 
+    async def abuild_from_stream(
+        self,
+        chunks: Iterable[Tuple[str, dict]],
+        batch_size: int = 256,
+        max_pending_batches: int = 2,
+    ) -> "VectorDatabase":
+        """Embed and insert a lazily produced stream of (text, metadata) chunks.
+
+        Reading the stream (e.g. PDF parsing and splitting), embedding and
+        inserting run as three pipelined stages joined by bounded queues, so
+        peak memory is a few batches regardless of corpus size and parsing
+        overlaps with embedding.
+
+        :param chunks: Iterable of (text, metadata) pairs, such as
+            ``CharacterTextSplitter.split_stream(PDFFileLoader(path).iter_pages())``
+        :param batch_size: Chunks per embedding call
+        :param max_pending_batches: Batches buffered between stages
+        """
+        loop = asyncio.get_running_loop()
+        iterator = iter(chunks)
+        to_embed: asyncio.Queue = asyncio.Queue(maxsize=max_pending_batches)
+        to_insert: asyncio.Queue = asyncio.Queue(maxsize=max_pending_batches)
+
+        async def read() -> None:
+            while True:
+                # The source is synchronous, so pull each batch on a worker thread.
+                batch = await loop.run_in_executor(None, _take, iterator, batch_size)
+                if not batch:
+                    break
+                await to_embed.put(batch)
+            await to_embed.put(None)
+
+        async def embed() -> None:
+            while (batch := await to_embed.get()) is not None:
+                batch = [(str(text), metadata) for text, metadata in batch]
+                embeddings = await self.embedding_model.async_get_embeddings([text for text, _ in batch])
+                await to_insert.put((batch, embeddings))
+            await to_insert.put(None)
+
+        async def insert() -> None:
+            while (item := await to_insert.get()) is not None:
+                batch, embeddings = item
+                self.insert_many(
+                    [text for text, _ in batch],
+                    np.asarray(embeddings, dtype=np.float32),
+                    [metadata for _, metadata in batch],
+                )
+
+        stages = [asyncio.ensure_future(stage()) for stage in (read, embed, insert)]
+        done, pending = await asyncio.wait(stages, return_when=asyncio.FIRST_EXCEPTION)
+        # A failed stage would leave its neighbours blocked on a queue, so stop them.
+        for stage in pending:
+            stage.cancel()
+        for stage in done:
+            stage.result()
+        return self
+
+
+def _take(iterator: Iterator, n: int) -> list:
+    return list(islice(iterator, n))
+
 
 if __name__ == "__main__":
     list_of_text = [
@@ -0,0 +1,37 @@
+import hashlib
+from typing import List
+
+import numpy as np
+import pytest
+
+
+class HashEmbeddingModel:
+    """Deterministic stand-in for ``EmbeddingModel``: each text maps to a fixed vector seeded by its hash."""
+
+    embeddings_model_name = "hash-embedding"
+
+    def __init__(self, dim: int = 32):
+        self.dim = dim
+
+    def _embed(self, text: str) -> np.ndarray:
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).normal(size=self.dim).astype(np.float32)
+
+    def get_embeddings(self, list_of_text: List[str]) -> np.ndarray:
+        if not list_of_text:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.stack([self._embed(text) for text in list_of_text])
+
+    def get_embedding(self, text: str) -> np.ndarray:
+        return self._embed(text)
+
+    async def async_get_embeddings(self, list_of_text: List[str]) -> np.ndarray:
+        return self.get_embeddings(list_of_text)
+
+    async def async_get_embedding(self, text: str) -> np.ndarray:
+        return self._embed(text)
+
+
+@pytest.fixture
+def embedding_model() -> HashEmbeddingModel:
+    return HashEmbeddingModel()
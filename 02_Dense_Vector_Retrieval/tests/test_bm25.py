@@ -0,0 +1,25 @@
+import numpy as np
+
+from aimakerspace.bm25 import BM25Index
+
+DOCUMENTS = [
+    "fund returns beat the index",
+    "the fund lost money in march",
+    "reinsurance premiums rose",
+    "fund fees fell again",
+    "energy prices and fund flows",
+]
+
+
+def test_deleted_rows_do_not_count_towards_idf_or_average_length():
+    index = BM25Index()
+    index.add_many(range(len(DOCUMENTS)), DOCUMENTS)
+    deleted = np.array([False, True, False, True, False])
+    live_rows = np.flatnonzero(~deleted)
+
+    live_only = BM25Index()
+    live_only.add_many(range(len(live_rows)), [DOCUMENTS[row] for row in live_rows])
+
+    scores = index.scores("fund reinsurance", deleted=deleted)
+    np.testing.assert_allclose(scores[live_rows], live_only.scores("fund reinsurance"), rtol=1e-6)
+    assert not scores[deleted].any()
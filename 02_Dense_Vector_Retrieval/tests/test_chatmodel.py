@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("anthropic")
+
+from aimakerspace.ai_utils.chatmodel import ChatAnthropic
+from aimakerspace.ai_utils.fake_llm_server import FakeAnthropicServer
+
+MESSAGES = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hello"}]
+
+
+@pytest.fixture(autouse=True)
+def auth_token(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_AUTH_TOKEN", "fake")
+
+
+def test_astream_yields_text_as_it_arrives():
+    async def stream(chat):
+        start = time.perf_counter()
+        arrivals = []
+        async for text in chat.astream(MESSAGES):
+            arrivals.append((time.perf_counter() - start, text))
+        return arrivals
+
+    with FakeAnthropicServer("one two three four", first_token_delay=0.2, token_delay=0.05) as server:
+        arrivals = asyncio.run(stream(ChatAnthropic("fake-model", base_url=server.base_url)))
+
+    assert "".join(text for _, text in arrivals) == "one two three four"
+    time_to_first_token, last_token = arrivals[0][0], arrivals[-1][0]
+    assert time_to_first_token >= 0.2
+    # The last words arrive about three token delays later, not together with the first.
+    assert last_token - time_to_first_token >= 0.1
+    assert server.requests[0]["stream"] is True and server.requests[0]["system"] == "Be brief."
+
+
+def test_arun_and_run_return_the_whole_answer():
+    with FakeAnthropicServer("The whole answer.") as server:
+        chat = ChatAnthropic("fake-model", base_url=server.base_url)
+        assert asyncio.run(chat.arun(MESSAGES)) == "The whole answer."
+        assert chat.run(MESSAGES) == "The whole answer."
+    assert "stream" not in server.requests[1]
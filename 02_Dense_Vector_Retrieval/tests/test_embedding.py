@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from aimakerspace.ai_utils import embedding as embedding_module
+from aimakerspace.ai_utils.embedding import EmbeddingModel, compare_backends
+from aimakerspace.ai_utils.embedding_cache import EmbeddingCache
+
+TEXTS = [
+    "Stone Ridge manages reinsurance, energy and alternative lending strategies.",
+    "The fund's annualised return since inception beat its benchmark.",
+    "Tail risk is hedged by diversifying across uncorrelated sources of return.",
+    "Rising rates pushed bond prices lower over the year.",
+    "Investors receive a letter every year describing the firm's outlook.",
+    "Hello, world!",
+    "CAGR",
+    "Reinsurance premiums rose after a season of heavy catastrophe losses, and the firm "
+    "expanded its capacity while keeping the portfolio diversified across perils and regions.",
+]
+
+
+class LengthEncoder:
+    """Offline stand-in for ``SentenceTransformer`` that records each ``encode`` call."""
+
+    def __init__(self, model_name, **kwargs):
+        self.calls = []
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True):
+        self.calls.append((list(texts), batch_size))
+        return np.array([[len(text), sum(map(ord, text))] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def length_model(monkeypatch):
+    monkeypatch.setattr(embedding_module, "SentenceTransformer", LengthEncoder)
+    return EmbeddingModel(batch_size=3, bucket_size=2)
+
+
+def test_batches_are_length_sorted_and_rows_keep_input_order(length_model):
+    texts = ["aaaa", "b", "cccccc", "dd", "eeeee", "fff", "g"]
+
+    embeddings = length_model.get_embeddings(texts)
+
+    np.testing.assert_array_equal(embeddings[:, 0], [len(text) for text in texts])
+    np.testing.assert_array_equal(embeddings[:, 1], [sum(map(ord, text)) for text in texts])
+    assert [batch for batch, _ in length_model.model.calls] == [["cccccc", "eeeee", "aaaa"], ["fff", "dd", "b"], ["g"]]
+    assert {bucket_size for _, bucket_size in length_model.model.calls} == {2}
+    assert length_model.get_embeddings([]).shape == (0, 2)
+
+
+def test_cached_texts_are_not_encoded_again(monkeypatch):
+    monkeypatch.setattr(embedding_module, "SentenceTransformer", LengthEncoder)
+    model = EmbeddingModel(cache=EmbeddingCache())
+    first = model.get_embeddings(["one", "three", "one"])
+    second = model.get_embeddings(["three", "seven"])
+
+    assert [batch for batch, _ in model.model.calls] == [["three", "one"], ["seven"]]
+    np.testing.assert_array_equal(first[1], second[0])
+    assert first.dtype == np.float32 and first.shape == (3, 2)
+
+
+def test_invalid_sizes_are_rejected(monkeypatch):
+    monkeypatch.setattr(embedding_module, "SentenceTransformer", LengthEncoder)
+    with pytest.raises(ValueError):
+        EmbeddingModel(batch_size=0)
+    with pytest.raises(ValueError):
+        EmbeddingModel(bucket_size=0)
+
+
+def test_onnx_int8_stays_close_to_torch(tmp_path):
+    pytest.importorskip("optimum.onnxruntime")  # sentence-transformers[onnx]
+    candidate = EmbeddingModel(backend="onnx-int8", onnx_cache_dir=str(tmp_path))
+    report = compare_backends(TEXTS, candidate=candidate)
+    assert report["min_cosine"] >= 0.98
@@ -0,0 +1,57 @@
+import numpy as np
+
+from aimakerspace.ai_utils.embedding_cache import EmbeddingCache
+
+
+def make_embedder(dim=8):
+    calls = []
+
+    def compute(texts):
+        calls.append(list(texts))
+        return [np.full(dim, len(text), dtype=np.float32) for text in texts]
+
+    return compute, calls
+
+
+def test_lru_evicts_least_recently_used_within_byte_budget():
+    entry_bytes = 8 * 4 + EmbeddingCache.ENTRY_OVERHEAD_BYTES
+    cache = EmbeddingCache(max_bytes=3 * entry_bytes)
+    compute, calls = make_embedder()
+
+    cache.get_or_compute("model", ["a", "bb", "ccc"], compute)
+    cache.get_or_compute("model", ["a"], compute)  # "a" becomes most recently used
+    cache.get_or_compute("model", ["dddd"], compute)  # evicts "bb"
+    assert cache.stats()["bytes"] <= cache.max_bytes and cache.stats()["entries"] == 3
+
+    vectors = cache.get_or_compute("model", ["a", "ccc", "bb"], compute)
+    assert calls == [["a", "bb", "ccc"], ["dddd"], ["bb"]]
+    assert [vector[0] for vector in vectors] == [1, 3, 2]
+
+
+def test_repeated_texts_are_computed_once_per_model():
+    cache = EmbeddingCache()
+    compute, calls = make_embedder()
+
+    cache.get_or_compute("model", ["x", "y", "x"], compute)
+    cache.get_or_compute("other model", ["x"], compute)
+    assert calls == [["x", "y"], ["x"]]
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 4
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    compute, calls = make_embedder()
+    first = EmbeddingCache(disk_path=path)
+    first.get_or_compute("model", ["kept", "also kept"], compute)
+    first.close()
+
+    second = EmbeddingCache(disk_path=path)
+    vectors = second.get_or_compute("model", ["kept", "new"], compute)
+    assert calls == [["kept", "also kept"], ["new"]]
+    assert vectors[0].dtype == np.float32 and vectors[0][0] == 4
+    assert second.disk_hits == 1 and second.misses == 1
+
+    # Disk hits are promoted into memory, so the next lookup does not touch SQLite.
+    second.get_or_compute("model", ["kept"], compute)
+    assert second.memory_hits == 1 and second.disk_hits == 1
+    second.close()
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("sentence_transformers")
+pymupdf = pytest.importorskip("pymupdf")
+
+from aimakerspace.ingestion import IncrementalIngestor
+from aimakerspace.text_utils import CharacterTextSplitter
+from aimakerspace.vectordatabase import VectorDatabase
+
+# Paragraph mode with a chunk size below two paragraphs gives one chunk per paragraph,
+# so inserting or dropping a paragraph leaves the other chunks' text unchanged.
+SPLITTER_OPTIONS = {"chunk_size": 60, "chunk_overlap": 0, "split_mode": "paragraph"}
+
+
+def write_pdf(path: str, pages) -> None:
+    """Write a PDF whose pages each hold the given paragraphs."""
+    document = pymupdf.open()
+    for paragraphs in pages:
+        document.new_page().insert_text((72, 72), "".join(f"{paragraph} \n" for paragraph in paragraphs))
+    document.save(path)
+    document.close()
+
+
+def ingest(ingestor: IncrementalIngestor, path: str) -> dict:
+    return asyncio.run(ingestor.aingest_directory(path))
+
+
+@pytest.fixture
+def ingestor(embedding_model) -> IncrementalIngestor:
+    return IncrementalIngestor(VectorDatabase(embedding_model=embedding_model), CharacterTextSplitter(**SPLITTER_OPTIONS))
+
+
+def test_reused_chunk_gets_new_location_after_edit(tmp_path, ingestor):
+    kept = "The kept paragraph talks about index structures."
+    write_pdf(tmp_path / "a.pdf", [["An opening paragraph about search.", kept]])
+    ingest(ingestor, tmp_path)
+    before = ingestor.vector_db.retrieve_from_key(kept)[1]
+    assert before["page_start"] == 1
+
+    # A new first page shifts the kept paragraph onto page 2 and further into the text.
+    write_pdf(tmp_path / "a.pdf", [["A new preface paragraph."], ["An opening paragraph about search.", kept]])
+    report = ingest(ingestor, tmp_path)
+
+    after = ingestor.vector_db.retrieve_from_key(kept)[1]
+    assert report["changed"] == ["a.pdf"] and report["chunks_reused"] == 2
+    assert after["page_start"] == after["page_end"] == 2
+    assert after["start"] > before["start"]
+    text = ingestor._chunk_document(str(tmp_path / "a.pdf"), "a.pdf")
+    assert after == text[1][text[0].index(kept)]
+
+
+def test_shared_chunk_moves_to_remaining_source_when_dropped(tmp_path, ingestor):
+    shared = "A paragraph that both documents quote word for word."
+    write_pdf(tmp_path / "a.pdf", [["Only document a says this.", shared]])
+    write_pdf(tmp_path / "b.pdf", [["Only document b says this.", shared]])
+    ingest(ingestor, tmp_path)
+    assert ingestor.vector_db.retrieve_from_key(shared)[1]["source"] == "a.pdf"
+
+    write_pdf(tmp_path / "a.pdf", [["Only document a says this."]])
+    report = ingest(ingestor, tmp_path)
+
+    metadata = ingestor.vector_db.retrieve_from_key(shared)[1]
+    assert report["chunks_deleted"] == 0
+    assert metadata["source"] == "b.pdf" and "duplicate_sources" not in metadata
@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from aimakerspace.ai_utils import reranker as reranker_module
+from aimakerspace.ai_utils.reranker import CrossEncoderReranker
+
+
+class WordOverlapCrossEncoder:
+    """Offline stand-in for ``CrossEncoder``: a pair scores the number of query words in the chunk."""
+
+    calls = []
+
+    def __init__(self, model_name, max_length=512):
+        self.model_name = model_name
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.calls.append(list(pairs))
+        return [len(set(query.lower().split()) & set(text.lower().split())) for query, text in pairs]
+
+
+@pytest.fixture
+def reranker(monkeypatch):
+    WordOverlapCrossEncoder.calls = []
+    monkeypatch.setattr(reranker_module, "CrossEncoder", WordOverlapCrossEncoder)
+    return CrossEncoderReranker(max_candidates=4)
+
+
+def test_rerank_orders_by_cross_encoder_score(reranker):
+    hits = [
+        ("energy prices", 0.9, {"id": 0}),
+        ("the fund cagr was high", 0.8, {"id": 1}),
+        ("fund fees", 0.7, {"id": 2}),
+        ("cagr of the fund since inception", 0.6, {"id": 3}),
+        ("fund cagr fund cagr", 0.5, {"id": 4}),  # past max_candidates, never scored
+    ]
+    results = reranker.rerank("the fund cagr", hits, top_n=3)
+
+    assert [metadata["id"] for _, _, metadata in results] == [1, 3, 2]
+    assert [score for _, score, _ in results] == [3.0, 3.0, 1.0]
+    assert reranker.last_pairs == 4
+
+
+def test_rerank_many_scores_every_list_in_one_batch(reranker):
+    reranker.max_candidates = 6
+    hit_lists = [
+        [("fund a returns", 0.9, {}), ("fund a cagr", 0.8, {}), ("unused", 0.1, {})],
+        [("fund b cagr", 0.7, {}), ("fund b fees", 0.6, {})],
+        [],
+    ]
+    results = reranker.rerank_many("fund cagr", hit_lists, top_n=1)
+
+    assert [[text for text, _, _ in hits] for hits in results] == [["fund a cagr"], ["fund b cagr"], []]
+    # The limit of 6 candidates is shared between the three lists, so "unused" is never scored.
+    assert len(WordOverlapCrossEncoder.calls) == 1 and len(WordOverlapCrossEncoder.calls[0]) == 4
+
+
+def test_latency_budget_caps_candidates(reranker):
+    reranker.latency_budget_ms = 10
+    assert reranker.candidate_limit() == 4  # nothing measured yet
+    reranker._seconds_per_pair = 0.004
+    assert reranker.candidate_limit() == 2
+    reranker._seconds_per_pair = 1.0
+    assert reranker.candidate_limit() == 1
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from aimakerspace.sharded import ShardedVectorDatabase
+from aimakerspace.vectordatabase import VectorDatabase, cosine_similarity, pearson_correlation
+
+N_ROWS = 600
+
+
+@pytest.fixture
+def rows():
+    vectors = np.random.default_rng(0).normal(size=(N_ROWS, 32)).astype(np.float32)
+    keys = [f"row {i}" for i in range(N_ROWS)]
+    metadata = [{"source": f"doc {i % 5}"} for i in range(N_ROWS)]
+    return keys, vectors, metadata
+
+
+def build(store, rows):
+    store.insert_many(*rows)
+    return store
+
+
+@pytest.mark.parametrize("partition", ["hash", "source"])
+def test_sharded_search_matches_a_single_store(embedding_model, rows, partition):
+    single = build(VectorDatabase(embedding_model), rows)
+    queries = list(np.random.default_rng(1).normal(size=(6, 32)).astype(np.float32))
+    filters = [None, {"source": "doc 3"}] * 3
+
+    with build(ShardedVectorDatabase(3, partition, embedding_model), rows) as sharded:
+        assert len(sharded) == N_ROWS and sorted(sharded.keys()) == sorted(single.keys())
+        for distance_metric in (cosine_similarity, pearson_correlation):
+            expected = single.search_many(queries, 10, distance_metric, metadata_filter=filters)
+            results = sharded.search_many(queries, 10, distance_metric, metadata_filter=filters)
+            for hits, expected_hits in zip(results, expected):
+                assert [hit[0] for hit in hits] == [hit[0] for hit in expected_hits]
+                np.testing.assert_allclose([hit[1] for hit in hits], [hit[1] for hit in expected_hits], rtol=1e-5)
+        if partition == "source":
+            # Each document lives on exactly one shard.
+            holders = [shard.get_unique_metadata_values("source") for shard in sharded.shards]
+            assert sorted(source for sources in holders for source in sources) == [f"doc {i}" for i in range(5)]
+
+
+def test_process_workers_match_thread_workers(embedding_model, rows):
+    queries = list(np.random.default_rng(2).normal(size=(4, 32)).astype(np.float32))
+    threaded = build(ShardedVectorDatabase(2, embedding_model=embedding_model), rows)
+    processes = build(ShardedVectorDatabase(2, embedding_model=embedding_model, executor="process"), rows)
+    with threaded, processes:
+        expected = [[hit[0] for hit in hits] for hits in threaded.search_many(queries, 5, cosine_similarity)]
+        results = processes.search_many(queries, 5, cosine_similarity)
+        assert [[hit[0] for hit in hits] for hits in results] == expected
+        # A delete is published to the workers before the next search.
+        processes.delete(expected[0][0])
+        assert expected[0][0] not in [hit[0] for hit in processes.search(queries[0], 5, cosine_similarity)]
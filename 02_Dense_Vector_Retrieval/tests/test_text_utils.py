@@ -0,0 +1,142 @@
+import re
+
+import pytest
+
+pymupdf = pytest.importorskip("pymupdf")
+
+from aimakerspace.text_utils import BoilerplateFilter, CharacterTextSplitter, PDFFileLoader, page_range, split_pages
+
+
+class RegexTokenizer:
+    """Offline stand-in for a Hugging Face fast tokenizer: words and punctuation marks are tokens."""
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=True, verbose=False):
+        return {"offset_mapping": [match.span() for match in re.finditer(r"\w+|[^\w\s]", text)]}
+
+
+def write_pdf(path, pages):
+    document = pymupdf.open()
+    for text in pages:
+        document.new_page().insert_text((72, 72), text)
+    document.save(path)
+    document.close()
+
+
+def uncovered(text, spans):
+    covered = [False] * len(text)
+    for start, end in spans:
+        covered[start:end] = [True] * (end - start)
+    return [i for i, is_covered in enumerate(covered) if not is_covered and not text[i].isspace()]
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(10, 8), (10, 0), (12, 11), (40, 10), (3, 2)])
+def test_recursive_spans_cover_the_whole_text(chunk_size, chunk_overlap):
+    # A sentence end early in the text lets the first chunk end within chunk_overlap tokens of the start.
+    text = "one two three four five six. " + " ".join(f"word{i}" for i in range(60))
+    splitter = CharacterTextSplitter(chunk_size, chunk_overlap, "recursive", tokenizer=RegexTokenizer())
+    spans = splitter.split_spans(text)
+    assert uncovered(text, spans) == []
+    assert spans[-1][1] == len(text)
+
+
+def test_parallel_loader_matches_sequential_load(tmp_path):
+    write_pdf(tmp_path / "long.pdf", [f"Long document, page {page}" for page in range(1, 8)])
+    write_pdf(tmp_path / "short.pdf", ["Short document"])
+    (tmp_path / "notes.txt").write_text("not a pdf")
+
+    sequential = PDFFileLoader(str(tmp_path))
+    sequential.load()
+    parallel = PDFFileLoader(str(tmp_path), max_workers=2, pages_per_task=3)
+    parallel.load()
+
+    assert parallel.documents == sequential.documents
+    assert parallel.page_starts == sequential.page_starts
+    assert sorted(name for _, name in parallel.documents) == ["long.pdf", "short.pdf"]
+
+
+@pytest.mark.parametrize("split_mode", ["character", "recursive"])
+def test_chunk_offsets_and_pages_point_back_into_the_document(tmp_path, split_mode):
+    write_pdf(tmp_path / "letter.pdf", ["\n".join(f"page{page} word{i}." for i in range(30)) for page in (1, 2, 3)])
+    loader = PDFFileLoader(str(tmp_path / "letter.pdf"))
+    loader.load()
+    (text, source), = loader.documents
+    pages = split_pages(text, loader.page_starts[0])
+    assert len(pages) == 3 and "".join(pages) == text
+
+    splitter = CharacterTextSplitter(60, 10, split_mode, tokenizer=RegexTokenizer())
+    chunks, metadata = splitter.split_texts_with_metadata(loader.documents, loader.page_starts)
+    for chunk, chunk_metadata in zip(chunks, metadata):
+        assert chunk_metadata["source"] == source
+        assert text[chunk_metadata["start"] : chunk_metadata["end"]] == chunk
+        pages_in_chunk = {int(page) for page in re.findall(r"page(\d)", chunk)}
+        assert pages_in_chunk <= set(range(chunk_metadata["page_start"], chunk_metadata["page_end"] + 1))
+    assert len(chunks) > 3 and {m["page_start"] for m in metadata} == {1, 2, 3}
+
+
+def test_page_range_counts_the_page_of_the_last_character():
+    page_starts = [0, 100, 200]
+    assert page_range(page_starts, 0, 100) == (1, 1)
+    assert page_range(page_starts, 90, 101) == (1, 2)
+    assert page_range(page_starts, 250, 250) == (3, 3)
+    assert page_range(page_starts, 150, 160, first_page=5) == (6, 6)
+
+
+def test_recursive_chunks_stay_within_chunk_size_and_end_at_sentences():
+    sentences = [" ".join(f"s{s}w{i}" for i in range(6)) + "." for s in range(20)]
+    text = " ".join(sentences[:9]) + "\n\n" + " ".join(sentences[9:])
+    tokenizer = RegexTokenizer()
+    splitter = CharacterTextSplitter(20, 5, "recursive", tokenizer=tokenizer)
+
+    chunks = splitter.split(text)
+    for chunk in chunks[:-1]:
+        assert len(tokenizer(chunk)["offset_mapping"]) <= 20
+        assert chunk.endswith(".")
+    # The paragraph break wins over a later sentence end in the same window.
+    assert any(chunk.endswith(sentences[8]) for chunk in chunks)
+    assert not any(chunk.endswith(sentences[9]) for chunk in chunks)
+    assert chunks[-1].endswith(sentences[-1])
+    assert CharacterTextSplitter(20, 5, "recursive", tokenizer=tokenizer).split("") == []
+
+
+PAGE_WORDS = ["one", "two", "three", "four", "five"]
+
+
+def letter_pages(source, n_pages=5):
+    """Pages sharing a header and a "Page n of m" footer; the first and last body lines differ per page."""
+    pages = []
+    for page, word in enumerate(PAGE_WORDS[:n_pages], 1):
+        body = f"Body of {source} page {word}.\nMiddle line.\nAnother line.\nClosing line {word}.\n"
+        if page == n_pages:
+            body += "Risk Disclosures\nPast performance is no guarantee.\n"
+        pages.append((f"Stone Ridge Letter\n{body}Page {page} of {n_pages}\n", source, page))
+    return pages
+
+
+def test_boilerplate_filter_drops_sections_repeated_lines_and_pages():
+    pages = letter_pages("a.pdf") + letter_pages("b.pdf", n_pages=2)
+    boilerplate = BoilerplateFilter(sections=[r"Risk Disclosures"], drop_pages={"a.pdf": [1]}, learn_pages=4)
+
+    filtered = list(boilerplate.filter_pages(iter(pages)))
+
+    assert [page[1:] for page in filtered] == [page[1:] for page in pages]
+    assert filtered[0][0] == ""
+    assert filtered[2][0] == "Body of a.pdf page three.\nMiddle line.\nAnother line.\nClosing line three.\n"
+    a_text = "".join(text for text, source, _ in filtered if source == "a.pdf")
+    assert "Risk Disclosures" not in a_text and "Past performance" not in a_text
+    assert "Body of a.pdf page five." in a_text
+    # b.pdf has too few pages for its header to count as repeated.
+    assert filtered[5][0] == pages[5][0]
+    assert boilerplate.stats["pages_dropped"] == 1
+    removed = boilerplate.stats["bytes_removed_by_rule"]
+    assert sum(removed.values()) == boilerplate.stats["bytes_removed"] and all(removed.values())
+
+
+def test_boilerplate_filter_keeps_page_starts_aligned():
+    pages = letter_pages("a.pdf")
+    documents = [("".join(text for text, _, _ in pages), "a.pdf")]
+    page_starts = [[sum(len(text) for text, _, _ in pages[:i]) for i in range(5)]]
+
+    filtered, filtered_starts = BoilerplateFilter(sections=[r"Risk Disclosures"]).filter_documents(documents, page_starts)
+    assert [page.splitlines()[0] for page in split_pages(filtered[0][0], filtered_starts[0])] == [
+        f"Body of a.pdf page {word}." for word in PAGE_WORDS
+    ]
@@ -0,0 +1,344 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from aimakerspace.ann import benchmark_recall
+from aimakerspace.text_utils import CharacterTextSplitter
+from aimakerspace.vectordatabase import VectorDatabase, cosine_similarity, merge_adjacent_hits, pearson_correlation
+
+
+def random_rows(n, dim=32, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def brute_force(vectors, query, k, distance_metric):
+    """Top-k (row, score) by calling the metric on every row, as search did before the matrix scan."""
+    scores = [distance_metric(query, vector) for vector in vectors]
+    return sorted(enumerate(scores), key=lambda item: item[1], reverse=True)[:k]
+
+
+def assert_same_hits(hits, expected):
+    assert [(hit[0], hit[2]) for hit in hits] == [(hit[0], hit[2]) for hit in expected]
+    np.testing.assert_allclose([hit[1] for hit in hits], [hit[1] for hit in expected], atol=1e-6)
+
+
+@pytest.mark.parametrize("distance_metric", [cosine_similarity, pearson_correlation])
+def test_search_matches_per_row_loop(embedding_model, distance_metric):
+    vectors = random_rows(500)
+    db = VectorDatabase(embedding_model)
+    db.insert_many([f"row {i}" for i in range(500)], vectors)
+
+    for query in random_rows(5, seed=1):
+        hits = db.search(query, 10, distance_metric)
+        expected = brute_force(vectors, query, 10, distance_metric)
+        assert [hit[0] for hit in hits] == [f"row {row}" for row, _ in expected]
+        np.testing.assert_allclose([hit[1] for hit in hits], [score for _, score in expected], atol=1e-5)
+
+
+def test_ivf_filtered_search_returns_k_hits_for_selective_filters(embedding_model):
+    n = 5100
+    vectors = random_rows(n)
+    query = np.random.default_rng(1).normal(size=32).astype(np.float32)
+    # "few": 50 rows, fewer than one bucket, scanned exactly. "far": 1,000 rows facing away from the query, so the
+    # buckets nearest the query hold few of them and the probe has to widen.
+    away = vectors @ query < np.quantile(vectors @ query, 0.2)
+    metadata = [{"s": "few" if i % 102 == 0 else "far" if away[i] else "other"} for i in range(n)]
+    db = VectorDatabase(embedding_model, index="ivf", nprobe=1)
+    db.insert_many([f"row {i}" for i in range(n)], vectors, metadata)
+    assert db.ann_index.is_trained
+
+    for value in ("few", "far"):
+        metadata_filter = {"s": value}
+        hits = db.search(query, 10, cosine_similarity, metadata_filter=metadata_filter)
+        assert len(hits) == 10
+        assert all(hit[2] == metadata_filter for hit in hits)
+        batched = db.search_many([query], 10, cosine_similarity, metadata_filter=metadata_filter)[0]
+        assert len(batched) == 10
+    assert db.search(query, 10, cosine_similarity, metadata_filter={"s": "few"}) == db.search(
+        query, 10, cosine_similarity, metadata_filter={"s": "few"}, exact=True
+    )
+
+
+def test_concurrent_readers_see_consistent_snapshots(embedding_model):
+    batch_size, dim, k = 32, 32, 5
+    db = VectorDatabase(embedding_model, compact_threshold=0.3)
+    stop = threading.Event()
+    errors = []
+    counts = {"reads": 0, "writes": 0}
+
+    def batch_rows(batch, rng):
+        keys = [f"batch {batch} row {i}" for i in range(batch_size)]
+        return keys, rng.standard_normal((batch_size, dim)).astype(np.float32), [{"batch": batch}] * batch_size
+
+    def write():
+        rng = np.random.default_rng(0)
+        batch = 0
+        try:
+            while not stop.is_set():
+                db.insert_many(*batch_rows(batch, rng))
+                # Deletes and re-upserts push the dead fraction past the threshold, so compactions run too.
+                if batch % 3 == 2:
+                    db.delete_many(batch_rows(batch - 2, rng)[0])
+                if batch % 5 == 4:
+                    db.upsert(*batch_rows(batch - 1, rng))
+                batch += 1
+                counts["writes"] += 1
+        except Exception as error:
+            errors.append(f"writer: {error!r}")
+
+    def read(reader):
+        rng = np.random.default_rng(1 + reader)
+        try:
+            while not stop.is_set():
+                queries = list(rng.standard_normal((4, dim)).astype(np.float32))
+                view = db.snapshot()
+                if len(view) % batch_size or len(view.keys()) != len(view):
+                    errors.append(f"snapshot has {len(view)} rows, not whole batches")
+                for hits in view.search_many(queries, k, cosine_similarity):
+                    for text, _, metadata in hits:
+                        if text not in view or not text.startswith(f"batch {metadata['batch']} "):
+                            errors.append(f"hit {text!r} with {metadata} is not in its snapshot")
+                batches = view.get_unique_metadata_values("batch")
+                if batches:
+                    batch = batches[int(rng.integers(len(batches)))]
+                    hits = view.search(queries[0], batch_size, cosine_similarity, {"batch": batch})
+                    if len(hits) != batch_size or any(metadata["batch"] != batch for _, _, metadata in hits):
+                        errors.append(f"filtered search for batch {batch} returned {len(hits)} rows")
+                for text, _, metadata in db.search(queries[1], k, cosine_similarity):
+                    if not text.startswith(f"batch {metadata['batch']} "):
+                        errors.append(f"hit {text!r} has metadata {metadata}")
+                counts["reads"] += 1
+        except Exception as error:
+            errors.append(f"reader {reader}: {error!r}")
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    stop.wait(1.0)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert counts["reads"] > 0 and counts["writes"] > 0
+    assert len(db) % batch_size == 0
+    assert len(db.keys()) == len(db)
+
+
+def test_search_many_matches_one_search_per_query(embedding_model):
+    texts = [f"chunk {i}" for i in range(300)]
+    db = VectorDatabase(embedding_model)
+    db.insert_many(texts, embedding_model.get_embeddings(texts), [{"source": f"doc {i % 3}"} for i in range(300)])
+    queries = ["first question", random_rows(1, seed=2)[0], "first question"]
+    filters = [{"source": "doc 1"}, None, {"source": "doc 2"}]
+
+    results = db.search_many(queries, 5, cosine_similarity, metadata_filter=filters)
+
+    for query, metadata_filter, hits in zip(queries, filters, results):
+        query_vector = embedding_model.get_embedding(query) if isinstance(query, str) else query
+        assert hits == db.search(query_vector, 5, cosine_similarity, metadata_filter)
+    as_text = db.search_many(queries, 5, cosine_similarity, metadata_filter=filters, return_as_text=True)
+    assert as_text == [[hit[0] for hit in hits] for hits in results]
+
+
+def test_indexed_filters_match_a_metadata_scan(embedding_model):
+    n = 400
+    metadata = [{"source": f"doc {i % 4}", "page": i % 7, "tags": ["a"] if i % 2 else ["b"]} for i in range(n)]
+    db = VectorDatabase(embedding_model, compact_threshold=None)
+    db.insert_many([f"row {i}" for i in range(n)], random_rows(n), metadata)
+    db.delete_many([f"row {i}" for i in range(0, n, 5)])
+    live = [i for i in range(n) if i % 5]
+    query = random_rows(1, seed=3)[0]
+
+    # The list-valued "tags" filter cannot be indexed and takes the scanning path.
+    for metadata_filter in ({"source": "doc 1"}, {"source": "doc 2", "page": 3}, {"tags": ["a"]}, {"source": "none"}):
+        expected = {f"row {i}" for i in live if all(metadata[i][f] == v for f, v in metadata_filter.items())}
+        hits = db.search(query, n, cosine_similarity, metadata_filter)
+        assert {hit[0] for hit in hits} == expected
+    assert sorted(db.get_unique_metadata_values("source")) == [f"doc {i}" for i in range(4)]
+
+
+def test_save_and_memory_mapped_load_round_trip(tmp_path, embedding_model):
+    db = VectorDatabase(embedding_model)
+    ids = db.insert_many([f"row {i}" for i in range(50)], random_rows(50), [{"page": i} for i in range(50)])
+    db.delete("row 7")
+    db.save(tmp_path)
+    query = random_rows(1, seed=4)[0]
+
+    loaded = VectorDatabase.load(tmp_path, embedding_model)
+    assert isinstance(loaded.matrix, np.memmap)
+    assert loaded.keys() == db.keys() and "row 7" not in loaded
+    assert loaded.search(query, 5, cosine_similarity) == db.search(query, 5, cosine_similarity)
+    assert loaded.id_of("row 3") == ids[3]
+    np.testing.assert_allclose(loaded.retrieve_from_key("row 3")[0], db.retrieve_from_key("row 3")[0], rtol=1e-6)
+
+    # The first write copies the mapped rows into RAM; saving back over the mapped files is safe.
+    loaded.insert("row 50", random_rows(1, seed=5)[0], {"page": 50})
+    assert not isinstance(loaded.matrix, np.memmap)
+    loaded.save(tmp_path)
+    assert len(VectorDatabase.load(tmp_path, embedding_model)) == 50
+
+
+def test_ivf_recall_rises_with_nprobe(embedding_model):
+    rng = np.random.default_rng(0)
+    topics = rng.normal(size=(20, 32))
+    data = topics[rng.integers(20, size=3000)] + 0.6 * rng.normal(size=(3000, 32))
+    queries = topics[rng.integers(20, size=30)] + 0.6 * rng.normal(size=(30, 32))
+    db = VectorDatabase(embedding_model, index="ivf", nprobe=2)
+    db.insert_many([f"row {i}" for i in range(3000)], data.astype(np.float32))
+    assert db.ann_index.is_trained and len(db.ann_index.centroids) == 54
+
+    report = benchmark_recall(db, queries, k=10, nprobes=(1, 4, 16, 54), distance_metric=cosine_similarity)
+
+    recalls = [row["recall_at_k"] for row in report[1:]]
+    assert recalls == sorted(recalls) and recalls[-1] == 1.0
+    assert recalls[1] >= 0.8
+    assert report[1]["candidates_scanned"] < 3000 / 10
+    assert db.ann_index.nprobe == 2
+
+
+def test_int8_rerank_restores_exact_top_k(embedding_model):
+    vectors = random_rows(2000)
+    queries = random_rows(20, seed=6)
+    keys = [f"row {i}" for i in range(2000)]
+    exact = VectorDatabase(embedding_model)
+    exact.insert_many(keys, vectors)
+    quantized = VectorDatabase(embedding_model, quantization="int8", keep_full_precision=True, rerank_candidates=50)
+    quantized.insert_many(keys, vectors)
+
+    stats = quantized.quantization_stats(queries, k=10)
+    assert stats["compression_ratio"] > 3.5
+    assert stats["recall_at_k"] >= 0.8 and stats["recall_at_k_reranked"] == 1.0
+    for query in queries:
+        expected = exact.search(query, 10, cosine_similarity)
+        hits = quantized.search(query, 10, cosine_similarity)
+        assert [hit[0] for hit in hits] == [hit[0] for hit in expected]
+        np.testing.assert_allclose([hit[1] for hit in hits], [hit[1] for hit in expected], atol=1e-6)
+    # Without float32 rows the codes alone are scored, with only a small error.
+    codes_only = VectorDatabase(embedding_model, quantization="int8")
+    codes_only.insert_many(keys, vectors)
+    assert codes_only.matrix.dtype == np.float32 and not codes_only.has_full_precision
+    hits = codes_only.search(queries[0], 10, cosine_similarity)
+    expected_scores = {key: score for key, score, _ in exact.search(queries[0], 2000, cosine_similarity)}
+    assert all(abs(score - expected_scores[key]) < 0.02 for key, score, _ in hits)
+
+
+def test_streaming_build_matches_building_from_a_list(embedding_model):
+    pages = [
+        (" ".join(f"{source}-p{page}-w{i}" for i in range(30)) + "\n", source, page)
+        for source in ("a.pdf", "b.pdf")
+        for page in (1, 2, 3)
+    ]
+    documents = [("".join(text for text, name, _ in pages if name == source), source) for source in ("a.pdf", "b.pdf")]
+    page_length = len(pages[0][0])
+    page_starts = [[0, page_length, 2 * page_length]] * 2
+    splitter = CharacterTextSplitter(100, 20)
+
+    chunks, metadata = splitter.split_texts_with_metadata(documents, page_starts)
+    assert list(splitter.split_stream(pages)) == list(zip(chunks, metadata))
+    assert {m["page_end"] for m in metadata} == {1, 2, 3}
+
+    streamed = asyncio.run(VectorDatabase(embedding_model).abuild_from_stream(splitter.split_stream(pages), batch_size=7))
+    listed = asyncio.run(VectorDatabase(embedding_model).abuild_from_list(chunks, metadata))
+    assert streamed.keys() == listed.keys() == chunks
+    assert [streamed.retrieve_from_key(chunk)[1] for chunk in chunks] == metadata
+    np.testing.assert_allclose(streamed.matrix, listed.matrix)
+
+
+def test_streaming_build_reraises_a_failed_stage(embedding_model):
+    def chunks():
+        yield "first chunk", {}
+        raise RuntimeError("parser failed")
+
+    with pytest.raises(RuntimeError, match="parser failed"):
+        asyncio.run(VectorDatabase(embedding_model).abuild_from_stream(chunks(), batch_size=1))
+
+
+def test_mmr_skips_near_duplicates_of_selected_hits(embedding_model):
+    rng = np.random.default_rng(7)
+    query = rng.normal(size=32).astype(np.float32)
+    passage = query + 0.3 * rng.normal(size=32)
+    other = query + 0.9 * rng.normal(size=32)
+    vectors = np.stack([passage + 0.01 * rng.normal(size=32) for _ in range(4)] + [other]).astype(np.float32)
+    db = VectorDatabase(embedding_model)
+    db.insert_many(["copy 0", "copy 1", "copy 2", "copy 3", "other"], vectors)
+
+    plain = [hit[0] for hit in db.search(query, 2, cosine_similarity)]
+    diverse = [hit[0] for hit in db.search(query, 2, cosine_similarity, mmr_lambda=0.5)]
+    assert plain[1].startswith("copy") and diverse[1] == "other"
+    assert diverse[0] == plain[0]
+    assert db.search(query, 2, cosine_similarity, mmr_lambda=1.0) == db.search(query, 2, cosine_similarity)
+    assert [hit[0] for hit in db.search_many([query], 2, cosine_similarity, mmr_lambda=0.5)[0]] == diverse
+    with pytest.raises(ValueError):
+        db.search(query, 2, cosine_similarity, mmr_lambda=1.5)
+
+
+def test_merge_adjacent_hits_joins_overlapping_chunks_of_one_source():
+    document = "abcdefghijklmnopqrstuvwxyz"
+    hits = [
+        (document[10:20], 0.7, {"source": "a", "start": 10, "end": 20, "page_start": 1, "page_end": 1}),
+        ("elsewhere", 0.9, {"source": "b", "start": 10, "end": 19}),
+        (document[0:12], 0.8, {"source": "a", "start": 0, "end": 12, "page_start": 1, "page_end": 1}),
+        (document[20:26], 0.5, {"source": "a", "start": 20, "end": 26, "page_start": 2, "page_end": 2}),
+        ("no offsets", 0.6, {"source": "a"}),
+    ]
+    merged = merge_adjacent_hits(hits)
+
+    assert merged[0] == ("elsewhere", 0.9, {"source": "b", "start": 10, "end": 19})
+    text, score, metadata = merged[1]
+    assert text == document and score == 0.8
+    assert (metadata["start"], metadata["end"], metadata["page_start"], metadata["page_end"]) == (0, 26, 1, 2)
+    assert merged[2] == ("no offsets", 0.6, {"source": "a"})
+    assert hits[2][2]["end"] == 12  # the input metadata is left untouched
+    # With a gap between chunks they only merge when max_gap allows it.
+    apart = [
+        (document[0:5], 0.5, {"source": "a", "start": 0, "end": 5}),
+        (document[8:12], 0.4, {"source": "a", "start": 8, "end": 12}),
+    ]
+    assert len(merge_adjacent_hits(apart)) == 2
+    assert merge_adjacent_hits(apart, max_gap=3)[0][0] == "abcde\nijkl"
+
+
+def test_delete_upsert_and_compact_keep_ids_and_results(embedding_model):
+    vectors = random_rows(100)
+    db = VectorDatabase(embedding_model, compact_threshold=None, bm25=True)
+    ids = db.insert_many([f"row {i}" for i in range(100)], vectors, [{"n": i} for i in range(100)])
+    query = vectors[10]
+
+    assert db.delete_many(["row 10", "row 11", ids[12], "missing"]) == 3
+    assert "row 10" not in db and len(db) == 97 and db.tombstone_ratio > 0
+    assert all(hit[0] not in ("row 10", "row 11", "row 12") for hit in db.search(query, 100, cosine_similarity))
+    assert db.search_by_text("10", 5, cosine_similarity, mode="lexical") == []
+
+    # Upserting by id replaces the text and vector but keeps the id; by text it replaces the row.
+    replacements = random_rows(2, seed=8)
+    db.upsert(["row 13 edited"], replacements[:1], [{"n": 13}], ids=[ids[13]])
+    db.upsert(["row 14"], replacements[1:], [{"n": 140}])
+    assert db.id_of("row 13 edited") == ids[13] and "row 13" not in db
+    assert db.retrieve_from_key("row 14")[1] == {"n": 140} and db.id_of("row 14") == ids[14]
+    with pytest.raises(ValueError):
+        db.upsert(["row 15"], vectors[:1], ids=[ids[16]])
+    db.update_metadata(ids[20], {"n": 200})
+    before = db.search(query, 20, cosine_similarity)
+    old_snapshot = db.snapshot()
+
+    assert db.compact() == 6
+    assert db.tombstone_ratio == 0 and len(db) == 97
+    assert_same_hits(db.search(query, 20, cosine_similarity), before)
+    assert db.retrieve_from_key(ids[20])[1] == {"n": 200} and db.id_of("row 99") == ids[99]
+    assert [hit[0] for hit in db.search_by_text("99", 5, mode="lexical")] == ["row 99"]
+    # A snapshot taken before compaction still answers from its own rows.
+    assert_same_hits(old_snapshot.search(query, 20, cosine_similarity), before)
+
+
+def test_deletes_past_the_threshold_compact_automatically(embedding_model):
+    db = VectorDatabase(embedding_model, compact_threshold=0.5)
+    db.insert_many([f"row {i}" for i in range(10)], random_rows(10))
+    db.delete_many([f"row {i}" for i in range(4)])
+    assert db.tombstone_ratio == 0.4
+    db.delete("row 4")
+    assert db.tombstone_ratio == 0 and db.keys() == [f"row {i}" for i in range(5, 10)]
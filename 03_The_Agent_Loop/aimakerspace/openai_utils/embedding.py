@@ -1,17 +1,84 @@
 from dotenv import load_dotenv
 from openai import AsyncOpenAI, OpenAI
 import openai
-from typing import List
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
 import os
+import time
+import random
 import asyncio
+from aimakerspace.openai_utils.embedding_cache import EmbeddingCache, PartialEmbeddingError
+from aimakerspace.openai_utils.rate_limiter import RateLimiter
+
+try:
+    import tiktoken
+except ImportError:  # token estimates fall back to a characters-per-token heuristic
+    tiktoken = None
+
+# Errors worth retrying with backoff; anything else fails the batch immediately.
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, from ``retry-after-ms`` or ``retry-after``."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
 
 
 class EmbeddingModel:
-    def __init__(self, embeddings_model_name: str = "text-embedding-3-small", batch_size: int = 1024):
+    def __init__(
+        self,
+        embeddings_model_name: str = "text-embedding-3-small",
+        batch_size: int = 1024,
+        cache: Optional[EmbeddingCache] = None,
+        max_concurrency: int = 4,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_retries: int = 6,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        base_url: Optional[str] = None,
+    ):
+        """
+        :param embeddings_model_name: OpenAI embedding model
+        :param batch_size: Inputs per embeddings request
+        :param cache: Optional EmbeddingCache consulted before calling the API
+        :param max_concurrency: Requests in flight at once for the async methods
+        :param requests_per_minute: Request budget for the async methods, None for unlimited
+        :param tokens_per_minute: Input-token budget for the async methods, None for unlimited
+        :param max_retries: Retries per batch for rate-limit, timeout and server errors
+        :param initial_backoff: First backoff ceiling in seconds, doubled per retry
+        :param max_backoff: Upper bound on a single backoff
+        :param base_url: API base URL override, e.g. a local stub server
+        """
         load_dotenv()
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.async_client = AsyncOpenAI()
-        self.client = OpenAI()
+        # Retries are handled here so backoff, Retry-After and batch splitting are consistent.
+        self.async_client = AsyncOpenAI(base_url=base_url, max_retries=0)
+        self.client = OpenAI(base_url=base_url)
 
         if self.openai_api_key is None:
             raise ValueError(
@@ -19,30 +86,129 @@ class EmbeddingModel:
             )
         self.embeddings_model_name = embeddings_model_name
         self.batch_size = batch_size
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self._tokenizer = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop = None
 
     async def async_get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            return await self._async_embed(list_of_text)
+        embeddings = await self.cache.aget_or_compute(
+            self.embeddings_model_name, list_of_text, self._async_embed
+        )
+        return [embedding.tolist() for embedding in embeddings]
+
+    def _estimate_tokens(self, texts: List[str]) -> int:
+        if tiktoken is not None and self._tokenizer is None:
+            try:
+                self._tokenizer = tiktoken.get_encoding("cl100k_base")
+            except Exception:  # encoding files unavailable offline
+                self._tokenizer = False
+        if self._tokenizer:
+            return sum(len(tokens) for tokens in self._tokenizer.encode_ordinary_batch(texts))
+        return sum(len(text) // 4 + 1 for text in texts)
+
+    def _backoff_seconds(self, attempt: int, error: Exception) -> float:
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.initial_backoff)
+        # Full jitter keeps concurrent batches from retrying in lockstep.
+        return random.uniform(0, min(self.max_backoff, self.initial_backoff * 2 ** attempt))
+
+    def _loop_semaphore(self) -> asyncio.Semaphore:
+        # Shared by every call on this instance, so max_concurrency bounds concurrent calls too;
+        # a Semaphore binds to one event loop and notebooks call asyncio.run repeatedly.
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """Embed one batch, retrying transient errors and splitting the batch when the API rejects it.
+
+        Rate-limit, timeout and server errors are retried with backoff and
+        re-raised once ``max_retries`` is used up; splitting would not help
+        them. A rejected request (usually over the per-request token limit)
+        is split in half.
+
+        :raises PartialEmbeddingError: when a split batch embedded only some of its texts
+        """
+        for attempt in range(self.max_retries + 1):
+            async with self._loop_semaphore():
+                await self.rate_limiter.acquire(self._estimate_tokens(batch))
+                try:
+                    embedding_response = await self.async_client.embeddings.create(
+                        input=batch, model=self.embeddings_model_name
+                    )
+                    return [embeddings.embedding for embeddings in embedding_response.data]
+                except openai.BadRequestError:
+                    # Usually a per-request token limit; halves may succeed where the whole cannot.
+                    if len(batch) == 1:
+                        raise
+                    break
+                except RETRYABLE_ERRORS as error:
+                    if attempt == self.max_retries:
+                        raise
+                    delay = self._backoff_seconds(attempt, error)
+                    if isinstance(error, openai.RateLimitError):
+                        self.rate_limiter.pause(delay)
+            # Sleep outside the semaphore so other batches can use the slot.
+            await asyncio.sleep(delay)
+
+        middle = len(batch) // 2
+        return await self._gather_batches([batch[:middle], batch[middle:]])
+
+    async def _gather_batches(self, batches: List[List[str]]) -> List[List[float]]:
+        """Embed consecutive ``batches`` concurrently; a failed batch does not cancel the others."""
+        results = await asyncio.gather(*[self._embed_batch(batch) for batch in batches], return_exceptions=True)
+
+        embeddings: List[List[float]] = []
+        partial: Dict[int, List[float]] = {}
+        first_error = None
+        offset = 0
+        for batch, result in zip(batches, results):
+            if isinstance(result, BaseException):
+                first_error = first_error or result
+                # A split batch may still have embedded some of its texts.
+                if isinstance(result, PartialEmbeddingError):
+                    partial.update({offset + i: embedding for i, embedding in result.partial.items()})
+            else:
+                embeddings.extend(result)
+                partial.update({offset + i: embedding for i, embedding in enumerate(result)})
+            offset += len(batch)
+
+        if first_error is not None:
+            cause = first_error.__cause__ if isinstance(first_error, PartialEmbeddingError) else first_error
+            raise PartialEmbeddingError(
+                f"Embedded {len(partial)} of {offset} texts; first error: {cause}", partial
+            ) from cause
+        return embeddings
+
+    async def _async_embed(self, list_of_text: List[str]) -> List[List[float]]:
         batches = [list_of_text[i:i + self.batch_size] for i in range(0, len(list_of_text), self.batch_size)]
-        
-        async def process_batch(batch):
-            embedding_response = await self.async_client.embeddings.create(
-                input=batch, model=self.embeddings_model_name
-            )
-            return [embeddings.embedding for embeddings in embedding_response.data]
-        
-        # Use asyncio.gather to process all batches concurrently
-        results = await asyncio.gather(*[process_batch(batch) for batch in batches])
-        
-        # Flatten the results
-        return [embedding for batch_result in results for embedding in batch_result]
+        # Batches run concurrently up to max_concurrency.
+        return await self._gather_batches(batches)
 
     async def async_get_embedding(self, text: str) -> List[float]:
-        embedding = await self.async_client.embeddings.create(
-            input=text, model=self.embeddings_model_name
-        )
-
-        return embedding.data[0].embedding
+        if self.cache is not None:
+            return (await self.async_get_embeddings([text]))[0]
+        # Same retry, backoff and rate limiting as batch calls.
+        return (await self._async_embed([text]))[0]
 
     def get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            return self._embed(list_of_text)
+        embeddings = self.cache.get_or_compute(self.embeddings_model_name, list_of_text, self._embed)
+        return [embedding.tolist() for embedding in embeddings]
+
+    def _embed(self, list_of_text: List[str]) -> List[List[float]]:
         embedding_response = self.client.embeddings.create(
             input=list_of_text, model=self.embeddings_model_name
         )
@@ -50,6 +216,8 @@ class EmbeddingModel:
         return [embeddings.embedding for embeddings in embedding_response.data]
 
     def get_embedding(self, text: str) -> List[float]:
+        if self.cache is not None:
+            return self.get_embeddings([text])[0]
         embedding = self.client.embeddings.create(
             input=text, model=self.embeddings_model_name
         )
@@ -0,0 +1,206 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class PartialEmbeddingError(Exception):
+    """Raised when some inputs could not be embedded.
+
+    ``partial`` maps input positions to the embeddings that did succeed, so
+    callers (and ``EmbeddingCache``) can keep that progress and retry only
+    the rest.
+    """
+
+    def __init__(self, message: str, partial: Dict[int, Sequence[float]]):
+        super().__init__(message)
+        self.partial = partial
+
+
+class EmbeddingCache:
+    """Content-addressed cache for embedding vectors.
+
+    Entries are keyed by ``sha256(model name + text)`` so identical chunks and
+    repeated queries are embedded once per model. A byte-bounded in-memory LRU
+    sits in front of an optional SQLite file that persists across runs.
+    Vectors are stored as float32.
+    """
+
+    # Approximate per-entry overhead of the key string and OrderedDict slot.
+    ENTRY_OVERHEAD_BYTES = 200
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, disk_path: Optional[str] = None):
+        """
+        :param max_bytes: Upper bound on memory used by cached vectors
+        :param disk_path: Optional SQLite file used as a second, persistent tier
+        """
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and current memory footprint."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        """Insert into the LRU and evict least-recently-used entries over budget. Caller holds the lock."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        size = vector.nbytes + self.ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        self._entries[key] = vector
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes + self.ENTRY_OVERHEAD_BYTES
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Look up ``keys``, promoting disk hits into memory."""
+        found: List[Optional[np.ndarray]] = [None] * len(keys)
+        missing_positions = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    found[i] = vector
+                else:
+                    missing_positions.append(i)
+
+            if self._db is not None and missing_positions:
+                wanted = list({keys[i] for i in missing_positions})
+                from_disk = {}
+                # Stay under SQLite's default bound-parameter limit.
+                for start in range(0, len(wanted), 500):
+                    batch = wanted[start : start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                    ).fetchall()
+                    from_disk.update({key: np.frombuffer(blob, dtype=np.float32) for key, blob in rows})
+                still_missing = []
+                for i in missing_positions:
+                    vector = from_disk.get(keys[i])
+                    if vector is None:
+                        still_missing.append(i)
+                        continue
+                    self.disk_hits += 1
+                    found[i] = vector
+                    self._remember(keys[i], vector)
+                missing_positions = still_missing
+
+            self.misses += len(missing_positions)
+        return found
+
+    def put_many(self, keys: Sequence[str], vectors: Sequence[np.ndarray]) -> None:
+        arrays = [np.ascontiguousarray(vector, dtype=np.float32) for vector in vectors]
+        with self._lock:
+            for key, vector in zip(keys, arrays):
+                self._remember(key, vector)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in zip(keys, arrays)],
+                )
+                self._db.commit()
+
+    def _plan(self, model_name: str, texts: Sequence[str]):
+        keys = [self.make_key(model_name, text) for text in texts]
+        found = self.get_many(keys)
+        # Each distinct missing text is computed once even if repeated in the batch.
+        to_compute: Dict[str, str] = {}
+        for key, text, vector in zip(keys, texts, found):
+            if vector is None:
+                to_compute.setdefault(key, text)
+        return keys, found, to_compute
+
+    def _merge(self, keys, found, to_compute: Dict[str, str], computed) -> List[np.ndarray]:
+        computed_by_key = {}
+        if to_compute:
+            computed_by_key = dict(zip(to_compute.keys(), computed))
+            self.put_many(list(computed_by_key.keys()), list(computed_by_key.values()))
+        return [
+            vector if vector is not None else np.asarray(computed_by_key[key], dtype=np.float32)
+            for key, vector in zip(keys, found)
+        ]
+
+    def _keep_partial(self, to_compute: Dict[str, str], error: PartialEmbeddingError) -> None:
+        """Cache whatever a failed compute call did embed before re-raising."""
+        pending_keys = list(to_compute.keys())
+        done = [(pending_keys[position], vector) for position, vector in error.partial.items()]
+        if done:
+            self.put_many([key for key, _ in done], [vector for _, vector in done])
+
+    def get_or_compute(
+        self,
+        model_name: str,
+        texts: Sequence[str],
+        compute: Callable[[List[str]], Sequence],
+    ) -> List[np.ndarray]:
+        """Return embeddings for ``texts``, calling ``compute`` only for cache misses."""
+        keys, found, to_compute = self._plan(model_name, texts)
+        try:
+            computed = compute(list(to_compute.values())) if to_compute else []
+        except PartialEmbeddingError as error:
+            self._keep_partial(to_compute, error)
+            raise
+        return self._merge(keys, found, to_compute, computed)
+
+    async def aget_or_compute(
+        self,
+        model_name: str,
+        texts: Sequence[str],
+        compute: Callable[[List[str]], Awaitable[Sequence]],
+    ) -> List[np.ndarray]:
+        """Async variant of ``get_or_compute``."""
+        keys, found, to_compute = self._plan(model_name, texts)
+        try:
+            computed = await compute(list(to_compute.values())) if to_compute else []
+        except PartialEmbeddingError as error:
+            self._keep_partial(to_compute, error)
+            raise
+        return self._merge(keys, found, to_compute, computed)
+
+    def clear(self) -> None:
+        """Drop the in-memory tier; the disk tier is kept."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,80 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """Async token-bucket limiter for requests-per-minute and tokens-per-minute budgets.
+
+    Each budget refills continuously at its per-minute rate and may burst up
+    to one minute's allowance. ``pause`` blocks every caller until a point in
+    time, which is how a server's ``Retry-After`` is applied to all in-flight
+    work rather than only the request that received it.
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        """
+        :param requests_per_minute: Request budget, or None for unlimited
+        :param tokens_per_minute: Input-token budget, or None for unlimited
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_allowance = float(requests_per_minute or 0)
+        self._token_allowance = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop = None
+
+    def _loop_lock(self) -> asyncio.Lock:
+        # asyncio.Lock binds to one event loop; notebooks call asyncio.run repeatedly.
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_minute:
+            self._request_allowance = min(
+                float(self.requests_per_minute), self._request_allowance + elapsed * self.requests_per_minute / 60.0
+            )
+        if self.tokens_per_minute:
+            self._token_allowance = min(
+                float(self.tokens_per_minute), self._token_allowance + elapsed * self.tokens_per_minute / 60.0
+            )
+
+    def _seconds_until_available(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests_per_minute and self._request_allowance < 1:
+            wait = max(wait, (1 - self._request_allowance) * 60.0 / self.requests_per_minute)
+        if self.tokens_per_minute and self._token_allowance < tokens:
+            wait = max(wait, (tokens - self._token_allowance) * 60.0 / self.tokens_per_minute)
+        return wait
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until one request carrying ``tokens`` input tokens fits in both budgets."""
+        if self.tokens_per_minute:
+            # A single oversized request can never fit, so let it consume the whole bucket.
+            tokens = min(tokens, self.tokens_per_minute)
+        async with self._loop_lock():
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                wait = self._seconds_until_available(tokens)
+                if wait <= 0:
+                    if self.requests_per_minute:
+                        self._request_allowance -= 1
+                    if self.tokens_per_minute:
+                        self._token_allowance -= tokens
+                    return
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hold all callers for ``seconds`` from now, e.g. after a 429 with ``Retry-After``."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("dotenv")
+
+from aimakerspace.openai_utils.embedding import EmbeddingModel
+from aimakerspace.openai_utils.embedding_cache import EmbeddingCache, PartialEmbeddingError
+
+
+class StubEmbeddingServer:
+    """Local OpenAI embeddings endpoint; ``respond(inputs, request_number)`` returns (status, headers) or None for success.
+
+    A successful response embeds each text as [len(text), position in the request].
+    """
+
+    def __init__(self, respond):
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                inputs = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["input"]
+                server.requests.append(inputs)
+                failure = respond(inputs, len(server.requests))
+                if failure is None:
+                    status, headers = 200, {}
+                    data = [{"object": "embedding", "index": i, "embedding": [float(len(text)), float(i)]}
+                            for i, text in enumerate(inputs)]
+                    body = {"object": "list", "data": data, "model": "stub", "usage": {"prompt_tokens": 1, "total_tokens": 1}}
+                else:
+                    status, headers = failure
+                    body = {"error": {"message": f"stub error {status}"}}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in {"Content-Type": "application/json", **headers}.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+
+
+def make_model(server, **options):
+    options = {"max_retries": 2, "initial_backoff": 0.01, **options}
+    return EmbeddingModel(base_url=server.base_url, **options)
+
+
+def test_waits_for_retry_after_before_retrying():
+    def respond(inputs, request_number):
+        return (429, {"retry-after-ms": "200"}) if request_number == 1 else None
+
+    with StubEmbeddingServer(respond) as server:
+        start = time.perf_counter()
+        embeddings = asyncio.run(make_model(server).async_get_embeddings(["ab", "cde"]))
+        elapsed = time.perf_counter() - start
+    assert [embedding[0] for embedding in embeddings] == [2.0, 3.0]
+    assert len(server.requests) == 2
+    assert elapsed >= 0.2
+
+
+def test_rejected_batch_is_split_until_requests_fit():
+    def respond(inputs, request_number):
+        return (400, {}) if len(inputs) > 2 else None
+
+    texts = [f"t{'x' * i}" for i in range(7)]
+    with StubEmbeddingServer(respond) as server:
+        embeddings = asyncio.run(make_model(server, batch_size=8).async_get_embeddings(texts))
+    assert [embedding[0] for embedding in embeddings] == [float(len(text)) for text in texts]
+    assert max(len(inputs) for inputs in server.requests if len(inputs) <= 2) == 2
+
+
+def test_server_errors_are_not_split_once_retries_run_out():
+    with StubEmbeddingServer(lambda inputs, request_number: (500, {})) as server:
+        with pytest.raises(PartialEmbeddingError) as error:
+            asyncio.run(make_model(server, batch_size=8).async_get_embeddings([f"t{i}" for i in range(8)]))
+    assert error.value.partial == {}
+    assert [len(inputs) for inputs in server.requests] == [8, 8, 8]  # max_retries + 1, never halved
+
+
+def test_partial_progress_is_kept_when_one_batch_fails():
+    def respond(inputs, request_number):
+        return (500, {}) if "poison" in inputs else None
+
+    texts = ["a", "bb", "poison", "ccc", "dddd"]
+    cache = EmbeddingCache()
+    with StubEmbeddingServer(respond) as server:
+        model = make_model(server, batch_size=2, cache=cache)
+        with pytest.raises(PartialEmbeddingError) as error:
+            asyncio.run(model.async_get_embeddings(texts))
+    assert sorted(error.value.partial) == [0, 1, 4]
+    assert cache.stats()["entries"] == 3
@@ -3,6 +3,9 @@ import os
 import getpass
 import json
 import operator
+import re
+import zlib
+from collections import Counter
 from typing import Annotated, List, Literal, Sequence, TypedDict
 from uuid import uuid4
 
@@ -14,13 +17,14 @@ from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, System
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.tools import tool
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_qdrant import QdrantVectorStore
+from langchain_qdrant import QdrantVectorStore, RetrievalMode, SparseEmbeddings, SparseVector
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langgraph.graph import END, START, StateGraph
 from langgraph.graph.message import add_messages
 from pydantic import BaseModel
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
+from qdrant_client.http.models import Distance, Modifier, SparseVectorParams, VectorParams
+from transformers import AutoTokenizer
 
 # Zscaler SSL setup for corporate network
 zscaler_cert = "/Users/ari.packer/repos/sidekick/zscaler.pem"
@@ -69,38 +73,128 @@ loader = PyMuPDFLoader("data/Stone Ridge 2025 Investor Letter.pdf")
 documents = loader.load()
 
 # Preprocess documents to remove Risk Disclosures section
-# Risk disclosures were causing irrelevant context retrievals
+# Risk disclosures were causing irrelevant context retrievals. The loader yields one
+# document per page and the section runs to the end of the letter, so every page
+# after the heading is dropped too, not just the text after it on its own page
+BOILERPLATE_HEADING = re.compile(r"Risk Disclosures")
+bytes_removed = 0
+in_boilerplate = False
 for doc in documents:
-    if 'Risk Disclosures' in doc.page_content:
-        doc.page_content = doc.page_content.split('Risk Disclosures')[0]
-
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=500,
-    chunk_overlap=100
+    original = doc.page_content
+    if in_boilerplate:
+        doc.page_content = ""
+    elif match := BOILERPLATE_HEADING.search(original):
+        doc.page_content = original[:match.start()]
+        in_boilerplate = True
+    bytes_removed += len(original.encode("utf-8")) - len(doc.page_content.encode("utf-8"))
+documents = [doc for doc in documents if doc.page_content.strip()]
+print(f"Removed {bytes_removed:,} bytes of boilerplate")
+
+# Measure chunks in tokens of the embedding model, so none is truncated when embedded
+# and sizes stay consistent regardless of how dense the text is
+text_splitter = RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+    AutoTokenizer.from_pretrained("sentence-transformers/all-MiniLM-L6-v2"),
+    chunk_size=120,
+    chunk_overlap=24
 )
 chunks = text_splitter.split_documents(documents)
 
 print(f"Loaded and split into {len(chunks)} chunks")
 
+# Dense retrieval alone misses exact terms such as fund names, tickers and "CAGR", so the
+# collection also holds a BM25 sparse vector per chunk and searches fuse both rankings
+BM25_TOKEN = re.compile(r"[a-z0-9]+(?:[&.][a-z0-9]+)*")
+
+
+class BM25SparseEmbeddings(SparseEmbeddings):
+    """BM25 term weights as Qdrant sparse vectors.
+
+    Documents carry the saturated, length-normalised term frequency and queries
+    a weight of 1 per term; Qdrant multiplies in the IDF (``Modifier.IDF``) and
+    scores from its sparse inverted index, so no Python loop runs over documents.
+    """
+
+    def __init__(self, texts: List[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.avg_length = max(sum(len(self._tokenize(text)) for text in texts) / max(len(texts), 1), 1.0)
+
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
+        return BM25_TOKEN.findall(text.lower())
+
+    @staticmethod
+    def _term_id(term: str) -> int:
+        return zlib.crc32(term.encode("utf-8")) & 0x7FFFFFFF
+
+    def embed_documents(self, texts: List[str]) -> List[SparseVector]:
+        vectors = []
+        for text in texts:
+            tokens = self._tokenize(text)
+            norm = self.k1 * (1 - self.b + self.b * len(tokens) / self.avg_length)
+            weights = {}
+            for term, frequency in Counter(tokens).items():
+                term_id = self._term_id(term)
+                weights[term_id] = weights.get(term_id, 0.0) + frequency * (self.k1 + 1) / (frequency + norm)
+            vectors.append(SparseVector(indices=list(weights), values=list(weights.values())))
+        return vectors
+
+    def embed_query(self, text: str) -> SparseVector:
+        term_ids = sorted({self._term_id(term) for term in self._tokenize(text)})
+        return SparseVector(indices=term_ids, values=[1.0] * len(term_ids))
+
+
+# Trimmed from 02_Dense_Vector_Retrieval/aimakerspace/ai_utils/embedding.py (export_onnx_int8).
+def onnx_int8_model_kwargs(model_name: str, quantization: str = "avx2") -> tuple:
+    """Export model_name once to a dynamically quantized ONNX file and return (model dir, SentenceTransformer kwargs).
+
+    The export is cached under ~/.cache/aimakerspace/onnx; the quantized file is written
+    last, so an interrupted export is redone on the next run. Needs sentence-transformers[onnx].
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    model_dir = os.path.expanduser(f"~/.cache/aimakerspace/onnx/{model_name.replace('/', '__')}-qint8-{quantization}")
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    if not os.path.exists(os.path.join(model_dir, file_name)):
+        model = SentenceTransformer(model_name, backend="onnx", device="cpu")
+        model.save_pretrained(model_dir)
+        export_dynamic_quantized_onnx_model(model, quantization, model_dir)
+    return model_dir, {"backend": "onnx", "device": "cpu", "model_kwargs": {"file_name": file_name}}
+
+
 # Set up vector store for investment knowledge base
-embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+# EMBEDDING_BACKEND=onnx-int8 embeds with an int8 ONNX export on onnxruntime instead of float32 PyTorch;
+# EMBEDDING_QUANTIZATION picks the instruction set (avx2 by default; arm64 on Apple Silicon, avx512, avx512_vnni).
+if os.environ.get("EMBEDDING_BACKEND", "torch") == "onnx-int8":
+    onnx_model_dir, onnx_model_kwargs = onnx_int8_model_kwargs(
+        "all-MiniLM-L6-v2", os.environ.get("EMBEDDING_QUANTIZATION", "avx2")
+    )
+    embedding_model = HuggingFaceEmbeddings(model_name=onnx_model_dir, model_kwargs=onnx_model_kwargs)
+else:
+    embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
 embedding_dim = len(embedding_model.embed_query("test"))
+sparse_embedding = BM25SparseEmbeddings([chunk.page_content for chunk in chunks])
 
 qdrant_client = QdrantClient(":memory:")
 qdrant_client.create_collection(
     collection_name="investment_multiagent",
-    vectors_config=VectorParams(size=embedding_dim, distance=Distance.COSINE)
+    vectors_config=VectorParams(size=embedding_dim, distance=Distance.COSINE),
+    sparse_vectors_config={"langchain-sparse": SparseVectorParams(modifier=Modifier.IDF)}
 )
 
+# Hybrid mode fuses the dense and sparse rankings with reciprocal rank fusion
 vector_store = QdrantVectorStore(
     client=qdrant_client,
     collection_name="investment_multiagent",
-    embedding=embedding_model
+    embedding=embedding_model,
+    sparse_embedding=sparse_embedding,
+    sparse_vector_name="langchain-sparse",
+    retrieval_mode=RetrievalMode.HYBRID
 )
 vector_store.add_documents(chunks)
 
 retriever = vector_store.as_retriever(search_kwargs={"k": 3})
-print(f"Vector store ready with {len(chunks)} investment documents")
+print(f"Vector store ready with {len(chunks)} investment documents (hybrid dense + BM25)")
 
 # Create specialized tools for each investment agent domain
 